@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+"""
+Summary statistics of the replications computed for a set of parameters
+
+Aggregates are computed once per set of parameters, walking its
+replications a single time, and are used by all plotting and csv
+functions instead of the replications themselves. They contain:
+
+* series: Mean and confidence band per time step of each variable
+  collected by evolution_step, with and without reflexivity, and of the
+  variables added by observers, if any (only at the ticks where they
+  were sampled, and NaN at the rest).
+* cumulative: The same as series, but for the cumulative values of
+  each variable collected by evolution_step.
+* activation_value, activation_time, max_adopters and
+  adopters_percentaje_upto_activation: See the functions with the same
+  names in utilities.py.
+* final_adopters: Mean of the total number of adopters with reflexivity
+  of each replication.
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from bands import analytic_band, bootstrap_means, percentile_band
+from storage import data_to_array
+from utilities import (RX_FIELDS, VARIABLES,
+                       compute_global_utility_activation_value)
+
+
+# Default method, confidence level (in percent) and number of bootstrap
+# resamples of the confidence bands. They can be changed for an analysis
+# with the band, confidence and n_boot settings of its run (see
+# band_settings).
+BAND = 'bootstrap'
+CONFIDENCE = 68
+N_BOOT = 1000
+
+
+def _series(mean, low, high, variables=VARIABLES):
+    """Split the mean and band of several variables by variable."""
+    summary = {}
+    for i, variable in enumerate(variables):
+        summary[variable] = dict(mean=mean[:, i], low=low[:, i],
+                                 high=high[:, i])
+    return summary
+
+
+def _summarize(values, band=BAND, confidence=CONFIDENCE, n_boot=N_BOOT,
+               seed=0, variables=VARIABLES):
+    """
+    Mean and confidence band per time step of several variables and of
+    their cumulative values.
+
+    values: Array of shape (replications, time, variables).
+    band, confidence, n_boot, seed: See compute_aggregates.
+    variables: Names of the variables of values.
+
+    Returns: Two dictionaries (for the values and their cumulative
+             values) that map each name in variables to a dictionary
+             with its mean, low and high series.
+    """
+    if band == 'bootstrap':
+        # The cumulative mean of each resample is the mean of its
+        # cumulative values, so resamples are only drawn once
+        means = bootstrap_means(values, n_boot, seed)
+        mean = np.mean(values, axis=0)
+        low, high = percentile_band(means, confidence)
+        cumulative_mean = np.cumsum(mean, axis=0)
+        cumulative_low, cumulative_high = percentile_band(
+            np.cumsum(means, axis=1), confidence)
+    elif band == 'analytic':
+        mean, low, high = analytic_band(values, confidence)
+        cumulative_mean, cumulative_low, cumulative_high = analytic_band(
+            np.cumsum(values, axis=1), confidence)
+    else:
+        raise Exception('Unknown confidence band method: {}'.format(band))
+
+    return (_series(mean, low, high, variables),
+            _series(cumulative_mean, cumulative_low, cumulative_high,
+                    variables))
+
+
+def _observed_series(values, variables, band=BAND, confidence=CONFIDENCE,
+                     n_boot=N_BOOT, seed=0):
+    """
+    Mean and confidence band per time step of the variables added by
+    observers, at the ticks where they were sampled.
+
+    values: Array of shape (replications, time, variables), which is NaN
+            at the ticks where an observer was not sampled.
+    variables: Names of the variables of values.
+    band, confidence, n_boot, seed: See compute_aggregates.
+
+    Returns: A dictionary that maps each name in variables to a
+             dictionary with its mean, low and high series (NaN at the
+             ticks where it was not sampled).
+    """
+    summary = {}
+    for j, variable in enumerate(variables):
+        # Observers are sampled at the same ticks in all replications
+        sampled = ~np.isnan(values[0, :, j])
+        series = dict((key, np.full(values.shape[1], np.nan))
+                      for key in ['mean', 'low', 'high'])
+        if np.any(sampled):
+            sampled_series, _ = _summarize(
+                values[:, sampled, j:j + 1], band, confidence, n_boot, seed,
+                variables=[variable])
+            for key in series:
+                series[key][sampled] = sampled_series[variable][key]
+        summary[variable] = series
+    return summary
+
+
+def compute_aggregates(data, parameters, band=BAND, confidence=CONFIDENCE,
+                       n_boot=N_BOOT, seed=0, variables=VARIABLES):
+    """
+    Compute the aggregates of a run.
+
+    data: Contains the output of compute_run or an array of results
+          (see storage.py).
+    parameters: Parameters used to compute data.
+    band: Method to compute confidence bands, 'bootstrap' or 'analytic'
+          (see bands.py).
+    confidence: Confidence level of the bands, in percent.
+    n_boot: Number of bootstrap resamples.
+    seed: Seed used to draw the bootstrap resamples.
+    variables: Variables of data, i.e. VARIABLES followed by the ones
+               added by observers (see storage.run_variables). Variables
+               of an array of results after them are ignored.
+
+    Returns: A dictionary of aggregates.
+    """
+    values = np.asarray(data_to_array(data, variables), dtype=np.float64)
+    if values.shape[-1] < len(variables):
+        raise Exception('Data has {} variables, not {}'.format(
+                        values.shape[-1], len(variables)))
+    n_variables = len(VARIABLES)
+
+    series = {}
+    cumulative = {}
+    for i, rx_field in enumerate(RX_FIELDS):
+        series[rx_field], cumulative[rx_field] = _summarize(
+            values[:, i, :, :n_variables], band, confidence, n_boot, seed)
+        series[rx_field].update(_observed_series(
+            values[:, i, :, n_variables:len(variables)],
+            variables[n_variables:], band, confidence, n_boot, seed))
+
+    # Activation time, i.e. the number of ticks before the mean global
+    # utility is greater than its activation value
+    activation_value = compute_global_utility_activation_value(parameters)
+    Ug_mean = series['rx']['global_utility']['mean']
+    activation_time = len(Ug_mean[Ug_mean < activation_value])
+
+    # Adopters with reflexivity
+    adopters = values[:, RX_FIELDS.index('rx'), :,
+                      VARIABLES.index('adopters')]
+    adopters_mean = series['rx']['adopters']['mean']
+    adopters_upto_activation = np.sum(adopters_mean[:activation_time])
+
+    return dict(
+        number_of_replications=len(values),
+        series=series,
+        cumulative=cumulative,
+        activation_value=activation_value,
+        activation_time=activation_time,
+        max_adopters=np.max(adopters_mean),
+        final_adopters=np.mean(np.sum(adopters, axis=1)),
+        adopters_percentaje_upto_activation=(
+            100 * adopters_upto_activation /
+            parameters['number_of_consumers'])
+    )
+
+
+def is_aggregates(data):
+    """Check if data is a dictionary of aggregates."""
+    return isinstance(data, dict) and 'series' in data
+
+
+def band_settings(run):
+    """
+    Settings of the confidence bands of an analysis.
+
+    run: Dictionary of run settings (see all_parameters.py), which can
+         have band, confidence and n_boot entries.
+
+    Returns: A dictionary with the band, confidence and n_boot arguments
+             of compute_aggregates.
+    """
+    return dict(band=run.get('band', BAND),
+                confidence=run.get('confidence', CONFIDENCE),
+                n_boot=run.get('n_boot', N_BOOT))
+
+
+def get_aggregates(data, parameters, variables=VARIABLES, band=BAND,
+                   confidence=CONFIDENCE, n_boot=N_BOOT):
+    """
+    Get the aggregates of a run, computing them only if necessary.
+
+    data: Contains the output of compute_run, an array of results or
+          the aggregates already computed for them.
+    parameters: Parameters used to compute data.
+    variables, band, confidence, n_boot: See compute_aggregates.
+    """
+    if is_aggregates(data):
+        return data
+    return compute_aggregates(data, parameters, band, confidence, n_boot,
+                              variables=variables)
+
+
+def get_series(aggregates, with_reflexivity, variable, cumulative=False):
+    """
+    Get the mean and confidence band of a variable.
+
+    aggregates: Dictionary of aggregates.
+    with_reflexivity: True or False, depending if we want to get
+                      the values with or without reflexivity.
+    variable: Name of the variable (see VARIABLES).
+    cumulative: Whether to get the cumulative values of the variable.
+
+    Returns: A dictionary with the mean, low and high series.
+    """
+    if with_reflexivity:
+        rx_field = 'rx'
+    else:
+        rx_field = 'no_rx'
+
+    if cumulative:
+        return aggregates['cumulative'][rx_field][variable]
+    else:
+        return aggregates['series'][rx_field][variable]
@@ -6,14 +6,25 @@ Algorithm
 
 from __future__ import division
 
+# Standard library imports
+import collections
+import copy
+import json
+import random
+import time
+
 # Third-party imports
 import networkx as nx
 import numpy as np
 import pandas as pd
 
 # Local imports
+from instrumentation import add_time, count
+from observers import observe
+from recording import (LOCAL, LOCAL_OR_GLOBAL, MARKETING,
+                       record_adoption)
 from utilities import (compute_global_utility, get_neighbors, is_adopter,
-                       logistic, set_seed, step)
+                       logistic, set_random_state, set_seed, step)
 
 
 def generate_initial_conditions(parameters):
@@ -81,7 +92,8 @@ def generate_initial_conditions(parameters):
     return G
 
 
-def evolution_step(graph, parameters, test=False):
+def evolution_step(graph, parameters, test=False, recording=None,
+                   counters=None):
     """
     Function that computes the evolution step of the diffusion process
     that occurs in a small-world graph with a given set of parameters
@@ -90,6 +102,10 @@ def evolution_step(graph, parameters, test=False):
     the evolution.
     test: Test with a step function instead of the logistic one for
     the emergence_factor.
+    recording: Recording to save the time and channel of each adoption
+    to (see recording.py).
+    counters: Counters to add the time and operations of each phase
+    of the step to (see instrumentation.py).
 
     Returns: A dictionary with data collected at each step (e.g.
              total number of adopters, adopters by utility and
@@ -108,7 +124,11 @@ def evolution_step(graph, parameters, test=False):
     # Thus they are the same for all agents during this time step
     if parameters['reflexivity']:
         # Compute utility due to global influence
-        global_utility = compute_global_utility(graph)
+        if counters is not None:
+            start = time.time()
+        global_utility = compute_global_utility(graph, counters)
+        if counters is not None:
+            add_time(counters, 'global_utility', start)
 
         # Decide which activation function to use.
         if not test:
@@ -122,6 +142,8 @@ def evolution_step(graph, parameters, test=False):
                                       parameters['critical_mass'])
     
     # Determine which agents adopt
+    if counters is not None:
+        start_agents = time.time()
     for node_index in graph.nodes():
         node = graph.node[node_index]
 
@@ -132,11 +154,19 @@ def evolution_step(graph, parameters, test=False):
 
         # -- Compute utility due to local influence
         # Adopters
+        if counters is not None:
+            start = time.time()
         if node['neighbors']:
             neighbors = node['neighbors']
         else:
             neighbors = get_neighbors(graph, node_index, level=parameters['level'])
+            if counters is not None:
+                count(counters, 'neighbors_searches')
         adopters_among_neighbors = [x for x in neighbors if is_adopter(graph, x)]
+        if counters is not None:
+            add_time(counters, 'neighbors', start)
+            count(counters, 'nodes_visited')
+            count(counters, 'neighbors_scanned', len(neighbors))
 
         # Only if a consumer has adopters among his neighbors, he computes
         # his local utility
@@ -199,20 +229,41 @@ def evolution_step(graph, parameters, test=False):
             adopters_by_utility += 1
             if use_global_utility:
                 adopters_by_local_or_global_utility += 1
+                if recording is not None:
+                    record_adoption(recording, node_index, LOCAL_OR_GLOBAL)
             else:
                 adopters_by_local_utility += 1
+                if recording is not None:
+                    record_adoption(recording, node_index, LOCAL)
         # or marketing influences the agent
         elif parameters['marketing_effort'] and \
           len(adopters_among_neighbors) > 0:
+            if counters is not None:
+                start = time.time()
             prob_adoption = np.random.random()
             if prob_adoption < parameters['marketing_effort']:
                 adopters_at_step.append(node_index)
                 adopters_by_marketing += 1
+                if recording is not None:
+                    record_adoption(recording, node_index, MARKETING)
+            if counters is not None:
+                add_time(counters, 'marketing', start)
+                count(counters, 'marketing_draws')
+
+    if counters is not None:
+        add_time(counters, 'agents', start_agents)
+        start = time.time()
 
     # Update the graph with customers who adopted in this time step
     for node_index in adopters_at_step:
         node = graph.node[node_index]
         node['adopter'] = 1
+
+    if counters is not None:
+        add_time(counters, 'update', start)
+
+    if recording is not None:
+        recording['time'] += 1
     
     # Return collected data from the step
     data = {'adopters': len(adopters_at_step),
@@ -225,13 +276,21 @@ def evolution_step(graph, parameters, test=False):
     return data
 
 
-def evolution(graph, parameters, max_time, test=False):
+def evolution(graph, parameters, max_time, test=False, recording=None,
+              observers=None, counters=None):
     """
     Compute the evolution of the algorithm up to max_time.
 
     graph: networkx graph in which takes place the evolution.
     parameters: Dictionary of parameters for the algorithm.
     max_time: Time to stop the algorithm.
+    recording: Recording to save the time and channel of each adoption
+               to, created with recording.new_recording. Several calls
+               can be recorded one after the other.
+    observers: List of observers of additional metrics (see
+               observers.py).
+    counters: Counters to add the time and operations of each phase
+              of the evolution to (see instrumentation.py).
 
     Return: A DataFrame with all the data collected
             at each time step.
@@ -241,38 +300,172 @@ def evolution(graph, parameters, max_time, test=False):
 
     # Perform the evolution
     for t in range(max_time):
-        data_at_t = evolution_step(graph, parameters, test)
+        if counters is not None:
+            start = time.time()
+        data_at_t = evolution_step(graph, parameters, test, recording,
+                                   counters)
+        if counters is not None:
+            add_time(counters, 'evolution_step', start)
+            count(counters, 'steps')
+        if observers:
+            data_at_t.update(observe(observers, graph, parameters, t + 1,
+                                     max_time))
         data.append(data_at_t)
 
+    if counters is not None:
+        start = time.time()
     data = pd.DataFrame(data)
+    if counters is not None:
+        add_time(counters, 'dataframe', start)
     return data
 
 
-def single_run(parameters, max_time):
+# Parameters used by generate_initial_conditions
+INITIAL_CONDITIONS_PARAMETERS = ['graph_type', 'number_of_consumers',
+                                 'number_of_neighbors', 'randomness',
+                                 'use_time_delays', 'time_delays_distro',
+                                 'level']
+
+
+def cached_initial_conditions(parameters, seed, graph_cache, max_size=64):
+    """
+    Generate the initial conditions of a run with a seed, reusing them
+    if they were already generated with the same seed and parameters.
+
+    The state of the random number generators after generating them is
+    saved with them and restored when they are reused, so runs that
+    reuse them are identical to runs that generate them.
+
+    graph_cache: OrderedDict to save initial conditions to.
+    max_size: Maximum number of initial conditions to save. The least
+              recently used ones are removed first.
+    """
+    key = json.dumps([seed] + [parameters.get(p)
+                               for p in INITIAL_CONDITIONS_PARAMETERS])
+    if key in graph_cache:
+        graph, python_state, numpy_state = graph_cache.pop(key)
+        graph_cache[key] = (graph, python_state, numpy_state)
+        random.setstate(python_state)
+        np.random.set_state(numpy_state)
+        return copy.deepcopy(graph)
+
+    set_random_state(seed)
+    G = generate_initial_conditions(parameters)
+    graph_cache[key] = (copy.deepcopy(G), random.getstate(),
+                        np.random.get_state())
+    while len(graph_cache) > max_size:
+        graph_cache.popitem(last=False)
+    return G
+
+
+def new_graph_pool(pool_size=32, max_pools=8):
+    """
+    Create a pool of initial conditions (see pooled_initial_conditions).
+
+    pool_size: Number of initial conditions generated for each set of
+               parameters.
+    max_pools: Maximum number of sets of parameters to keep initial
+               conditions for. The least recently used ones are removed
+               first.
+    """
+    if pool_size < 1:
+        raise ValueError('The size of a pool of initial conditions must be '
+                         'positive, not {}'.format(pool_size))
+    return dict(pool_size=pool_size, max_pools=max_pools,
+                pools=collections.OrderedDict())
+
+
+def pooled_initial_conditions(parameters, seed, graph_pool):
+    """
+    Get the initial conditions of a run from a pool of initial conditions
+    generated for the same parameters.
+
+    Initial conditions only depend on INITIAL_CONDITIONS_PARAMETERS, so
+    they are reused by all values of a sweep of any other parameter, and
+    by all jobs with the same parameters, whatever their seed. There are
+    pool_size initial conditions for each set of parameters, generated
+    with fixed seeds, and a run with a seed uses the one at seed %
+    pool_size. The random number generators are then seeded with the
+    seed of the run.
+
+    Runs are still reproducible, but they are not the same as runs that
+    generate their own initial conditions with the same seed, and
+    replications whose seeds have the same remainder share them.
+
+    graph_pool: Pool returned by new_graph_pool.
+    """
+    key = json.dumps([parameters.get(p)
+                      for p in INITIAL_CONDITIONS_PARAMETERS])
+    pools = graph_pool['pools']
+    pool = pools.pop(key, {})
+    pools[key] = pool
+    while len(pools) > graph_pool['max_pools']:
+        pools.popitem(last=False)
+
+    slot = seed % graph_pool['pool_size']
+    if slot not in pool:
+        set_random_state(slot)
+        pool[slot] = generate_initial_conditions(parameters)
+
+    set_random_state(seed)
+    return copy.deepcopy(pool[slot])
+
+
+def single_run(parameters, max_time, seed=None, observers=None,
+               counters=None, graph_cache=None, graph_pool=None):
     """
     Compute a single run (with and without reflexivity) of the algorithm
     under the same conditions.
 
     parameters: Dictionary of parameters for the algorithm.
     max_time: Time to stop the algorithm.
+    seed: Seed for the random number generators, to be able to
+          reproduce the run.
+    observers: List of observers of additional metrics (see
+               observers.py).
+    counters: Counters to add the time and operations of each phase
+              of the run to (see instrumentation.py).
+    graph_cache: OrderedDict to reuse the initial conditions generated
+                 with the same seed (see cached_initial_conditions).
+    graph_pool: Pool of initial conditions to take them from instead of
+                generating them (see pooled_initial_conditions).
 
     Return: A Pandas panel with the data obtained by running the
             algorithm with and without reflexivity.
     """
+    if seed is not None and graph_cache is None and graph_pool is None:
+        set_random_state(seed)
+
     parameters = parameters.copy()
-    G = generate_initial_conditions(parameters)
+    if counters is not None:
+        start = time.time()
+    if seed is not None and graph_pool is not None:
+        G = pooled_initial_conditions(parameters, seed, graph_pool)
+    elif seed is not None and graph_cache is not None:
+        G = cached_initial_conditions(parameters, seed, graph_cache)
+    else:
+        G = generate_initial_conditions(parameters)
+    if counters is not None:
+        add_time(counters, 'initial_conditions', start)
+        count(counters, 'replications')
 
     # No reflexivity data
     parameters['reflexivity'] = False
     set_seed(G, parameters)
-    data_no_rx = evolution(G, parameters, max_time)
+    data_no_rx = evolution(G, parameters, max_time, observers=observers,
+                           counters=counters)
 
     # Reflexivity data
     parameters['reflexivity'] = True
     set_seed(G, parameters, reset=True)
-    data_rx = evolution(G, parameters, max_time)
+    data_rx = evolution(G, parameters, max_time, observers=observers,
+                        counters=counters)
 
+    if counters is not None:
+        start = time.time()
     panel = pd.Panel({'no_rx': data_no_rx, 'rx': data_rx})
+    if counters is not None:
+        add_time(counters, 'dataframe', start)
     return panel
 
 
@@ -288,19 +481,30 @@ def compute_run(number_of_times, parameters, max_time, dview=None):
     parameters: Dictionary of parameters for the algorithm.
     max_time: Time to stop the algorithm.
     dview: Direct view instance from an ipyparallel cluster.
+           Replications are sent to its engines with a load balanced
+           view, and parameters are sent to them only once.
 
     Returns: A list of Pandas panels, each of which is the result
              of a single run of the algorithm with and without
              reflexvity.
     """
+    from parallel import (make_tasks, release_parameters, share_parameters,
+                          stream_tasks)
 
     # Perform the run
     if dview is None:
         data = map(lambda x: single_run(parameters, max_time),
                    range(number_of_times))
     else:
-        data = dview.map_sync(lambda x: single_run(parameters, max_time),
-                              range(number_of_times))
+        shared = share_parameters(dview, [parameters])
+        try:
+            tasks = make_tasks([parameters], number_of_times, max_time,
+                               shared=shared)
+            results = sorted(stream_tasks(tasks, dview),
+                             key=lambda r: r['index'])
+        finally:
+            release_parameters(dview, shared)
+        data = [r['panel'] for r in results]
 
     return data
 
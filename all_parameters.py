@@ -6,7 +6,10 @@ Parameters for the simulation
 
 import os.path as osp
 
-from utilities import LOCATION
+
+# Directory of this file
+LOCATION = osp.dirname(osp.abspath(__file__))
+
 
 #==============================================================================
 # Directories to save results
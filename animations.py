@@ -6,9 +6,32 @@ Created on Mon Dec  5 12:31:43 2016
 @author: carlos
 """
 
+import hashlib
+import os
+import os.path as osp
+
 import networkx as nx
+import numpy as np
+
+from algorithm import evolution, evolution_step, generate_initial_conditions
+from all_parameters import RESULTS_DIR
+from recording import (LOCAL, LOCAL_OR_GLOBAL, MARKETING, SEED,
+                       get_channels_at, new_recording)
+from utilities import set_random_state, set_seed
+
+
+# Directory to save the layouts of graphs
+LAYOUTS_DIR = osp.join(RESULTS_DIR, 'Layouts')
 
-from algorithm import evolution_step
+# Colors of non-adopters and adopters
+NON_ADOPTER_COLOR = 'r'
+ADOPTER_COLOR = 'b'
+
+# Colors of adopters per channel of adoption
+CHANNEL_COLORS = {SEED: '#000000',
+                  LOCAL: "#009E73",
+                  LOCAL_OR_GLOBAL: "#D55E00",
+                  MARKETING: "#56B4E9"}
 
 
 def set_colors(graph):
@@ -44,3 +67,187 @@ def animate(i, graph, node_positions, parameters, test=False):
     else:
         evolution_step(graph, parameters)
     draw_graph(graph, node_positions)
+
+
+# =============================================================================
+# Animations of recorded runs
+# =============================================================================
+def graph_hash(graph):
+    """Hash that identifies the nodes and edges of a graph."""
+    edges = np.array(sorted(tuple(sorted(e)) for e in graph.edges()),
+                     dtype=np.int64)
+    h = hashlib.sha1()
+    h.update(str(graph.number_of_nodes()).encode('ascii'))
+    h.update(edges.tobytes())
+    return h.hexdigest()
+
+
+def get_layout(graph, layout='spring', layouts_dir=LAYOUTS_DIR):
+    """
+    Get the positions of the nodes of graph to draw it.
+
+    Positions are computed only once for each graph and layout, and
+    saved in layouts_dir.
+
+    graph: networkx graph. Its nodes must be numbered from 0 to N - 1.
+    layout: Name of a networkx layout, e.g. 'spring', 'shell' or
+            'circular'.
+    layouts_dir: Directory to save layouts to (None to not save them).
+
+    Returns: An array of shape (N, 2).
+    """
+    filename = None
+    if layouts_dir is not None:
+        filename = osp.join(layouts_dir,
+                            '{}-{}.npy'.format(graph_hash(graph), layout))
+        if osp.isfile(filename):
+            return np.load(filename)
+
+    layout_func = getattr(nx, layout + '_layout')
+    node_positions = layout_func(graph)
+    positions = np.array([node_positions[n]
+                          for n in range(graph.number_of_nodes())])
+
+    if filename is not None:
+        if not osp.isdir(layouts_dir):
+            os.makedirs(layouts_dir)
+        np.save(filename, positions)
+
+    return positions
+
+
+def get_node_colors(channels, by_channel=False):
+    """
+    RGBA colors of nodes given their channel of adoption.
+
+    channels: Array returned by recording.get_channels_at.
+    by_channel: Whether to use a different color for each channel of
+                adoption or the same one for all adopters.
+    """
+    from matplotlib.colors import to_rgba
+
+    colors = np.tile(to_rgba(NON_ADOPTER_COLOR), (len(channels), 1))
+    for channel in CHANNEL_COLORS:
+        color = CHANNEL_COLORS[channel] if by_channel else ADOPTER_COLOR
+        colors[channels == channel] = to_rgba(color)
+    return colors
+
+
+def animate_recording(graph, recording, positions, max_time=None,
+                      axis=None, by_channel=False, node_size=None,
+                      interval=200):
+    """
+    Animate the adoption of a recorded run.
+
+    Edges are drawn only once as a static background and, in each frame,
+    only the colors of the nodes that adopted in it are updated, so
+    frames can be redrawn with blitting.
+
+    graph: Graph in which the evolution took place.
+    recording: Recording of the evolution (see recording.py).
+    positions: Positions of the nodes, e.g. returned by get_layout.
+    max_time: Number of steps to animate (by default, all recorded ones).
+    axis: Matplotlib axis to draw the animation in.
+    by_channel: Whether to color adopters by their channel of adoption.
+    node_size: Size of the nodes (by default it depends on their number).
+    interval: Time between frames in milliseconds.
+
+    Returns: A Matplotlib animation.
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib.animation import FuncAnimation
+    from matplotlib.collections import LineCollection
+
+    if max_time is None:
+        max_time = recording['time']
+    if node_size is None:
+        node_size = max(1, min(50, 20000 / graph.number_of_nodes()))
+
+    if axis is None:
+        fig = plt.figure(figsize=(6, 6))
+        axis = fig.add_subplot(111)
+    fig = axis.figure
+    axis.set_axis_off()
+    axis.set_aspect(1)
+
+    # Static edges
+    edges = np.array(list(graph.edges()), dtype=np.int64).reshape(-1, 2)
+    lines = LineCollection(positions[edges], colors='k', linewidths=0.3,
+                           alpha=0.5)
+    axis.add_collection(lines)
+
+    # Nodes
+    colors = get_node_colors(get_channels_at(recording, 0), by_channel)
+    nodes = axis.scatter(positions[:, 0], positions[:, 1], s=node_size,
+                         c=colors, animated=True, zorder=2)
+    axis.autoscale_view()
+
+    # Nodes that adopt at each tick
+    ticks = recording['tick']
+    order = np.argsort(ticks, kind='mergesort')
+    bounds = np.searchsorted(ticks[order], np.arange(max_time + 2))
+    adopter_colors = get_node_colors(recording['channel'], by_channel)
+
+    def init():
+        colors[:] = get_node_colors(get_channels_at(recording, 0),
+                                    by_channel)
+        nodes.set_facecolors(colors)
+        return nodes,
+
+    def update(t):
+        changed = order[bounds[t]:bounds[t + 1]]
+        if t == 0:
+            init()
+        elif len(changed) > 0:
+            colors[changed] = adopter_colors[changed]
+            nodes.set_facecolors(colors)
+        return nodes,
+
+    return FuncAnimation(fig, update, frames=range(max_time + 1),
+                         init_func=init, interval=interval, blit=True)
+
+
+def save_animation(animation, filename, fps=5, dpi=100):
+    """
+    Save an animation to a video (e.g. mp4) or gif file.
+
+    Videos need ffmpeg and gif files are saved with Pillow. This works
+    without a display if the Agg backend is used.
+    """
+    if filename.endswith('.gif'):
+        writer = 'pillow'
+    else:
+        writer = 'ffmpeg'
+    animation.save(filename, writer=writer, fps=fps, dpi=dpi)
+
+
+def animate_run(parameters, max_time, filename, seed=None, layout='spring',
+                by_channel=False, fps=5, dpi=100):
+    """
+    Run the algorithm with reflexivity, recording it, and save an
+    animation of its evolution.
+
+    parameters: Dictionary of parameters for the algorithm.
+    max_time: Time to stop the algorithm.
+    filename: File to save the animation to.
+    seed: Seed for the random number generators.
+    layout: Name of a networkx layout (see get_layout).
+    by_channel: Whether to color adopters by their channel of adoption.
+    fps: Frames per second.
+    dpi: Resolution of the animation.
+    """
+    if seed is not None:
+        set_random_state(seed)
+
+    parameters = parameters.copy()
+    parameters['reflexivity'] = True
+    graph = generate_initial_conditions(parameters)
+    set_seed(graph, parameters)
+
+    recording = new_recording(graph)
+    evolution(graph, parameters, max_time, recording=recording)
+
+    positions = get_layout(graph, layout)
+    animation = animate_recording(graph, recording, positions,
+                                  by_channel=by_channel)
+    save_animation(animation, filename, fps=fps, dpi=dpi)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+"""
+Confidence bands of the mean of several replications per time step
+
+Bands are computed for all time steps (and variables) at once. Bootstrap
+bands use a fixed seed, so plotting the same results always gives the
+same figure.
+"""
+
+from __future__ import division
+
+import math
+
+import numpy as np
+
+
+# Coefficients of the rational approximations to the inverse of the
+# normal distribution by Peter J. Acklam
+_A = [-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+      1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00]
+_B = [-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+      6.680131188771972e+01, -1.328068155288572e+01]
+_C = [-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+      -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00]
+_D = [7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00,
+      3.754408661907416e+00]
+
+
+def normal_quantile(p):
+    """
+    Quantile function of the standard normal distribution.
+
+    It has a relative error smaller than 1.2e-9 for 0 < p < 1.
+    """
+    if p < 0.02425:
+        q = math.sqrt(-2 * math.log(p))
+        return ((((((_C[0]*q + _C[1])*q + _C[2])*q + _C[3])*q + _C[4])*q +
+                 _C[5]) /
+                ((((_D[0]*q + _D[1])*q + _D[2])*q + _D[3])*q + 1))
+    elif p > 1 - 0.02425:
+        return -normal_quantile(1 - p)
+    else:
+        q = p - 0.5
+        r = q * q
+        return ((((((_A[0]*r + _A[1])*r + _A[2])*r + _A[3])*r + _A[4])*r +
+                 _A[5]) * q /
+                (((((_B[0]*r + _B[1])*r + _B[2])*r + _B[3])*r + _B[4])*r + 1))
+
+
+def analytic_band(values, confidence=68):
+    """
+    Normal confidence band of the mean of several replications.
+
+    values: Array of shape (replications, ...).
+    confidence: Confidence level of the band, in percent.
+
+    Returns: The mean and the low and high limits of the band, each
+             with the shape of a single replication.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    mean = np.mean(values, axis=0)
+    if len(values) < 2:
+        return mean, mean.copy(), mean.copy()
+
+    z = normal_quantile(0.5 + confidence / 200)
+    error = z * np.std(values, axis=0, ddof=1) / np.sqrt(len(values))
+    return mean, mean - error, mean + error
+
+
+def bootstrap_means(values, n_boot=1000, seed=0):
+    """
+    Means of bootstrap resamples of several replications.
+
+    Resamples are represented by the number of times each replication
+    is drawn, so all their means are computed with a single matrix
+    product instead of copying the resampled replications.
+
+    values: Array of shape (replications, ...).
+    n_boot: Number of resamples.
+    seed: Seed used to draw the resamples.
+
+    Returns: An array of shape (n_boot, ...).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    random_state = np.random.RandomState(seed)
+    counts = random_state.multinomial(n, np.ones(n) / n, size=n_boot)
+    means = np.dot(counts, values.reshape(n, -1)) / n
+    return means.reshape((n_boot,) + values.shape[1:])
+
+
+def percentile_band(means, confidence=68):
+    """
+    Band that contains a percentage of several bootstrap means.
+
+    means: Array of shape (n_boot, ...), e.g. returned by
+           bootstrap_means.
+    confidence: Confidence level of the band, in percent.
+
+    Returns: The low and high limits of the band.
+    """
+    low = np.percentile(means, 50 - confidence / 2, axis=0)
+    high = np.percentile(means, 50 + confidence / 2, axis=0)
+    return low, high
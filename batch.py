@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+
+"""
+Re-run several saved analyses as a single batch
+
+All (file x value x replication) tasks of a group of parameter files are
+run through the same cluster, and configurations that appear in several
+files are only computed once. The usual outputs of each file are saved in
+RERUNS_DIR.
+
+Usage: python batch.py "Saved/*.json"
+"""
+
+import glob
+import json
+import os
+import os.path as osp
+import sys
+
+from algorithm import generate_parameters
+from all_parameters import RERUNS_DIR, SAVED_RESULTS_DIR, output
+from catalog import register_results
+from outputs import rerun_filename, save_outputs
+import numpy as np
+
+from parallel import (release_parameters, replication_seeds, reset_engines,
+                      share_parameters, start_cluster, start_local_pool,
+                      stop_local_workers, stream_pool_tasks, stream_tasks)
+from storage import save_results
+from utilities import load_parameters_from_file
+
+
+def expand_parameters_file(parameters_file, observers=None):
+    """
+    Get the run settings and set of parameters of a parameters file.
+
+    observers: Observers of additional metrics to add to the run (see
+               observers.parse_observers).
+
+    Returns: The run dictionary and a list with a dictionary of
+             parameters for each value of the main parameter.
+    """
+    all_parameters = load_parameters_from_file(parameters_file)
+    run = all_parameters['run']
+    parameters = all_parameters['parameters']
+    if observers:
+        run['observers'] = dict(run.get('observers') or {}, **observers)
+
+    # Remove the parameter we want to study
+    parameters.pop(run['main_parameter'])
+
+    set_of_parameters = generate_parameters(parameters,
+                                            run['main_parameter'],
+                                            run['parameter_values'])
+    return run, set_of_parameters
+
+
+def effective_parameters(parameters):
+    """
+    Get the parameters a run of the algorithm actually depends on.
+
+    Parameters that are ignored by the algorithm with the given ones
+    (e.g. time_delays_distro when use_time_delays is False) are removed,
+    and the ones with a default value (see generate_initial_conditions)
+    are always included.
+    """
+    parameters = parameters.copy()
+    parameters.setdefault('graph_type', 'small_world')
+    parameters['use_time_delays'] = bool(parameters.get('use_time_delays',
+                                                        False))
+    if not parameters['use_time_delays']:
+        parameters.pop('time_delays_distro', None)
+    if parameters['graph_type'] == 'preferential_attachment':
+        parameters.pop('randomness', None)
+    return parameters
+
+
+def configuration_key(parameters, max_time, observers=None):
+    """
+    Key that identifies identical configurations of the algorithm, i.e.
+    the ones with the same effective parameters.
+    """
+    return json.dumps([effective_parameters(parameters), max_time,
+                       observers or {}], sort_keys=True)
+
+
+def plan_batch(parameters_files, observers=None):
+    """
+    Merge the configurations needed by several parameters files.
+
+    parameters_files: List of parameters files.
+    observers: Observers of additional metrics to add to all files.
+
+    Returns: A dictionary with the run and set of parameters of each file
+             and a dictionary that maps each unique configuration key to
+             its parameters, max_time, observers and the largest number
+             of replications any file needs for it.
+    """
+    files = {}
+    configurations = {}
+    for parameters_file in parameters_files:
+        run, set_of_parameters = expand_parameters_file(parameters_file,
+                                                        observers)
+        files[parameters_file] = (run, set_of_parameters)
+
+        for p in set_of_parameters:
+            key = configuration_key(p, run['max_time'], run.get('observers'))
+            if key in configurations:
+                configurations[key]['number_of_times'] = max(
+                    configurations[key]['number_of_times'],
+                    run['number_of_times'])
+            else:
+                configurations[key] = dict(
+                    parameters=p, max_time=run['max_time'],
+                    observers=run.get('observers'),
+                    number_of_times=run['number_of_times'])
+
+    return files, configurations
+
+
+def make_batch_tasks(configurations, keys, seeds, shared):
+    """
+    Generate the tasks needed to run all replications of the unique
+    configurations of a batch.
+
+    Tasks are generated lazily, as in parallel.make_tasks.
+
+    configurations: Configurations returned by plan_batch.
+    keys: Keys of the configurations, in the order of their parameters
+          in shared.
+    seeds: Seeds for each replication of each configuration, as returned
+           by parallel.replication_seeds.
+    shared: Key returned by share_parameters for the parameters of the
+            configurations.
+    """
+    for i, key in enumerate(keys):
+        configuration = configurations[key]
+        for replication in range(configuration['number_of_times']):
+            task = dict(index=(key, replication),
+                        shared_parameters=(shared, i),
+                        max_time=configuration['max_time'],
+                        seed=int(seeds[i, replication]))
+            if configuration['observers']:
+                task['observers'] = configuration['observers']
+            yield task
+
+
+def run_batch(parameters_files, dview=None, chunksize=4, observers=None,
+              seed=None, processes=None):
+    """
+    Run all parameters files as a single batch and save their outputs.
+
+    parameters_files: List of parameters files.
+    dview: Direct view instance from an ipyparallel cluster. If it's
+           None, the batch is run in local processes.
+    chunksize: Number of replications sent to an engine or process at
+               once.
+    observers: Observers of additional metrics to save with the results
+               of all files (see observers.parse_observers).
+    seed: Seed of the whole batch, saved with the results of each file.
+          Running the same files with the same seed gives the same
+          results.
+    processes: Number of local processes (by default, the number of
+               cpus).
+    """
+    files, configurations = plan_batch(parameters_files, observers)
+    if seed is None:
+        seed = int(np.random.randint(2**31 - 1))
+
+    # All replications of all unique configurations, with their
+    # parameters sent to the engines or processes only once
+    keys = sorted(configurations.keys())
+    unique_parameters = [configurations[key]['parameters'] for key in keys]
+    seeds = replication_seeds(seed, len(keys),
+                              max(c['number_of_times']
+                                  for c in configurations.values()))
+    workers = None
+    if dview is None:
+        workers = start_local_pool(unique_parameters, processes)
+        shared = workers['shared']
+    else:
+        shared = share_parameters(dview, unique_parameters)
+
+    total = sum(c['number_of_times'] for c in configurations.values())
+    requested = sum(run['number_of_times'] * len(set_of_parameters)
+                    for (run, set_of_parameters) in files.values())
+    print('Running {} replications for {} files ({} without merging) '
+          'with seed {}'.format(total, len(files), requested, seed))
+
+    # Results are placed by replication, since they arrive as they
+    # are completed
+    results = dict((key, [None] * configurations[key]['number_of_times'])
+                   for key in keys)
+    tasks = make_batch_tasks(configurations, keys, seeds, shared)
+    finished = False
+    try:
+        if workers is not None:
+            stream = stream_pool_tasks(tasks, workers, chunksize)
+        else:
+            stream = stream_tasks(tasks, dview, chunksize)
+        for result in stream:
+            key, replication = result['index']
+            results[key][replication] = result['panel']
+        finished = True
+    finally:
+        if workers is not None:
+            release_parameters(None, shared)
+            stop_local_workers(workers, terminate=not finished)
+        else:
+            release_parameters(dview, shared)
+
+    # Save outputs for each file
+    for parameters_file in sorted(files):
+        run, set_of_parameters = files[parameters_file]
+        data = [results[configuration_key(p, run['max_time'],
+                                          run.get('observers'))]
+                [:run['number_of_times']] for p in set_of_parameters]
+
+        filename = rerun_filename(parameters_file)
+        save_results(filename, data, set_of_parameters, run,
+                     metadata=dict(seed=seed))
+        save_outputs(data, set_of_parameters, run, filename, output)
+        register_results(filename)
+        print('Saved outputs of {} to {}'.format(parameters_file, filename))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        pattern = sys.argv[1]
+    else:
+        pattern = osp.join(SAVED_RESULTS_DIR, '*.json')
+    parameters_files = sorted(glob.glob(pattern))
+
+    if not osp.isdir(RERUNS_DIR):
+        os.makedirs(RERUNS_DIR)
+
+    dview = start_cluster()
+    if dview is not None:
+        reset_engines(dview)
+
+    run_batch(parameters_files, dview)
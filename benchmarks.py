@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks of the main functions of the algorithm
+
+Times generate_initial_conditions, get_neighbors, compute_global_utility,
+evolution_step and single_run over several numbers of consumers, numbers
+of neighbors, levels, graph types and with reflexivity and time delays
+on and off. For each benchmark it reports the time per call (or per tick
+for evolution_step), replications per second for single_run and, on
+Python 3, the peak memory allocated while running it.
+
+Results can be saved as a baseline and later runs compared against it,
+failing if any benchmark gets slower than a threshold.
+
+Usage:
+    python benchmarks.py --save-baseline
+    python benchmarks.py --compare
+    python benchmarks.py --sizes 1000 10000 100000 --graph-types small_world
+"""
+
+from __future__ import division
+
+import argparse
+from itertools import product
+import json
+import os
+import os.path as osp
+import random
+import sys
+import time
+
+from algorithm import evolution_step, generate_initial_conditions, single_run
+from all_parameters import RESULTS_DIR
+from all_parameters import parameters as default_parameters
+from utilities import (compute_global_utility, get_neighbors,
+                       set_random_state, set_seed)
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+# Default file to save baselines to
+BASELINE_FILE = osp.join(RESULTS_DIR, 'benchmarks_baseline.json')
+
+GRAPH_TYPES = ['small_world', 'preferential_attachment', 'powerlaw_cluster',
+               'erdos_renyi']
+
+
+#==============================================================================
+# Measurements
+#==============================================================================
+def peak_memory_start():
+    """Start measuring peak memory."""
+    if tracemalloc is not None:
+        tracemalloc.start()
+
+
+def peak_memory_stop():
+    """
+    Stop measuring peak memory.
+
+    Returns: The peak memory allocated since peak_memory_start in MB, or
+             None if tracemalloc is not available (Python 2), because
+             the maximum resident memory of the process includes the
+             one of all previous benchmarks.
+    """
+    if tracemalloc is not None:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak / 2**20
+
+
+def measure(func, repeat=3, memory=True, setup=None):
+    """
+    Time a function.
+
+    func: Function called repeat times, without arguments or with the
+          result of setup.
+    repeat: Number of times to call func.
+    memory: Whether to measure peak memory in the first call (this
+            slows it down, so it's not used for its time).
+    setup: Function without arguments called before each call of func
+           (and not timed), e.g. to generate a new state for functions
+           that change it.
+
+    Returns: The minimum time of all calls in seconds and the peak
+             memory in MB (or None).
+    """
+    def arguments():
+        return () if setup is None else (setup(),)
+
+    peak = None
+    if memory:
+        args = arguments()
+        peak_memory_start()
+        func(*args)
+        peak = peak_memory_stop()
+
+    times = []
+    for i in range(repeat):
+        args = arguments()
+        start = time.time()
+        func(*args)
+        times.append(time.time() - start)
+
+    return min(times), peak
+
+
+#==============================================================================
+# Benchmarks
+#==============================================================================
+def benchmark_parameters(number_of_consumers, number_of_neighbors, level,
+                         graph_type):
+    """Parameters of the algorithm used by the benchmarks."""
+    parameters = dict(default_parameters)
+    parameters.update(number_of_consumers=number_of_consumers,
+                      number_of_neighbors=number_of_neighbors,
+                      level=level,
+                      graph_type=graph_type)
+
+    # Randomness is the probability of each edge in Erdos-Renyi graphs,
+    # so it's set to give the same mean degree as the other graphs
+    if graph_type == 'erdos_renyi':
+        parameters['randomness'] = (number_of_neighbors /
+                                    (number_of_consumers - 1))
+
+    return parameters
+
+
+def benchmark_key(name, **settings):
+    """Key that identifies a benchmark and its settings."""
+    return '{}[{}]'.format(name, ','.join('{}={}'.format(k, settings[k])
+                                          for k in sorted(settings)))
+
+
+def run_benchmarks(sizes, neighbors, levels, graph_types, ticks=5,
+                   repeat=3, max_run_size=10000, seed=0):
+    """
+    Run all benchmarks.
+
+    sizes: Numbers of consumers.
+    neighbors: Numbers of neighbors.
+    levels: Levels (integer and fractional).
+    graph_types: Graph types.
+    ticks: Number of evolution steps to time.
+    repeat: Number of times to repeat each measurement.
+    max_run_size: Largest number of consumers to time single_run for.
+    seed: Seed for the random number generators.
+
+    Returns: A dictionary that maps the key of each benchmark to its
+             results.
+    """
+    results = {}
+
+    def report(key, seconds, peak, **extra):
+        results[key] = dict(seconds=seconds, peak_memory_mb=peak, **extra)
+        line = '{:<95} {:>10.4f} s'.format(key, seconds)
+        if peak is not None:
+            line += ' {:>9.1f} MB'.format(peak)
+        for name in sorted(extra):
+            line += ' {:>9.2f} {}'.format(extra[name], name)
+        print(line)
+        sys.stdout.flush()
+
+    for N, k, level, graph_type in product(sizes, neighbors, levels,
+                                           graph_types):
+        settings = dict(N=N, k=k, level=level, graph=graph_type)
+        parameters = benchmark_parameters(N, k, level, graph_type)
+
+        # Graph generation
+        set_random_state(seed)
+        seconds, peak = measure(lambda: generate_initial_conditions(parameters),
+                                repeat=1 if N > 10000 else repeat)
+        report(benchmark_key('generate_initial_conditions', **settings),
+               seconds, peak)
+
+        set_random_state(seed)
+        graph = generate_initial_conditions(parameters)
+
+        # Neighbors of a sample of nodes
+        nodes = random.sample(list(graph.nodes()), min(100, N))
+        seconds, peak = measure(
+            lambda: [get_neighbors(graph, n, level) for n in nodes], repeat)
+        report(benchmark_key('get_neighbors', **settings),
+               seconds / len(nodes), peak)
+
+        # Global utility with the initial adopters
+        set_seed(graph, parameters)
+        seconds, peak = measure(lambda: compute_global_utility(graph), repeat)
+        report(benchmark_key('compute_global_utility', **settings),
+               seconds, peak)
+
+        # Evolution steps with reflexivity and time delays on and off
+        for reflexivity, use_time_delays in product([False, True],
+                                                    [False, True]):
+            p = dict(parameters, reflexivity=reflexivity,
+                     use_time_delays=use_time_delays)
+
+            # evolution_step changes the graph, so every call starts
+            # from the same initial state
+            def initial_state(p=p):
+                set_random_state(seed)
+                G = generate_initial_conditions(p)
+                set_seed(G, p)
+                return G
+
+            def steps(G, p=p):
+                for t in range(ticks):
+                    evolution_step(G, p)
+
+            seconds, peak = measure(steps, 1 if N > 10000 else repeat,
+                                    setup=initial_state)
+            report(benchmark_key('evolution_step', rx=int(reflexivity),
+                                 delays=int(use_time_delays), **settings),
+                   seconds / ticks, peak)
+
+        # Complete replications
+        if N <= max_run_size:
+            set_random_state(seed)
+            seconds, peak = measure(lambda: single_run(parameters, ticks),
+                                    repeat)
+            report(benchmark_key('single_run', ticks=ticks, **settings),
+                   seconds, peak, reps_per_second=1 / seconds)
+
+    return results
+
+
+#==============================================================================
+# Baselines
+#==============================================================================
+def compare_results(results, baseline, threshold=1.2):
+    """
+    Compare the results of the benchmarks with a baseline.
+
+    threshold: Ratio between the current and baseline times above which
+               a benchmark is considered a regression.
+
+    Returns: A list of (key, ratio) for all regressions.
+    """
+    regressions = []
+    for key in sorted(results):
+        if key not in baseline:
+            continue
+        ratio = results[key]['seconds'] / baseline[key]['seconds']
+        flag = ''
+        if ratio > threshold:
+            regressions.append((key, ratio))
+            flag = '  <-- regression'
+        print('{:<95} {:>6.2f}x{}'.format(key, ratio, flag))
+    return regressions
+
+
+def main(argv=None):
+    """Run the benchmarks given in the command line."""
+    parser = argparse.ArgumentParser(
+        description='Benchmarks of the main functions of the algorithm')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000],
+                        help='Numbers of consumers (e.g. 1000 10000 100000 '
+                             '1000000)')
+    parser.add_argument('--neighbors', type=int, nargs='+', default=[4, 10],
+                        help='Numbers of neighbors')
+    parser.add_argument('--levels', type=float, nargs='+', default=[1, 1.5],
+                        help='Levels, integer and fractional')
+    parser.add_argument('--graph-types', nargs='+', default=GRAPH_TYPES,
+                        choices=GRAPH_TYPES, help='Graph types')
+    parser.add_argument('--ticks', type=int, default=5,
+                        help='Number of evolution steps to time')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of times to repeat each measurement')
+    parser.add_argument('--output', help='Save results to this json file')
+    parser.add_argument('--baseline', default=BASELINE_FILE,
+                        help='Baseline file')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Save results as the new baseline')
+    parser.add_argument('--compare', action='store_true',
+                        help='Compare results with the baseline')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='Slowdown ratio considered a regression')
+    args = parser.parse_args(argv)
+
+    levels = [int(l) if l == int(l) else l for l in args.levels]
+    results = run_benchmarks(args.sizes, args.neighbors, levels,
+                             args.graph_types, args.ticks, args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+
+    if args.save_baseline:
+        baseline = {}
+        if osp.isfile(args.baseline):
+            with open(args.baseline, 'r') as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        if not osp.isdir(osp.dirname(args.baseline)):
+            os.makedirs(osp.dirname(args.baseline))
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=4, sort_keys=True)
+
+    if args.compare:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.threshold)
+        if regressions:
+            print('{} benchmarks are slower than the baseline'.format(
+                  len(regressions)))
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
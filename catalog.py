@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+
+"""
+Catalog of the analyses saved in RESULTS_DIR and SAVED_RESULTS_DIR
+
+The catalog is a SQLite database that indexes the run settings, the
+parameters of each value of the main parameter, the seed, the version of
+the code, the variables saved for each replication (including the ones
+added by observers) and the files saved by each analysis (its results,
+in the format of storage.py, and its plots and csv files). Analyses are added to
+it when their results are saved, and directories with previous analyses
+(e.g. parameters files in SAVED_RESULTS_DIR) can be indexed with
+index_directory.
+
+This allows to find analyses by their parameters and load their results
+instead of running them again.
+
+Usage:
+    entries = find_runs(graph_type='erdos_renyi', critical_mass=0.5)
+    for values, parameters in find_data(graph_type='erdos_renyi'):
+        aggregates = compute_aggregates(values, parameters)
+"""
+
+import glob
+import json
+import numbers
+import os
+import os.path as osp
+import sqlite3
+import subprocess
+import time
+
+from all_parameters import RESULTS_DIR
+from storage import load_results, run_variables
+from utilities import LOCATION, VARIABLES, load_parameters_from_file
+
+
+# Database of the catalog
+CATALOG_FILE = osp.join(RESULTS_DIR, 'catalog.sqlite')
+
+# Run settings that can be used to find runs
+RUN_SETTINGS = ['main_parameter', 'number_of_times', 'max_time']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    name TEXT UNIQUE,
+    main_parameter TEXT,
+    number_of_times INTEGER,
+    max_time INTEGER,
+    run TEXT,
+    set_of_parameters TEXT,
+    seed INTEGER,
+    engine_version TEXT,
+    results_file TEXT,
+    parameters_file TEXT,
+    outputs TEXT,
+    updated REAL,
+    variables TEXT
+);
+CREATE TABLE IF NOT EXISTS parameters (
+    run_id INTEGER,
+    value_index INTEGER,
+    name TEXT,
+    value TEXT,
+    number REAL
+);
+CREATE INDEX IF NOT EXISTS parameters_name ON parameters (name, number);
+"""
+
+
+#==============================================================================
+# Database
+#==============================================================================
+def connect(catalog_file=CATALOG_FILE):
+    """Connect to the catalog, creating it if necessary."""
+    directory = osp.dirname(catalog_file)
+    if directory and not osp.isdir(directory):
+        os.makedirs(directory)
+    connection = sqlite3.connect(catalog_file)
+    connection.executescript(SCHEMA)
+
+    # Catalogs created before the variables of each run were saved
+    columns = [row[1] for row in
+               connection.execute('PRAGMA table_info(runs)')]
+    if 'variables' not in columns:
+        with connection:
+            connection.execute('ALTER TABLE runs ADD COLUMN variables TEXT')
+    return connection
+
+
+def engine_version():
+    """Git commit of the code of the algorithm, or None if unknown."""
+    try:
+        with open(os.devnull, 'w') as devnull:
+            version = subprocess.check_output(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=LOCATION,
+                stderr=devnull)
+        return version.decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def encode_value(value):
+    """Text and number (or None) used to store a parameter value."""
+    if isinstance(value, numbers.Real) and not isinstance(value, bool):
+        number = float(value)
+    else:
+        number = None
+    return json.dumps(value, sort_keys=True), number
+
+
+def values_match(value, other):
+    """
+    Check if two parameter values are the same, comparing numbers by
+    their value (e.g. 1 and 1.0) and the rest by their json text.
+    """
+    text, number = encode_value(value)
+    other_text, other_number = encode_value(other)
+    if number is not None and other_number is not None:
+        return number == other_number
+    return text == other_text
+
+
+def find_outputs(filename):
+    """Plots and csv files saved for an analysis."""
+    outputs = glob.glob(filename + '.csv') + glob.glob(filename + '.png')
+    outputs += glob.glob(filename + '_*.png')
+    return sorted(outputs)
+
+
+#==============================================================================
+# Adding analyses
+#==============================================================================
+def add_run(filename, run, set_of_parameters, seed=None, results_file=None,
+            parameters_file=None, variables=None, catalog_file=CATALOG_FILE):
+    """
+    Add an analysis to the catalog, replacing it if it was already there.
+
+    filename: Base name (without extension) of the files of the analysis,
+              which identifies it.
+    run: Dictionary of run settings (see all_parameters.py).
+    set_of_parameters: Parameters of each value of the main parameter.
+    seed: Seed of the analysis.
+    results_file: File with the results of the analysis (see storage.py).
+    parameters_file: File with the parameters of the analysis.
+    variables: Variables saved for each replication (by default, the
+               ones of the run, see storage.run_variables).
+    """
+    if variables is None:
+        variables = run_variables(run)
+
+    name = osp.abspath(filename)
+    connection = connect(catalog_file)
+    with connection:
+        row = connection.execute('SELECT id FROM runs WHERE name = ?',
+                                 (name,)).fetchone()
+        if row is not None:
+            connection.execute('DELETE FROM parameters WHERE run_id = ?', row)
+            connection.execute('DELETE FROM runs WHERE id = ?', row)
+
+        cursor = connection.execute(
+            'INSERT INTO runs (name, main_parameter, number_of_times, '
+            'max_time, run, set_of_parameters, seed, engine_version, '
+            'results_file, parameters_file, outputs, updated, variables) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (name, run['main_parameter'], run['number_of_times'],
+             run['max_time'], json.dumps(run, sort_keys=True),
+             json.dumps(set_of_parameters, sort_keys=True), seed,
+             engine_version(), results_file and osp.abspath(results_file),
+             parameters_file and osp.abspath(parameters_file),
+             json.dumps(find_outputs(filename)), time.time(),
+             json.dumps(variables)))
+        run_id = cursor.lastrowid
+
+        rows = []
+        for i, parameters in enumerate(set_of_parameters):
+            for parameter, value in parameters.items():
+                rows.append((run_id, i, parameter) + encode_value(value))
+        connection.executemany(
+            'INSERT INTO parameters VALUES (?, ?, ?, ?, ?)', rows)
+    connection.close()
+
+
+def register_results(filename, catalog_file=CATALOG_FILE):
+    """
+    Add an analysis whose results were saved with storage.save_results.
+
+    filename: Base name (without extension) of the saved files.
+    """
+    with open(filename + '.meta', 'r') as f:
+        metadata = json.load(f)
+
+    parameters_file = None
+    if osp.isfile(filename + '.json'):
+        parameters_file = filename + '.json'
+
+    add_run(filename, metadata['run'], metadata['set_of_parameters'],
+            seed=metadata.get('seed'), results_file=filename + '.npy',
+            parameters_file=parameters_file,
+            variables=metadata['variables'], catalog_file=catalog_file)
+
+
+def register_parameters_file(parameters_file, catalog_file=CATALOG_FILE):
+    """Add an analysis that only has its parameters file saved."""
+    all_parameters = load_parameters_from_file(parameters_file)
+    run = all_parameters['run']
+    parameters = all_parameters['parameters']
+
+    set_of_parameters = []
+    for value in run['parameter_values']:
+        new_parameters = parameters.copy()
+        new_parameters[run['main_parameter']] = value
+        set_of_parameters.append(new_parameters)
+
+    add_run(osp.splitext(parameters_file)[0], run, set_of_parameters,
+            parameters_file=parameters_file, catalog_file=catalog_file)
+
+
+def index_directory(directory, catalog_file=CATALOG_FILE):
+    """
+    Add all analyses saved in a directory to the catalog.
+
+    Analyses with saved results are added with them, and the rest with
+    their parameters file.
+
+    Returns: The number of analyses added.
+    """
+    added = 0
+    for metadata_file in sorted(glob.glob(osp.join(directory, '*.meta'))):
+        filename = osp.splitext(metadata_file)[0]
+        # Shards are added when they are merged
+        if '.shard-' in osp.basename(filename):
+            continue
+        register_results(filename, catalog_file)
+        added += 1
+
+    for parameters_file in sorted(glob.glob(osp.join(directory, '*.json'))):
+        filename = osp.splitext(parameters_file)[0]
+        if osp.isfile(filename + '.meta'):
+            continue
+        try:
+            register_parameters_file(parameters_file, catalog_file)
+        except (KeyError, TypeError, ValueError):
+            # Not a parameters file
+            continue
+        added += 1
+
+    return added
+
+
+#==============================================================================
+# Queries
+#==============================================================================
+def find_runs(catalog_file=CATALOG_FILE, **filters):
+    """
+    Find the analyses that have a value of the main parameter with the
+    given parameters.
+
+    filters: Values of parameters (e.g. graph_type='erdos_renyi') or
+             run settings (see RUN_SETTINGS) to look for.
+
+    Returns: A list of dictionaries with the files, run settings, set of
+             parameters, seed, engine version and saved variables of
+             each analysis, and the indexes of the values of the main
+             parameter that have the given parameters in 'values'.
+    """
+    joins = []
+    join_arguments = []
+    where = []
+    where_arguments = []
+    for parameter in sorted(filters):
+        value = filters[parameter]
+        if parameter in RUN_SETTINGS:
+            where.append('r.{} = ?'.format(parameter))
+            where_arguments.append(value)
+            continue
+
+        text, number = encode_value(value)
+        alias = 'p{}'.format(len(joins))
+        join = 'JOIN parameters {0} ON {0}.run_id = r.id AND {0}.name = ?'
+        if number is not None:
+            join += ' AND {0}.number = ?'
+            join_arguments += [parameter, number]
+        else:
+            join += ' AND {0}.value = ?'
+            join_arguments += [parameter, text]
+        # All parameters must belong to the same value
+        if joins:
+            join += ' AND {0}.value_index = p0.value_index'
+        joins.append(join.format(alias))
+
+    query = ' '.join(['SELECT DISTINCT r.* FROM runs r'] + joins)
+    if where:
+        query += ' WHERE ' + ' AND '.join(where)
+    query += ' ORDER BY r.updated'
+    arguments = join_arguments + where_arguments
+
+    connection = connect(catalog_file)
+    connection.row_factory = sqlite3.Row
+    rows = connection.execute(query, arguments).fetchall()
+    connection.close()
+
+    parameter_filters = dict((p, v) for p, v in filters.items()
+                             if p not in RUN_SETTINGS)
+    entries = []
+    for row in rows:
+        entry = dict(row)
+        for key in ['run', 'set_of_parameters', 'outputs']:
+            entry[key] = json.loads(entry[key])
+        if entry['variables'] is None:
+            entry['variables'] = VARIABLES
+        else:
+            entry['variables'] = json.loads(entry['variables'])
+        entry['values'] = [
+            i for i, parameters in enumerate(entry['set_of_parameters'])
+            if all(p in parameters and values_match(parameters[p], v)
+                   for p, v in parameter_filters.items())]
+        entries.append(entry)
+
+    return entries
+
+
+def find_data(catalog_file=CATALOG_FILE, **filters):
+    """
+    Get the saved results of all values of the main parameter of any
+    analysis that have the given parameters.
+
+    filters: Values of parameters or run settings (see find_runs).
+
+    Returns: A list of (values, parameters) for each value found, where
+             values is an array of shape (replications, 2, time,
+             variables), memory-mapped from its file (see storage.py).
+             Its variables are VARIABLES, followed by the ones added by
+             the observers of the run, if any (see find_runs).
+    """
+    data = []
+    for entry in find_runs(catalog_file, **filters):
+        results_file = entry['results_file']
+        if not results_file or not osp.isfile(results_file):
+            continue
+        results, metadata = load_results(osp.splitext(results_file)[0])
+        for i in entry['values']:
+            data.append((results[i], entry['set_of_parameters'][i]))
+    return data
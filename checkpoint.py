@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+"""
+Append-only log of the replications computed in a sweep
+
+Each line of the log is a json document. The first one describes the
+sweep (its seed and run settings) and the rest contain a replication
+each, with its index, seed and data. This allows to resume a sweep that
+was interrupted, computing only the replications that are missing.
+"""
+
+import json
+import os
+import os.path as osp
+
+import pandas as pd
+
+from utilities import RX_FIELDS, VARIABLES
+
+
+def new_header(run, seed):
+    """
+    Header of the log of a sweep.
+
+    run: Dictionary of run settings (see all_parameters.py).
+    seed: Seed used to generate the seeds of all replications.
+    """
+    header = dict(seed=seed,
+                  max_time=run['max_time'],
+                  number_of_times=run['number_of_times'],
+                  main_parameter=run['main_parameter'],
+                  parameter_values=run['parameter_values'])
+    if run.get('observers'):
+        header['observers'] = run['observers']
+    return header
+
+
+def _remove_incomplete_line(filename):
+    """Remove the last line of a file if it doesn't end in a newline."""
+    with open(filename, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        while position > 0:
+            block = min(4096, position)
+            f.seek(position - block)
+            newline = f.read(block).rfind(b'\n')
+            if newline >= 0:
+                f.truncate(position - block + newline + 1)
+                return
+            position -= block
+        f.truncate(0)
+
+
+def open_checkpoint(filename, header, resume=False):
+    """
+    Open the log of a sweep to append replications to it.
+
+    filename: Name of the log file.
+    header: Header of the log, returned by new_header.
+    resume: Whether to keep the replications already saved in the log
+            or start a new one.
+    """
+    if resume and osp.isfile(filename):
+        _remove_incomplete_line(filename)
+        f = open(filename, 'a')
+    else:
+        f = open(filename, 'w')
+        f.write(json.dumps(header) + '\n')
+        f.flush()
+    return f
+
+
+def append_result(f, result, variables=VARIABLES):
+    """
+    Append a replication to the log of a sweep.
+
+    f: File object returned by open_checkpoint.
+    result: Result of parallel.run_task, or of parallel.stream_local_tasks
+            with its values in an array.
+    variables: Variables of the array of values (see
+               storage.run_variables).
+    """
+    record = dict(index=list(result['index']), seed=result['seed'])
+    if 'panel' in result:
+        panel = result['panel']
+        for rx_field in ['no_rx', 'rx']:
+            df = panel[rx_field]
+            record[rx_field] = dict((c, df[c].tolist()) for c in df.columns)
+    else:
+        values = result['values']
+        for i, rx_field in enumerate(RX_FIELDS):
+            record[rx_field] = dict((v, values[i, :, j].tolist())
+                                    for j, v in enumerate(variables))
+
+    f.write(json.dumps(record) + '\n')
+    f.flush()
+
+
+def load_checkpoint(filename):
+    """
+    Load the replications saved in the log of a sweep.
+
+    Lines that were not completely written (e.g. because the process
+    was killed) are ignored.
+
+    Returns: The header of the log and a dictionary that maps the
+             (value, replication) index of each replication to its
+             Pandas panel.
+    """
+    panels = {}
+    with open(filename, 'r') as f:
+        header = json.loads(f.readline())
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            panel = pd.Panel({'no_rx': pd.DataFrame(record['no_rx']),
+                              'rx': pd.DataFrame(record['rx'])})
+            panels[tuple(record['index'])] = panel
+
+    return header, panels
+
+
+def check_header(header, run):
+    """Check that the log of a sweep corresponds to the same run."""
+    expected = new_header(run, header['seed'])
+    if header != expected:
+        raise Exception('The checkpoint was saved for a different run: '
+                        '{}'.format(header))
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+"""
+Counters of time and operations spent in each phase of the algorithm
+
+Counters are opt-in: single_run, evolution and evolution_step only
+update them if a dictionary of counters is passed to them, so there's
+no overhead otherwise.
+
+Phases (wall time in seconds):
+
+* initial_conditions: Graph generation in single_run.
+* evolution_step: Complete evolution steps.
+* global_utility: Computation of global utility (cluster detection).
+* agents: Loop over agents in evolution_step. It includes neighbors
+  and marketing.
+* neighbors: Neighbor lookups (BFS for fractional levels) and scans of
+  adopters among them.
+* marketing: Random draws for adoption by marketing.
+* update: Update of the graph with the adopters of a step.
+* dataframe: Creation of the DataFrames and Panels with the results.
+
+Operations:
+
+* steps: Evolution steps.
+* nodes_visited: Non-adopters evaluated in evolution steps.
+* neighbors_scanned: Neighbors checked for adoption.
+* neighbors_searches: Neighbor lookups with BFS (fractional levels).
+* global_utility_computations: Calls to compute_global_utility.
+* components: Clusters of adopters with more than one node found
+  while computing global utility.
+* marketing_draws: Random draws for adoption by marketing.
+* replications: Calls to single_run.
+"""
+
+import json
+import time
+
+
+def new_counters():
+    """Create a new set of counters."""
+    return dict(times={}, counts={})
+
+
+def add_time(counters, phase, start):
+    """Add the time elapsed since start to a phase."""
+    times = counters['times']
+    times[phase] = times.get(phase, 0) + time.time() - start
+
+
+def count(counters, name, n=1):
+    """Add n operations to a counter."""
+    counts = counters['counts']
+    counts[name] = counts.get(name, 0) + n
+
+
+def merge_counters(total, counters):
+    """Add counters (e.g. from a worker) to the total ones."""
+    for key in ['times', 'counts']:
+        for name, value in counters[key].items():
+            total[key][name] = total[key].get(name, 0) + value
+    return total
+
+
+def save_counters(filename, counters):
+    """
+    Save counters to a json file, with the time per step and per
+    replication of each phase.
+    """
+    report = dict(counters)
+    steps = counters['counts'].get('steps', 0)
+    replications = counters['counts'].get('replications', 0)
+    if steps:
+        report['times_per_step'] = dict(
+            (phase, t / steps) for phase, t in counters['times'].items())
+    if replications:
+        report['times_per_replication'] = dict(
+            (phase, t / replications)
+            for phase, t in counters['times'].items())
+
+    with open(filename, 'w') as f:
+        json.dump(report, f, indent=4, sort_keys=True)
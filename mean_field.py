@@ -0,0 +1,620 @@
+# -*- coding: utf-8 -*-
+
+"""
+Deterministic mean-field approximation of the algorithm
+
+The evolution is computed as a difference-equation system over the degree
+classes of the graph given by `graph_type`, instead of simulating agents on
+an actual graph. The individual attributes that agents keep for the whole
+evolution (adopters threshold, preference, minimal utility, reflexivity and
+time delay) are treated as quenched, i.e. the fraction of non-adopters is
+tracked over bins of those attributes, while the number of adopters among
+neighbors is drawn from a beta-binomial distribution with the pair
+approximation of the probability that a neighbor is an adopter (that's the
+main approximation made here). Its correlation accounts for adopters
+being clustered in graphs with many triangles, like small world graphs.
+Global utility is estimated from a site percolation of adopters on a
+configuration-model graph with the same degree distribution, or from the
+clusters grown from the initial adopters.
+
+This is meant to screen large parameter grids in milliseconds and decide
+where to spend simulation budget, not to replace compute_run. Use
+mean_field_uncertainty to find the parameters where the approximation
+can't be trusted and that need to be simulated.
+"""
+
+from __future__ import division
+
+import math
+
+import numpy as np
+import pandas as pd
+
+from utilities import logistic, step
+
+
+# Tolerance used to truncate degree distributions
+DEGREE_TAIL = 1e-6
+
+
+#==============================================================================
+# Degree distributions
+#==============================================================================
+def _log_factorials(n):
+    """Return an array with log(i!) for i = 0, ..., n"""
+    return np.concatenate([[0.], np.cumsum(np.log(np.arange(1, n + 1)))])
+
+
+def _binomial_pmf(n, p, k, log_factorials):
+    """Probability of k successes out of n trials with probability p"""
+    if p <= 0:
+        return (k == 0).astype(float)
+    elif p >= 1:
+        return (k == n).astype(float)
+    log_pmf = (log_factorials[n] - log_factorials[k] - log_factorials[n - k] +
+               k * np.log(p) + (n - k) * np.log(1 - p))
+    return np.exp(log_pmf)
+
+
+def _beta_binomial_pmf(n, p, rho, k, log_factorials):
+    """
+    Probability of k successes out of n trials with mean probability p,
+    when trials have an intra-class correlation rho.
+
+    Computed with the ratio of consecutive probabilities, so only a few
+    log-gamma functions are evaluated.
+    """
+    if rho <= 0 or p <= 0 or p >= 1 or n == 0:
+        return _binomial_pmf(n, p, k, log_factorials)
+    a = p * (1 - rho) / rho
+    b = (1 - p) * (1 - rho) / rho
+    log_first = (math.lgamma(n + b) + math.lgamma(a + b) - math.lgamma(b) -
+                 math.lgamma(n + a + b))
+    j = np.arange(n)
+    log_ratios = (np.log(n - j) + np.log(j + a) - np.log(j + 1) -
+                  np.log(n - j - 1 + b))
+    log_pmf = log_first + np.concatenate([[0.], np.cumsum(log_ratios)])
+    return np.exp(log_pmf[k])
+
+
+def _poisson_pmf(mu, k, log_factorials):
+    """Probability of k events of a Poisson distribution with mean mu"""
+    if mu <= 0:
+        return (k == 0).astype(float)
+    return np.exp(k * np.log(mu) - mu - log_factorials[k])
+
+
+def _truncate(degrees, probabilities):
+    """Remove degrees with negligible probability and normalize."""
+    keep = probabilities > DEGREE_TAIL * probabilities.max()
+    degrees = degrees[keep]
+    probabilities = probabilities[keep]
+    return degrees, probabilities / probabilities.sum()
+
+
+def _coarse_grain(degrees, probabilities, max_classes):
+    """
+    Group degrees in at most max_classes logarithmic bins.
+
+    Each bin is represented by its (rounded) mean degree.
+    """
+    if len(degrees) <= max_classes:
+        return degrees, probabilities
+
+    # Shift degrees by one to also bin isolated nodes
+    edges = np.unique(np.round(np.logspace(np.log10(degrees[0] + 1),
+                                           np.log10(degrees[-1] + 2),
+                                           max_classes + 1)))
+    bins = np.digitize(degrees + 1, edges[1:-1])
+    new_degrees = []
+    new_probabilities = []
+    for b in np.unique(bins):
+        in_bin = bins == b
+        p = probabilities[in_bin].sum()
+        k = np.sum(degrees[in_bin] * probabilities[in_bin]) / p
+        new_degrees.append(int(np.round(k)))
+        new_probabilities.append(p)
+    return np.array(new_degrees), np.array(new_probabilities)
+
+
+def degree_distribution(parameters, max_classes=60):
+    """
+    Approximate degree distribution of the graph used by the algorithm.
+
+    parameters: Dictionary of parameters for the algorithm.
+    max_classes: Maximum number of degree classes to return.
+
+    Returns: Two arrays with the degree classes and their probabilities.
+    """
+    graph_type = parameters.get('graph_type', 'small_world')
+    n_consumers = parameters['number_of_consumers']
+    n_neighbors = parameters['number_of_neighbors']
+    randomness = parameters['randomness']
+    log_factorials = _log_factorials(n_consumers)
+
+    if graph_type == 'small_world':
+        # Barrat and Weigt (2000) distribution for Watts-Strogatz graphs,
+        # which only rewire one of the c = k/2 edges of each node.
+        c = n_neighbors // 2
+        degrees = np.arange(c, n_consumers)
+        probabilities = np.zeros(len(degrees))
+        for n in range(c + 1):
+            extra = degrees - c - n
+            valid = extra >= 0
+            kept = _binomial_pmf(c, 1 - randomness, np.array([n]),
+                                 log_factorials)[0]
+            probabilities[valid] += kept * _poisson_pmf(randomness * c,
+                                                        extra[valid],
+                                                        log_factorials)
+    elif graph_type in ['preferential_attachment', 'powerlaw_cluster']:
+        # Asymptotic distribution of the Barabasi-Albert model. Triad
+        # formation in powerlaw_cluster graphs doesn't change it.
+        m = n_neighbors
+        degrees = np.arange(m, n_consumers)
+        probabilities = (2 * m * (m + 1) /
+                         (degrees * (degrees + 1) * (degrees + 2)))
+        # Natural cutoff of the largest hub
+        probabilities[degrees > m * np.sqrt(n_consumers)] = 0
+    elif graph_type == 'erdos_renyi':
+        degrees = np.arange(0, n_consumers)
+        probabilities = _binomial_pmf(n_consumers - 1, randomness, degrees,
+                                      log_factorials)
+    else:
+        raise ValueError("Wrong or unknown graph type")
+
+    degrees, probabilities = _truncate(degrees, probabilities)
+    return _coarse_grain(degrees, probabilities, max_classes)
+
+
+def neighborhood_sizes(degrees, probabilities, parameters):
+    """
+    Approximate number of neighbors up to `level` for each degree class.
+
+    Each extra level multiplies the number of neighbors by the mean
+    excess degree of the graph.
+    """
+    level = parameters['level']
+    mean_degree = np.sum(degrees * probabilities)
+    excess = np.sum(degrees * (degrees - 1) * probabilities) / mean_degree
+
+    min_level = int(level)
+    percentaje = level - min_level
+    factor = sum(excess ** l for l in range(min_level))
+    factor += percentaje * excess ** min_level
+
+    sizes = np.round(degrees * factor)
+    sizes = np.clip(sizes, 0, parameters['number_of_consumers'] - 1)
+    return sizes.astype(int)
+
+
+#==============================================================================
+# Local structure
+#==============================================================================
+def clustering_coefficient(degrees, probabilities, parameters):
+    """
+    Approximate clustering coefficient (transitivity) of the graph used by
+    the algorithm.
+
+    degrees, probabilities: Degree distribution of the graph.
+    """
+    graph_type = parameters.get('graph_type', 'small_world')
+    n_consumers = parameters['number_of_consumers']
+    n_neighbors = parameters['number_of_neighbors']
+    randomness = parameters['randomness']
+
+    if graph_type == 'small_world':
+        # Barrat and Weigt (2000)
+        if n_neighbors < 2:
+            return 0
+        return (3 * (n_neighbors - 2) / (4 * (n_neighbors - 1)) *
+                (1 - randomness) ** 3)
+    elif graph_type == 'erdos_renyi':
+        return randomness
+
+    # Barabasi-Albert graphs (Fronczak et al, 2003)
+    clustering = (n_neighbors / 8 * np.log(n_consumers) ** 2 /
+                  n_consumers)
+    if graph_type == 'powerlaw_cluster':
+        # Each node closes (m - 1) * randomness triangles on average
+        # with triad formation steps (Holme and Kim, 2002)
+        triples = np.sum(degrees * (degrees - 1) * probabilities) / 2
+        if triples > 0:
+            clustering += 3 * (n_neighbors - 1) * randomness / triples
+    return min(clustering, 1)
+
+
+def neighbors_correlation(degrees, probabilities, parameters):
+    """
+    Correlation between the states of the neighbors of a consumer.
+
+    Adopters spread from their neighbors, so in graphs with more
+    triangles than a random graph of the same density (e.g. small world
+    graphs with low randomness) the neighbors of a consumer tend to be
+    all adopters or all non-adopters, and adoption advances as a front.
+    The correlation is approximated by that excess of clustering, which
+    is zero for Erdos-Renyi graphs.
+    """
+    mean_degree = np.sum(degrees * probabilities)
+    density = mean_degree / max(parameters['number_of_consumers'] - 1, 1)
+    excess = clustering_coefficient(degrees, probabilities,
+                                    parameters) - density
+    return float(np.clip(excess, 0, 0.99))
+
+
+#==============================================================================
+# Global utility
+#==============================================================================
+def percolation_global_utility(degrees, probabilities, occupation,
+                               n_consumers):
+    """
+    Global utility of a site percolation of adopters.
+
+    degrees, probabilities: Degree distribution of the graph.
+    occupation: Fraction of adopters in each degree class.
+    n_consumers: Number of consumers.
+
+    Returns: The value compute_global_utility would give for a
+             configuration-model graph where adopters are placed at
+             random with the given occupation.
+    """
+    mean_degree = np.sum(degrees * probabilities)
+    if mean_degree == 0 or not np.any(occupation > 0):
+        return 0
+
+    excess_probabilities = degrees * probabilities / mean_degree
+    has_neighbors = degrees >= 1
+
+    # Probability that following an edge doesn't lead to the giant cluster
+    u = 0.
+    for _ in range(200):
+        u_power = np.where(has_neighbors,
+                           u ** np.maximum(degrees - 1, 0), 0)
+        new_u = np.sum(excess_probabilities *
+                       (1 - occupation + occupation * u_power))
+        if abs(new_u - u) < 1e-12:
+            break
+        u = new_u
+
+    # Fraction of consumers in the giant cluster
+    giant = np.sum(probabilities * occupation * (1 - u ** degrees))
+
+    # Mean size of finite clusters (Callaway et al, 2000)
+    a = np.sum(excess_probabilities * occupation *
+               np.where(has_neighbors, u ** np.maximum(degrees - 1, 0), 0))
+    b = np.sum(excess_probabilities * occupation * (degrees - 1) *
+               np.where(degrees >= 2, u ** np.maximum(degrees - 2, 0), 0))
+    branch_size = min(a / max(1 - b, 1e-12), n_consumers)
+    u_degrees = u ** degrees
+    u_excess = np.where(has_neighbors, u ** np.maximum(degrees - 1, 0), 0)
+    finite_size = np.sum(probabilities * occupation *
+                         (u_degrees + degrees * u_excess * branch_size))
+
+    # Adopters without adopting neighbors don't count as clusters
+    theta = np.sum(excess_probabilities * occupation)
+    singletons = np.sum(probabilities * occupation * (1 - theta) ** degrees)
+    in_clusters = np.sum(probabilities * occupation) - singletons
+    if in_clusters <= 0:
+        return 0
+
+    # Cluster-size-weighted average divided by N
+    utility = (giant ** 2 +
+               max(finite_size - singletons, 0) / n_consumers) / in_clusters
+    return min(utility, 1)
+
+
+def seeds_global_utility(adopters, n_seeds):
+    """
+    Global utility of adopters that grow from the initial seed.
+
+    When consumers only look at their nearest neighbors (level <= 1),
+    they can only adopt next to an adopter, so adopters form at most one
+    cluster per initial adopter until clusters merge, wherever they are
+    in the graph. Clusters grown from a single node have geometric sizes
+    (like a Yule process), so for a given number of adopters their
+    expected cluster-size-weighted average is 2 / (n_seeds + 1) times
+    that number.
+
+    adopters: Fraction of adopters.
+    n_seeds: Number of initial adopters.
+    """
+    if n_seeds < 1:
+        return 0
+    return min(2 * adopters / (n_seeds + 1), 1)
+
+
+#==============================================================================
+# Evolution
+#==============================================================================
+def mean_field_evolution(parameters, max_time, test=False,
+                         approximation='pair', bins=20,
+                         max_degree_classes=40, correlation=None):
+    """
+    Compute the mean-field evolution of the algorithm up to max_time.
+
+    parameters: Dictionary of parameters for the algorithm.
+    max_time: Time to stop the algorithm.
+    test: Test with a step function instead of the logistic one for
+          the emergence_factor.
+    approximation: 'pair' to follow pairs of non-adopters and adopters
+                   (which accounts for adopters being clustered) or
+                   'mean_field' to assume adopters are spread at random.
+    bins: Number of bins used for the adopters threshold and the
+          minimal utility of consumers.
+    max_degree_classes: Maximum number of degree classes to use.
+    correlation: Correlation between the states of the neighbors of a
+                 consumer, used by the pair approximation. By default
+                 it's computed from the clustering of the graph (see
+                 neighbors_correlation); 0 assumes the graph is locally
+                 tree-like.
+
+    Return: A DataFrame with the expected values of the data collected
+            by evolution at each time step.
+    """
+    N = parameters['number_of_consumers']
+    beta = parameters['social_influence']
+    marketing = parameters['marketing_effort']
+    reflexivity = parameters['reflexivity']
+    activation = step if test else logistic
+
+    degrees, probabilities = degree_distribution(parameters,
+                                                 max_degree_classes)
+    sizes = neighborhood_sizes(degrees, probabilities, parameters)
+    excess_probabilities = degrees * probabilities / np.sum(degrees *
+                                                            probabilities)
+    log_factorials = _log_factorials(max(sizes.max(), 1))
+    n_classes = len(degrees)
+    if approximation != 'pair':
+        correlation = 0
+    elif correlation is None:
+        correlation = neighbors_correlation(degrees, probabilities,
+                                            parameters)
+
+    # Bin centers for adopters thresholds and minimal utilities
+    centers = (np.arange(bins) + 0.5) / bins
+
+    # Time delays distribution
+    if reflexivity and parameters.get('use_time_delays', False):
+        delays_distro = parameters['time_delays_distro']
+        delay_values, delay_probabilites = zip(*delays_distro)
+    else:
+        delay_values, delay_probabilites = (0,), (1,)
+
+    # Individual preference (yi) is 1 for a fraction `quality` of consumers
+    quality = np.clip(parameters['quality'], 0, 1)
+    preference_probabilities = np.array([1 - quality, quality])
+    preference = np.array([0, 1])
+
+    # Fraction of non-adopters. Rows are indexed by degree class and
+    # adopters threshold, and columns by individual preference, minimal
+    # utility and whether consumers can use global utility or not.
+    n_seeds = np.round(N * parameters['initial_seed'])
+    seed = n_seeds / N
+    state = np.zeros((n_classes, bins, 2, bins, 2))
+    state[..., 0] = ((1 - seed) / bins ** 2 *
+                     probabilities[:, None, None, None] *
+                     preference_probabilities[None, None, :, None])
+    state = state.reshape(n_classes * bins, -1)
+
+    # Utilities of consumers with local influence (xi = 1), with adopters
+    # among neighbors but no local influence, and without adopters among
+    # neighbors, for each individual preference.
+    local_utilities = [beta + (1 - beta) * preference,
+                       (1 - beta) * preference,
+                       np.zeros(2)]
+
+    # Pairs of non-adopters and adopters among their neighbors, and
+    # total number of neighbors of non-adopters (per consumer).
+    mean_size = np.sum(probabilities * sizes)
+    pairs_sa = (1 - seed) * seed * mean_size
+    pairs_sn = (1 - seed) * mean_size
+
+    data = []
+    emergence_history = []
+    eligible = 0
+    global_utility = 0
+
+    for t in range(max_time):
+        non_adopters = state.reshape(n_classes, -1).sum(axis=1)
+        occupation = 1 - non_adopters / probabilities
+
+        # Global quantities for this time step
+        if reflexivity:
+            global_utility = max(
+                global_utility,
+                percolation_global_utility(degrees, probabilities,
+                                           occupation, N)
+            )
+            if parameters['level'] <= 1:
+                global_utility = max(
+                    global_utility,
+                    seeds_global_utility(np.sum(probabilities * occupation),
+                                         n_seeds)
+                )
+            emergence_factor = activation(global_utility,
+                                          parameters['activation_sharpness'],
+                                          parameters['critical_mass'])
+            emergence_history.append(emergence_factor)
+
+            # Consumers that have been aware of an emergent pattern for
+            # longer than their time delay
+            new_eligible = sum(
+                p * emergence_history[t - d]
+                for d, p in zip(delay_values, delay_probabilites)
+                if t - d >= 0
+            )
+            if new_eligible > eligible:
+                hazard = (new_eligible - eligible) / (1 - eligible)
+                view = state.reshape(-1, 2)
+                moved = hazard * view[:, 0]
+                view[:, 0] -= moved
+                view[:, 1] += moved
+                eligible = new_eligible
+
+        # Probability that a neighbor of a non-adopter is an adopter
+        if approximation == 'pair':
+            theta = pairs_sa / pairs_sn if pairs_sn > 0 else 0
+        else:
+            theta = np.sum(excess_probabilities * occupation)
+        theta = np.clip(theta, 0, 1)
+
+        # Probability of local influence for each degree class and
+        # adopters threshold, and of not having adopters among neighbors.
+        # Also the expected number of adopters among neighbors in each
+        # case, which is needed by the pair approximation.
+        local_influence = np.zeros((n_classes, bins))
+        local_influence_m = np.zeros((n_classes, bins))
+        no_adopters = np.ones((n_classes, bins))
+        for i, n in enumerate(sizes):
+            if n == 0:
+                continue
+            m = np.arange(n + 1)
+            pmf = _beta_binomial_pmf(n, theta, correlation, m,
+                                     log_factorials)
+            influenced = (m / n)[:, None] > centers
+            local_influence[i] = np.dot(pmf, influenced)
+            local_influence_m[i] = np.dot(pmf * m, influenced)
+            no_adopters[i] = pmf[0]
+        only_adopters = 1 - no_adopters - local_influence
+        only_adopters_m = sizes[:, None] * theta - local_influence_m
+
+        cases = np.array([local_influence.ravel(), only_adopters.ravel(),
+                          no_adopters.ravel()])
+        cases_m = np.array([local_influence_m.ravel(),
+                            only_adopters_m.ravel(),
+                            np.zeros(n_classes * bins)])
+
+        # Whether consumers adopt by utility or by marketing in each case
+        by_utility = np.zeros((3, 2, bins, 2))
+        by_marketing = np.zeros((3, 2, bins, 2))
+        for c, utility in enumerate(local_utilities):
+            for rx in [0, 1]:
+                if rx:
+                    u = 1 - (1 - utility) * (1 - global_utility)
+                else:
+                    u = utility
+                adopts = u[:, None] >= centers[None, :]
+                by_utility[c, :, :, rx] = adopts
+                # Marketing needs adopters among neighbors
+                if c < 2:
+                    by_marketing[c, :, :, rx] = marketing * ~adopts
+        by_utility = by_utility.reshape(3, -1)
+        by_marketing = by_marketing.reshape(3, -1)
+
+        # New adopters per row, case and type
+        rx_mask = np.tile([1., 0.], 2 * bins)
+        per_case = np.dot(state, np.concatenate([
+            (by_utility * rx_mask).T, (by_utility * (1 - rx_mask)).T,
+            by_marketing.T], axis=1))
+        by_local = np.sum(cases.T * per_case[:, :3])
+        by_local_or_global = np.sum(cases.T * per_case[:, 3:6])
+        by_marketing_total = np.sum(cases.T * per_case[:, 6:])
+
+        new_adopters = (cases.T * (per_case[:, :3] + per_case[:, 3:6] +
+                                   per_case[:, 6:])).reshape(n_classes, -1)
+        new_m = np.sum(cases_m.T * (per_case[:, :3] + per_case[:, 3:6] +
+                                    per_case[:, 6:]))
+
+        state = state * (1 - np.dot(cases.T, by_utility + by_marketing))
+
+        # Update pairs of non-adopters and adopters. Each new adopter
+        # stops being a non-adopter with m adopters among its neighbors
+        # and becomes an adopter for its n - m non-adopter neighbors.
+        new_pairs = np.sum(sizes * new_adopters.sum(axis=1))
+        pairs_sa += new_pairs - 2 * new_m
+        pairs_sn -= new_pairs
+        pairs_sa = np.clip(pairs_sa, 0, max(pairs_sn, 0))
+
+        data.append({'adopters': (by_local_or_global + by_local +
+                                  by_marketing_total) * N,
+                     'adopters_by_utility': (by_local_or_global +
+                                             by_local) * N,
+                     'adopters_by_marketing': by_marketing_total * N,
+                     'global_utility': global_utility,
+                     'adopters_by_local_or_global': by_local_or_global * N,
+                     'adopters_by_local': by_local * N})
+
+    data = pd.DataFrame(data)
+    return data
+
+
+def mean_field_run(parameters, max_time, **kwargs):
+    """
+    Compute a mean-field run (with and without reflexivity) of the
+    algorithm under the same conditions.
+
+    parameters: Dictionary of parameters for the algorithm.
+    max_time: Time to stop the algorithm.
+    kwargs: Additional arguments for mean_field_evolution.
+
+    Return: A Pandas panel with the same structure as the one
+            returned by single_run. A list with it can be passed to
+            the functions in utilities that work on compute_run
+            data.
+    """
+    parameters = parameters.copy()
+
+    parameters['reflexivity'] = False
+    data_no_rx = mean_field_evolution(parameters, max_time, **kwargs)
+
+    parameters['reflexivity'] = True
+    data_rx = mean_field_evolution(parameters, max_time, **kwargs)
+
+    panel = pd.Panel({'no_rx': data_no_rx, 'rx': data_rx})
+    return panel
+
+
+def mean_field_uncertainty(parameters, max_time, tolerance=0.1, **kwargs):
+    """
+    Check how much the mean-field approximation of a run can be trusted.
+
+    The final number of adopters (with reflexivity) is computed again
+    changing the parts of the approximation that are only estimated:
+    the correlation between neighbors (by 50%) and the number of initial
+    adopters (by its Poisson standard deviation, since the growth of a
+    few of them is very variable in the simulations). Parameters for
+    which the result changes a lot (e.g. small world graphs with few
+    initial adopters, where diffusion advances slowly as a front) need
+    to be simulated.
+
+    parameters: Dictionary of parameters for the algorithm.
+    max_time: Time to stop the algorithm.
+    tolerance: Largest relative width of the range of final adopters for
+               the approximation to be reliable.
+    kwargs: Additional arguments for mean_field_evolution.
+
+    Returns: A dictionary with the final adopters given by the
+             approximation, their lowest and highest values, the width
+             of that range relative to the final adopters and whether
+             it's reliable or not.
+    """
+    parameters = dict(parameters, reflexivity=True)
+    N = parameters['number_of_consumers']
+    n_seeds = np.round(N * parameters['initial_seed'])
+
+    correlation = kwargs.pop('correlation', None)
+    if correlation is None:
+        degrees, probabilities = degree_distribution(
+            parameters, kwargs.get('max_degree_classes', 40))
+        correlation = neighbors_correlation(degrees, probabilities,
+                                            parameters)
+
+    def final_adopters(parameters, correlation):
+        data = mean_field_evolution(parameters, max_time,
+                                    correlation=correlation, **kwargs)
+        return np.sum(data['adopters'])
+
+    final = final_adopters(parameters, correlation)
+    values = [final]
+    for factor in [0.5, 1.5]:
+        values.append(final_adopters(parameters,
+                                     min(factor * correlation, 0.99)))
+    for sign in [-1, 1]:
+        seeds = max(n_seeds + sign * np.sqrt(n_seeds), 1)
+        values.append(final_adopters(dict(parameters,
+                                          initial_seed=seeds / N),
+                                     correlation))
+
+    low, high = min(values), max(values)
+    relative = (high - low) / final if final > 0 else np.inf
+    return dict(final_adopters=final, low=low, high=high,
+                relative=relative, reliable=bool(relative <= tolerance))
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+
+"""
+Observers of additional metrics during the evolution of the algorithm
+
+An observer computes a metric from the state of the graph after an
+evolution step. Each observer declares the state it needs (see STATE)
+and how often it's sampled: every tick, every k ticks or only at the
+final tick. The state needed by all observers sampled at a tick is
+computed once, in a single pass over the graph, and nothing is computed
+on ticks where no observer is sampled.
+
+Observed values are added to the data returned by evolution, in a column
+per observer (with NaN on ticks where it wasn't sampled). Sweeps run with
+observers (see the observers key of the run settings) save the metrics
+that give a number per tick as additional variables of their results
+(see storage.py).
+
+Usage:
+    observers = [new_observer('homophily', every=5),
+                 new_observer('cluster_sizes', every=FINAL)]
+    data = evolution(graph, parameters, max_time, observers=observers)
+"""
+
+from __future__ import division
+
+import numbers
+
+import networkx as nx
+import numpy as np
+
+
+# Sample an observer every tick or only at the final one
+EVERY_TICK = 1
+FINAL = 'final'
+
+# State observers can use:
+# - adopters: Boolean array that is True for adopters.
+# - edges: Array of shape (edges, 2) with the edges of the graph.
+# - cluster_sizes: Array with the sizes of all clusters of adopters.
+STATE = ['adopters', 'edges', 'cluster_sizes']
+
+
+#==============================================================================
+# Metrics
+#==============================================================================
+def homophily(state, parameters):
+    """Fraction of edges between adopters and non-adopters."""
+    adopters = state['adopters']
+    edges = state['edges']
+    if len(edges) == 0:
+        return 0
+    return np.mean(adopters[edges[:, 0]] != adopters[edges[:, 1]])
+
+
+def adopters_fraction(state, parameters):
+    """Fraction of consumers that are adopters."""
+    return np.mean(state['adopters'])
+
+
+def number_of_clusters(state, parameters):
+    """Number of clusters of adopters with more than one node."""
+    return int(np.sum(state['cluster_sizes'] > 1))
+
+
+def largest_cluster(state, parameters):
+    """Size of the largest cluster of adopters."""
+    cluster_sizes = state['cluster_sizes']
+    return int(cluster_sizes.max()) if len(cluster_sizes) else 0
+
+
+def cluster_sizes(state, parameters):
+    """Number of clusters of adopters of each size, starting at 0."""
+    return np.bincount(state['cluster_sizes']).tolist()
+
+
+# Metrics available by name and the state they need
+METRICS = {
+    'homophily': (homophily, ['adopters', 'edges']),
+    'adopters_fraction': (adopters_fraction, ['adopters']),
+    'number_of_clusters': (number_of_clusters, ['cluster_sizes']),
+    'largest_cluster': (largest_cluster, ['cluster_sizes']),
+    'cluster_sizes': (cluster_sizes, ['cluster_sizes']),
+}
+
+# Metrics that give a single number per tick, so they can be saved with
+# the variables of each replication
+SCALAR_METRICS = ['homophily', 'adopters_fraction', 'number_of_clusters',
+                  'largest_cluster']
+
+
+#==============================================================================
+# Observers
+#==============================================================================
+def new_observer(name, func=None, needs=None, every=EVERY_TICK):
+    """
+    Create an observer.
+
+    name: Name of the observer. If func is not given, it must be one of
+          the metrics in METRICS.
+    func: Function that receives the state (a dictionary with the names
+          in needs) and the parameters of the algorithm, and returns the
+          observed value.
+    needs: List of the names of the state needed by func (see STATE).
+    every: Number of ticks between samples (EVERY_TICK samples all of
+           them) or FINAL to sample only the last one.
+    """
+    if every != FINAL and (isinstance(every, bool) or
+                           not isinstance(every, numbers.Integral) or
+                           every < 1):
+        raise ValueError('Observer {} must be sampled every positive number '
+                         'of ticks or {!r}, not {!r}'.format(name, FINAL,
+                                                            every))
+
+    if func is None:
+        if name not in METRICS:
+            raise ValueError('Unknown metric: {}'.format(name))
+        func, needs = METRICS[name]
+    if needs is None:
+        needs = []
+
+    unknown = set(needs) - set(STATE)
+    if unknown:
+        raise Exception('Unknown state for observer {}: {}'.format(
+                        name, sorted(unknown)))
+
+    return dict(name=name, func=func, needs=list(needs), every=every)
+
+
+def parse_observers(spec):
+    """
+    Create observers from a json-like specification.
+
+    spec: Dictionary that maps names of metrics in METRICS to their
+          sampling interval, e.g. {'homophily': 5, 'cluster_sizes':
+          'final'}.
+    """
+    return [new_observer(name, every=spec[name]) for name in sorted(spec)]
+
+
+def observed_variables(spec):
+    """
+    Variables added to the results of each replication by the observers
+    of a specification, in the order they are saved (see storage.py).
+
+    spec: Specification of the observers (see parse_observers) or None.
+    """
+    if not spec:
+        return []
+    parse_observers(spec)
+
+    not_scalar = sorted(set(spec) - set(SCALAR_METRICS))
+    if not_scalar:
+        raise ValueError('Observers {} do not give a number per tick, so '
+                         'they cannot be saved with the results of a '
+                         'sweep'.format(not_scalar))
+    return sorted(spec)
+
+
+def is_sampled(observer, time, max_time):
+    """
+    Check if an observer is sampled after a number of evolution steps.
+
+    time: Number of evolution steps computed so far (starting at 1).
+    max_time: Time to stop the algorithm.
+    """
+    if observer['every'] == FINAL:
+        return time == max_time
+    else:
+        return time % observer['every'] == 0
+
+
+def compute_state(graph, needs):
+    """
+    Compute the state needed by a group of observers.
+
+    graph: networkx graph in which the evolution takes place. Its nodes
+           must be numbered from 0 to N - 1.
+    needs: Set of names of the state to compute (see STATE).
+    """
+    state = {}
+    if not needs:
+        return state
+
+    # All state depends on the adopters
+    nodes = graph.node
+    adopters = np.zeros(graph.number_of_nodes(), dtype=bool)
+    for node_index in graph.nodes():
+        adopters[node_index] = nodes[node_index]['adopter'] == 1
+    state['adopters'] = adopters
+
+    if 'edges' in needs:
+        # Edges don't change during the evolution, so they are saved
+        # in the graph
+        if 'edges_array' not in graph.graph:
+            graph.graph['edges_array'] = np.array(
+                list(graph.edges()), dtype=np.int64).reshape(-1, 2)
+        state['edges'] = graph.graph['edges_array']
+
+    if 'cluster_sizes' in needs:
+        subgraph = nx.subgraph(graph, np.flatnonzero(adopters).tolist())
+        state['cluster_sizes'] = np.array(
+            [len(c) for c in nx.connected_components(subgraph)],
+            dtype=np.int64)
+
+    return state
+
+
+def observe(observers, graph, parameters, time, max_time):
+    """
+    Compute the values of the observers sampled after an evolution step.
+
+    observers: List of observers created with new_observer.
+    graph: networkx graph in which the evolution takes place.
+    parameters: Dictionary of parameters for the algorithm.
+    time: Number of evolution steps computed so far (starting at 1).
+    max_time: Time to stop the algorithm.
+
+    Returns: A dictionary that maps the name of each sampled observer to
+             its value.
+    """
+    sampled = [o for o in observers if is_sampled(o, time, max_time)]
+    if not sampled:
+        return {}
+
+    needs = set()
+    for observer in sampled:
+        needs.update(observer['needs'])
+    state = compute_state(graph, needs)
+
+    return dict((o['name'], o['func'](state, parameters)) for o in sampled)
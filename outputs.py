@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+"""
+Generate the outputs (plots and csv files) of an analysis
+"""
+
+import csv
+import glob
+import os.path as osp
+import re
+
+from aggregates import band_settings, get_aggregates
+from all_parameters import RERUNS_DIR
+from plots import (multiplot_variable, plot_adopters, plot_adopters_type,
+                   multiplot_adopters_and_global_utility)
+from storage import run_variables
+
+
+# Outputs that can be generated (see all_parameters.py)
+OUTPUTS = ['plot_adopters_and_global_utility', 'plot_adopters',
+           'plot_adopters_type', 'save_adopters_percentage']
+
+
+#==============================================================================
+# Mapping of parameter names to the names in our article
+#==============================================================================
+article_parameters = dict(
+    randomness = 'r',
+    number_of_neighbors = 'k',
+    social_influence = r'\beta',
+    quality = 'q',
+    number_of_consumers = 'N',
+    activation_sharpness = r'\phi',
+    critical_mass = 'M_c',
+)
+
+
+def rerun_filename(parameters_file, resume=False):
+    """
+    Base name (without extension) to save the outputs of a re-run of
+    a parameters file.
+
+    It's going to be of the form RERUNS_DIR/parameters_file_#, with #
+    the next number after the ones of all files saved by previous
+    re-runs (results, checkpoints, parameters and plots), even if they
+    didn't generate any plot.
+
+    resume: Whether to get the base name of the last re-run instead, to
+            resume it, if its checkpoint exists.
+    """
+    name = osp.splitext(osp.basename(parameters_file))[0] + '_'
+    pattern = re.compile(re.escape(name) + r'(\d+)(_[a-z]+)?\.[a-z]+$')
+    numbers = [int(match.group(1)) for match in
+               (pattern.match(osp.basename(f)) for f in
+                glob.glob(osp.join(RERUNS_DIR, name) + '*'))
+               if match is not None]
+    if not numbers:
+        return osp.join(RERUNS_DIR, name + '0')
+
+    last = osp.join(RERUNS_DIR, name + str(max(numbers)))
+    if resume and osp.isfile(last + '.log'):
+        return last
+    return osp.join(RERUNS_DIR, name + str(max(numbers) + 1))
+
+
+def save_output(name, data, set_of_parameters, run, filename):
+    """
+    Generate a single output of an analysis.
+
+    name: Name of the output (see OUTPUTS).
+    data: List of data obtained by running compute_run over each entry
+          of set_of_parameters (or their aggregates).
+    set_of_parameters: Set of parameters.
+    run: Dictionary of run settings (see all_parameters.py).
+    filename: Base name (without extension) of the files to save.
+    """
+    par_name = article_parameters[run['main_parameter']]
+
+    # Generate plots
+    if name == 'plot_adopters_and_global_utility':
+        multiplot_adopters_and_global_utility(
+            multiple_data=data,
+            set_of_params=set_of_parameters,
+            par_name=par_name,
+            par_values=run['parameter_values'],
+            cumulative=run['cumulative'],
+            filename=filename + '.png'
+        )
+
+    # Plot adopters with and without reflexivity
+    elif name == 'plot_adopters':
+        multiplot_variable(plot_func=plot_adopters,
+                           multiple_data=data,
+                           set_of_params=set_of_parameters,
+                           par_name=par_name,
+                           par_values=run['parameter_values'],
+                           cumulative=run['cumulative'],
+                           filename=filename + '_adopters.png',
+                           ylim_bottom=None,
+                           show_activation_time=True)
+
+    # Plot adopters per utility and marketing
+    elif name == 'plot_adopters_type':
+        multiplot_variable(plot_func=plot_adopters_type,
+                           multiple_data=data,
+                           set_of_params=set_of_parameters,
+                           par_name=par_name,
+                           par_values=run['parameter_values'],
+                           cumulative=run['cumulative'],
+                           filename=filename + '_types.png',
+                           ylim_bottom=None,
+                           show_activation_time=True,
+                           types=['local_or_global', 'local', 'marketing'],
+                           include_adopters=True)
+
+    # Save adopters percentaje up to activation to a csv file
+    elif name == 'save_adopters_percentage':
+        data = [get_aggregates(d, p, **band_settings(run))
+                for d, p in zip(data, set_of_parameters)]
+        with open(filename + '.csv', 'wb') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow([run['main_parameter'], 'Percentaje'])
+            for d, v in zip(data, run['parameter_values']):
+                percentaje = d['adopters_percentaje_upto_activation']
+                writer.writerow([v, percentaje])
+
+
+def save_outputs(data, set_of_parameters, run, filename, output):
+    """
+    Generate the plots and csv files of an analysis.
+
+    data: List of data obtained by running compute_run over each entry
+          of set_of_parameters (or their aggregates).
+    set_of_parameters: Set of parameters.
+    run: Dictionary of run settings (see all_parameters.py). Its band,
+         confidence and n_boot settings are used to compute the
+         confidence bands (see aggregates.band_settings).
+    filename: Base name (without extension) of the files to save.
+    output: Dictionary of outputs to generate (see all_parameters.py).
+    """
+    # Summaries used by all plots and csv files
+    variables = run_variables(run)
+    data = [get_aggregates(d, p, variables, **band_settings(run))
+            for d, p in zip(data, set_of_parameters)]
+
+    for name in OUTPUTS:
+        if output[name]:
+            save_output(name, data, set_of_parameters, run, filename)
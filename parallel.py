@@ -0,0 +1,466 @@
+# -*- coding: utf-8 -*-
+
+"""
+Run replications of the algorithm for several sets of parameters as a
+single flattened batch of tasks
+
+Tasks can be run in this process, in the engines of an IPyparallel
+cluster or in local processes that write their results to shared memory.
+"""
+
+import atexit
+from itertools import islice
+import multiprocessing
+import os
+import os.path as osp
+import subprocess
+import time
+import uuid
+
+import numpy as np
+
+from algorithm import single_run
+from instrumentation import new_counters
+from observers import parse_observers
+from profiling import start_sampler, stop_sampler
+from storage import panel_to_array
+from telemetry import memory_usage, worker_id
+from utilities import RX_FIELDS, VARIABLES
+
+
+#==============================================================================
+# Cluster
+#==============================================================================
+def start_cluster(n_engines=8):
+    """
+    Connect to an IPyparallel cluster, starting one if necessary.
+
+    n_engines: Number of engines to start if there's no cluster running.
+
+    Returns: A direct view to all engines or None if it was not
+             possible to start a cluster.
+    """
+    try:
+        from ipyparallel import Client
+    except ImportError:
+        return None
+
+    try:
+        rc = Client()
+        dview = rc[:]
+    except:
+        try:
+            # Get ipcluster path
+            HERE = osp.abspath(osp.dirname(__file__))
+            ipcluster_path = osp.join(HERE, 'envs', 'default', '{}',
+                                      'ipcluster')
+            if os.name == 'nt':
+                ipcluster_path = ipcluster_path.format('Scripts')
+            else:
+                ipcluster_path = ipcluster_path.format('bin')
+
+            proc = subprocess.Popen([ipcluster_path, "start", "-n",
+                                     str(n_engines)])
+            atexit.register(proc.terminate)
+            time.sleep(20)
+            rc = Client()
+            dview = rc[:]
+        except:
+            dview = None
+
+    return dview
+
+
+def reset_engines(dview):
+    """
+    Reset the engines of a cluster and reload modules on them
+
+    This is the same as running the %px magic in an IPython console,
+    but it also works from a regular Python interpreter.
+    """
+    dview.execute('%reset -f', block=True)
+    dview.execute('%reload_ext autoreload', block=True)
+    dview.execute('%autoreload 2', block=True)
+
+
+def load_balanced_view(dview):
+    """Load balanced view to the same engines as a direct view."""
+    return dview.client.load_balanced_view(targets=dview.targets)
+
+
+#==============================================================================
+# Shared parameters
+#==============================================================================
+# Sets of parameters shared with this process, by their key
+_shared_parameters = {}
+
+
+def store_parameters(key, set_of_parameters):
+    """Store a set of parameters in this process (e.g. an engine)."""
+    _shared_parameters[key] = set_of_parameters
+
+
+def share_parameters(dview, set_of_parameters):
+    """
+    Send a set of parameters to all engines of a cluster once, so
+    tasks only need to refer to them by their index.
+
+    dview: Direct view instance from an ipyparallel cluster (None to
+           store them only in this process).
+
+    Returns: The key to pass to make_tasks.
+    """
+    key = uuid.uuid4().hex
+    store_parameters(key, set_of_parameters)
+    if dview is not None:
+        dview.apply_sync(store_parameters, key, set_of_parameters)
+    return key
+
+
+def remove_parameters(key):
+    """Remove a set of parameters stored in this process."""
+    _shared_parameters.pop(key, None)
+
+
+def release_parameters(dview, key):
+    """
+    Remove a set of parameters sent with share_parameters from this
+    process and all engines of a cluster, once their tasks are finished.
+
+    dview: Direct view instance from an ipyparallel cluster (or None).
+    key: Key returned by share_parameters.
+    """
+    remove_parameters(key)
+    if dview is not None:
+        dview.apply_sync(remove_parameters, key)
+
+
+def get_task_parameters(task):
+    """Parameters of a task, either included in it or shared."""
+    if 'parameters' in task:
+        return task['parameters']
+    key, i = task['shared_parameters']
+    return _shared_parameters[key][i]
+
+
+#==============================================================================
+# Tasks
+#==============================================================================
+def replication_seeds(seed, n_values, number_of_times):
+    """
+    Seeds for each replication of each set of parameters of a sweep.
+
+    seed: Seed of the whole sweep.
+    n_values: Number of sets of parameters.
+    number_of_times: Number of replications for each set of parameters.
+
+    Returns: An array of shape (n_values, number_of_times).
+    """
+    random_state = np.random.RandomState(seed)
+    return random_state.randint(0, 2**31 - 1,
+                                size=(n_values, number_of_times))
+
+
+def make_tasks(set_of_parameters, number_of_times, max_time, seeds=None,
+               done=(), observers=None, instrument=False, profile=False,
+               shared=None):
+    """
+    Generate the tasks needed to run each set of parameters a certain
+    number_of_times.
+
+    Tasks are generated lazily, so they can describe very large batches.
+
+    set_of_parameters: List of dictionaries of parameters.
+    number_of_times: Number of times to repeat the evolution for each
+                     set of parameters.
+    max_time: Time to stop the algorithm.
+    seeds: Seeds for each replication, as returned by replication_seeds.
+    done: Indexes (value, replication) of tasks that don't need to be
+          run again.
+    observers: Specification of observers of additional metrics (see
+               observers.parse_observers).
+    instrument: Whether to collect counters of the time and operations
+                of each phase of the algorithm (see instrumentation.py).
+    profile: Whether to profile replications where they are run (see
+             profiling.py).
+    shared: Key returned by share_parameters for set_of_parameters, to
+            not include the parameters in the tasks.
+    """
+    for i, parameters in enumerate(set_of_parameters):
+        for replication in range(number_of_times):
+            if (i, replication) in done:
+                continue
+            seed = None if seeds is None else int(seeds[i, replication])
+            task = dict(index=(i, replication), max_time=max_time,
+                        seed=seed)
+            if shared is None:
+                task['parameters'] = parameters
+            else:
+                task['shared_parameters'] = (shared, i)
+            if observers:
+                task['observers'] = observers
+            if instrument:
+                task['instrument'] = True
+            if profile:
+                task['profile'] = True
+            yield task
+
+
+def run_task(task, graph_cache=None, graph_pool=None):
+    """
+    Run the replication described by a task.
+
+    graph_cache: OrderedDict to reuse initial conditions (see
+                 algorithm.cached_initial_conditions).
+    graph_pool: Pool to take initial conditions from (see
+                algorithm.pooled_initial_conditions).
+
+    Returns: A dictionary with the task index and seed, the Pandas
+             panel computed by single_run, the worker that computed it,
+             the time it took, the memory used by the worker and, if the
+             task is instrumented or profiled, its counters or sampled
+             stacks.
+    """
+    start = time.time()
+    seed = task.get('seed')
+    observers = None
+    if task.get('observers'):
+        observers = parse_observers(task['observers'])
+    counters = None
+    if task.get('instrument'):
+        counters = new_counters()
+    sampler = None
+    if task.get('profile'):
+        sampler = start_sampler()
+    panel = single_run(get_task_parameters(task), task['max_time'], seed,
+                       observers, counters, graph_cache, graph_pool)
+    result = dict(index=task['index'], seed=seed, panel=panel,
+                  worker=worker_id(), elapsed=time.time() - start,
+                  memory=memory_usage())
+    if counters is not None:
+        result['counters'] = counters
+    if sampler is not None:
+        result['profile'] = stop_sampler(sampler)
+    return result
+
+
+def iterate_tasks(tasks, dview=None, chunksize=256):
+    """
+    Run a batch of tasks and yield their results in order.
+
+    Tasks are sent to the cluster in chunks, so only the results of
+    a chunk are kept in memory at any time.
+
+    tasks: Iterable of tasks, e.g. generated by make_tasks.
+    dview: Direct view instance from an ipyparallel cluster.
+    chunksize: Number of tasks to run at the same time.
+    """
+    tasks = iter(tasks)
+    while True:
+        chunk = list(islice(tasks, chunksize))
+        if not chunk:
+            break
+
+        if dview is None:
+            results = [run_task(task) for task in chunk]
+        else:
+            results = dview.map_sync(run_task, chunk)
+
+        for result in results:
+            yield result
+
+
+def run_tasks(tasks):
+    """Run a chunk of tasks and return their results."""
+    return [run_task(task) for task in tasks]
+
+
+def stream_tasks(tasks, dview=None, chunksize=4, max_pending=None):
+    """
+    Run a batch of tasks and yield their results as they are completed.
+
+    Chunks of tasks are submitted asynchronously to a load balanced view
+    of the cluster, so engines that finish earlier (e.g. with smaller
+    graphs or faster replications) receive more chunks instead of
+    waiting for the others. Only max_pending chunks are submitted at the
+    same time, so very large batches don't need to be kept in memory.
+
+    Results are not in the same order as tasks, but they can be
+    identified by their index.
+
+    tasks: Iterable of tasks, e.g. generated by make_tasks. To not send
+           the parameters with each task, use share_parameters first.
+    dview: Direct view instance from an ipyparallel cluster. If None,
+           tasks are run in order in this process.
+    chunksize: Number of tasks in each chunk.
+    max_pending: Maximum number of chunks submitted at the same time
+                 (by default, twice the number of engines).
+    """
+    if dview is None:
+        for result in iterate_tasks(tasks, chunksize=chunksize):
+            yield result
+        return
+
+    view = load_balanced_view(dview)
+    if max_pending is None:
+        max_pending = 2 * len(dview)
+
+    tasks = iter(tasks)
+    pending = []
+    exhausted = False
+    while pending or not exhausted:
+        # Submit chunks until there are max_pending of them
+        while not exhausted and len(pending) < max_pending:
+            chunk = list(islice(tasks, chunksize))
+            if chunk:
+                pending.append(view.apply_async(run_tasks, chunk))
+            else:
+                exhausted = True
+
+        # Yield the results of finished chunks
+        ready = [r for r in pending if r.ready()]
+        if not ready:
+            time.sleep(0.01)
+            continue
+        for async_result in ready:
+            pending.remove(async_result)
+            for result in async_result.get():
+                yield result
+
+
+#==============================================================================
+# Local processes
+#==============================================================================
+def start_local_pool(set_of_parameters, processes=None):
+    """
+    Start local processes that send the results of their tasks back to
+    this process, e.g. for batches whose replications have different
+    shapes and can't be written to the same block of shared memory.
+
+    set_of_parameters: List of dictionaries of parameters, sent to the
+                       processes only once, when they start.
+    processes: Number of processes (by default, the number of cpus).
+
+    Returns: A dictionary with the pool of processes and the key of the
+             shared parameters (to pass to make_tasks). They are stopped
+             with stop_local_workers.
+    """
+    key = uuid.uuid4().hex
+    store_parameters(key, set_of_parameters)
+    pool = multiprocessing.Pool(processes, initializer=store_parameters,
+                                initargs=(key, set_of_parameters))
+    return dict(pool=pool, shared=key)
+
+
+def stream_pool_tasks(tasks, workers, chunksize=4):
+    """
+    Run a batch of tasks in local processes and yield their results as
+    they are completed.
+
+    tasks: Iterable of tasks that refer to the shared key of workers.
+    workers: Local processes returned by start_local_pool.
+    chunksize: Number of tasks sent to a process at once.
+    """
+    for result in workers['pool'].imap_unordered(run_task, tasks,
+                                                 chunksize):
+        yield result
+
+
+#==============================================================================
+# Local processes with shared memory
+#==============================================================================
+# Array of results shared with the local workers
+_shared_results = {}
+
+
+def shared_array(buffer, shape):
+    """Numpy array that uses the memory of a shared buffer."""
+    return np.frombuffer(buffer, dtype=np.float64).reshape(shape)
+
+
+def _init_local_worker(buffer, shape, variables, key, set_of_parameters):
+    """Initialize a local worker with the shared results and parameters."""
+    _shared_results['results'] = shared_array(buffer, shape)
+    _shared_results['variables'] = variables
+    store_parameters(key, set_of_parameters)
+
+
+def start_local_workers(set_of_parameters, number_of_times, max_time,
+                        processes=None, variables=VARIABLES):
+    """
+    Start local processes to run the replications of a sweep.
+
+    Results are written by the workers to a block of shared memory,
+    instead of being sent back to this process, and parameters are sent
+    to them only once, when they start.
+
+    set_of_parameters: List of dictionaries of parameters.
+    number_of_times: Number of replications for each set of parameters.
+    max_time: Time to stop the algorithm.
+    processes: Number of processes (by default, the number of cpus).
+    variables: Variables saved for each replication (see
+               storage.run_variables).
+
+    Returns: A dictionary with the pool of processes, the key of the
+             shared parameters (to pass to make_tasks) and the array of
+             results, of shape (values, replications, 2, time,
+             variables), as saved by storage.save_results.
+    """
+    shape = (len(set_of_parameters), number_of_times, len(RX_FIELDS),
+             max_time, len(variables))
+    buffer = multiprocessing.RawArray('d', int(np.prod(shape)))
+    key = uuid.uuid4().hex
+    store_parameters(key, set_of_parameters)
+    pool = multiprocessing.Pool(
+        processes, initializer=_init_local_worker,
+        initargs=(buffer, shape, variables, key, set_of_parameters))
+    return dict(pool=pool, shared=key, buffer=buffer,
+                results=shared_array(buffer, shape))
+
+
+def run_shared_task(task):
+    """
+    Run a task in a local worker and write its results to shared memory.
+
+    Returns: The same as run_task, but without the panel.
+    """
+    result = run_task(task)
+    panel = result.pop('panel')
+    _shared_results['results'][task['index']] = panel_to_array(
+        panel, _shared_results['variables'])
+    return result
+
+
+def stream_local_tasks(tasks, workers, chunksize=4):
+    """
+    Run a batch of tasks in local workers and yield their results as
+    they are completed.
+
+    tasks: Iterable of tasks, generated by make_tasks with the shared
+           key of workers.
+    workers: Local workers returned by start_local_workers.
+    chunksize: Number of tasks sent to a worker at once.
+
+    Yields: The results of run_shared_task, with the array of values
+            of each replication, of shape (2, time, variables), in
+            'values'. It's a view of the shared memory, not a copy.
+    """
+    results = workers['results']
+    for result in workers['pool'].imap_unordered(run_shared_task, tasks,
+                                                 chunksize):
+        result['values'] = results[result['index']]
+        yield result
+
+
+def stop_local_workers(workers, terminate=False):
+    """
+    Stop local workers.
+
+    terminate: Whether to stop them right away, without waiting for the
+               tasks they are running (e.g. after an error).
+    """
+    if terminate:
+        workers['pool'].terminate()
+    else:
+        workers['pool'].close()
+    workers['pool'].join()
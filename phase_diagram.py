@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+"""
+Adaptive phase diagrams of the presence of saddle points (slowdowns)
+
+Pilot runs are computed on a coarse grid of social influence and quality
+values, their adopter curves are classified as slowdown, bending or no
+slowdown, and only the cells whose corners have different classes are
+refined. The result is saved in the csv layout read by
+plots.plot_saddle_points_presence.
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from algorithm import compute_run
+from utilities import get_values_from_compute_run
+
+
+# Classes saved in the csv files
+SLOWDOWN = 1
+BENDING = 0.5
+NO_SLOWDOWN = 0
+
+
+#==============================================================================
+# Classification
+#==============================================================================
+def _largest_dip(series):
+    """
+    Largest drop of a series below both its previous and next maximum.
+    """
+    series = np.asarray(series, dtype=float)
+    if len(series) < 3:
+        return 0
+    left_max = np.maximum.accumulate(series)
+    right_max = np.maximum.accumulate(series[::-1])[::-1]
+    dips = np.minimum(left_max[:-2], right_max[2:]) - series[1:-1]
+    return max(np.max(dips), 0)
+
+
+def classify_slowdown(data, slowdown_tolerance=0.1, bending_tolerance=0.3,
+                      smoothing=3):
+    """
+    Classify the adopters curve (with reflexivity) of a run.
+
+    data: Contains the output of compute_run.
+    slowdown_tolerance: Minimal dip of the mean adopters curve, relative
+                        to its maximum, to consider it a slowdown.
+    bending_tolerance: Minimal dip in the growth rate of the mean
+                       adopters curve, relative to its maximum growth,
+                       to consider it a bending.
+    smoothing: Length of the moving average applied to the mean curve
+               to remove noise of pilot runs.
+
+    Returns: SLOWDOWN, BENDING or NO_SLOWDOWN
+    """
+    adopters = get_values_from_compute_run(data, with_reflexivity=True,
+                                           variable='adopters')
+    mean_adopters = np.mean(np.array(adopters), axis=0)
+    if smoothing > 1:
+        window = np.ones(smoothing) / smoothing
+        mean_adopters = np.convolve(mean_adopters, window, mode='valid')
+
+    scale = np.max(mean_adopters)
+    if scale <= 0:
+        return NO_SLOWDOWN
+
+    # Adopters decrease and then increase again
+    if _largest_dip(mean_adopters) / scale > slowdown_tolerance:
+        return SLOWDOWN
+
+    # Growth of adopters stalls and then increases again
+    growth = np.diff(mean_adopters)
+    max_growth = np.max(growth)
+    if max_growth > 0 and _largest_dip(growth) / max_growth > bending_tolerance:
+        return BENDING
+
+    return NO_SLOWDOWN
+
+
+#==============================================================================
+# Adaptive grid
+#==============================================================================
+def adaptive_phase_diagram(parameters, number_of_times, max_time,
+                           coarse_points=5, max_depth=3,
+                           x_name='social_influence', y_name='quality',
+                           dview=None, **kwargs):
+    """
+    Compute a phase diagram of slowdowns refining only around the
+    boundaries between classes.
+
+    parameters: Dictionary of parameters for the algorithm.
+    number_of_times: Number of pilot runs for each grid point.
+    max_time: Time to stop the algorithm.
+    coarse_points: Number of points per axis of the initial grid, which
+                   covers [0, 1] in both axes.
+    max_depth: Maximum number of times a cell can be split in four.
+    x_name: Name of the parameter in the x-axis.
+    y_name: Name of the parameter in the y-axis.
+    dview: Direct view instance from an ipyparallel cluster.
+    kwargs: Additional arguments for classify_slowdown.
+
+    Returns: A dictionary that maps (x, y) values to their class.
+    """
+    # Points are kept in integer coordinates of the finest grid to avoid
+    # comparing floats
+    scale = 2 ** max_depth
+    n = (coarse_points - 1) * scale
+
+    classes = {}
+
+    def evaluate(points):
+        for point in sorted(set(points) - set(classes)):
+            p = parameters.copy()
+            p[x_name] = point[0] / n
+            p[y_name] = point[1] / n
+            data = compute_run(number_of_times, p, max_time, dview)
+            classes[point] = classify_slowdown(data, **kwargs)
+
+    # Coarse grid
+    coarse = range(0, n + 1, scale)
+    evaluate([(i, j) for i in coarse for j in coarse])
+    cells = [(i, j, scale) for i in coarse[:-1] for j in coarse[:-1]]
+
+    # Refine cells whose corners have different classes
+    while cells:
+        to_split = []
+        for (i, j, size) in cells:
+            corners = [classes[(i, j)], classes[(i + size, j)],
+                       classes[(i, j + size)], classes[(i + size, j + size)]]
+            if size > 1 and len(set(corners)) > 1:
+                to_split.append((i, j, size))
+
+        half_cells = []
+        new_points = []
+        for (i, j, size) in to_split:
+            half = size // 2
+            for di in [0, half]:
+                for dj in [0, half]:
+                    half_cells.append((i + di, j + dj, half))
+            new_points += [(i + di, j + dj) for di in [0, half, size]
+                           for dj in [0, half, size]]
+
+        evaluate(new_points)
+        cells = half_cells
+
+    return dict(((i / n, j / n), c) for ((i, j), c) in classes.items())
+
+
+def phase_diagram_grid(classes):
+    """
+    Arrange the classes of a phase diagram in a grid.
+
+    The grid contains all evaluated x and y values. Grid points that
+    were not evaluated take the class of the nearest evaluated point.
+
+    classes: Dictionary returned by adaptive_phase_diagram.
+
+    Returns: The x values, the y values (in decreasing order) and an
+             array with a row of classes per y value.
+    """
+    points = np.array(sorted(classes.keys()))
+    values = np.array([classes[tuple(p)] for p in points])
+
+    xs = np.unique(points[:, 0])
+    ys = np.unique(points[:, 1])[::-1]
+
+    grid = np.zeros((len(ys), len(xs)))
+    for row, y in enumerate(ys):
+        for col, x in enumerate(xs):
+            distances = np.sum((points - [x, y]) ** 2, axis=1)
+            grid[row, col] = values[np.argmin(distances)]
+
+    return xs, ys, grid
+
+
+def save_phase_diagram(classes, csv_file):
+    """
+    Save a phase diagram in the csv layout used for saddle points.
+
+    classes: Dictionary returned by adaptive_phase_diagram.
+    csv_file: Name of the file to save the diagram to.
+    """
+    xs, ys, grid = phase_diagram_grid(classes)
+
+    with open(csv_file, 'w') as f:
+        f.write(', '.join(['index'] + ['%g' % x for x in xs]) + '\n')
+        for y, row in zip(ys, grid):
+            f.write(', '.join(['%g' % y] + ['%g' % c for c in row]) + '\n')
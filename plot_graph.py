@@ -12,7 +12,8 @@ from matplotlib.collections import PathCollection
 import networkx as nx
 
 from algorithm import generate_initial_conditions, evolution
-from utilities import get_adopters, set_seed
+from recording import get_adopters_at, new_recording
+from utilities import set_seed
 
 
 CONSUMERS = 50
@@ -25,18 +26,18 @@ COMPONENTS_COLORS = ['#ff8a00', '#af2294', "#e11c1c", "#2db500", '#3fc6f0']
 # =============================================================================
 # Main function
 # =============================================================================
-def plot_graph(graph, parameters, max_time=None):
+def plot_graph(graph, recording, max_time=None):
     """
     Plot networkx graph after certain number of steps in the evolution
     of the algorithm.
-    """
-    if max_time is not None:
-        # We don't need data here, but that's what evolution
-        # returns
-        data = evolution(graph, parameters, max_time)
 
+    graph: Graph in which the evolution took place.
+    recording: Recording of the evolution (see recording.py).
+    max_time: Number of steps of the evolution (None for the initial
+              state).
+    """
     # Get adopters and non-adopters
-    adopters = get_adopters(graph)
+    adopters = get_adopters_at(recording, max_time or 0).tolist()
     non_adopters = list(set(range(CONSUMERS)) - set(adopters))
 
     # Get connected components of adopters
@@ -136,7 +137,12 @@ print('Number of global components = ' + str(global_components))
 # Set seed of adopters
 set_seed(graph, parameters)
 
+# Record the evolution only once and plot it at different times.
+# We don't need data here, but that's what evolution returns
+recording = new_recording(graph)
+data = evolution(graph, parameters, 35, recording=recording)
+
 # Generate plots
-plot_graph(graph, parameters)  # At startup
-plot_graph(graph, parameters, max_time=15)  # At 15
-plot_graph(graph, parameters, max_time=35)  # At 35
+plot_graph(graph, recording)  # At startup
+plot_graph(graph, recording, max_time=15)  # At 15
+plot_graph(graph, recording, max_time=35)  # At 35
@@ -18,13 +18,32 @@ import matplotlib.gridspec as gridspec
 import pandas as pd
 import seaborn as sns
 
-from utilities import (compute_activation_time, get_max_adopters,
-                       get_values_from_compute_run)
+from aggregates import get_aggregates, get_series
 
 
 sns.set_style("whitegrid")
 
 
+# =============================================================================
+# Helpers
+# =============================================================================
+def plot_series(series, axis, color=None, label=None):
+    """
+    Plot the mean of a variable and its confidence band.
+
+    series: Dictionary with the mean, low and high series of the
+            variable (see aggregates.get_series).
+    axis: Matplotlib axis to add this plot to.
+    color: Color of the plot.
+    label: Label of the plot in the legend.
+    """
+    time = np.arange(len(series['mean']))
+    line, = axis.plot(time, series['mean'], color=color, label=label)
+    axis.fill_between(time, series['low'], series['high'],
+                      color=line.get_color(), alpha=0.2, linewidth=0)
+    axis.set_xlim(time[0], time[-1])
+
+
 # =============================================================================
 # Single plots
 # =============================================================================
@@ -43,7 +62,7 @@ def plot_adopters(data, parameters,
     """
     Plot number of adopters against time.
 
-    data: contains the output of compute_run.
+    data: contains the output of compute_run or its aggregates.
     parameters: Parameters of the run.
     axis: Matplotlib axis to add this plot to.
     cumulative: Whether to plot the cumulative number of adopters or not
@@ -56,15 +75,12 @@ def plot_adopters(data, parameters,
     show_no_reflexivity: Whether to show no reflexivity curves
     """
     # Data to plot
-    no_rx_data = get_values_from_compute_run(data, with_reflexivity=False,
-                                             variable='adopters')
-    rx_data = get_values_from_compute_run(data, with_reflexivity=True,
-                                          variable='adopters')
-    activation_time = compute_activation_time(data, parameters)
-
-    if cumulative:
-        no_rx_data = map(np.cumsum, no_rx_data)
-        rx_data = map(np.cumsum, rx_data)
+    aggregates = get_aggregates(data, parameters)
+    no_rx_data = get_series(aggregates, with_reflexivity=False,
+                            variable='adopters', cumulative=cumulative)
+    rx_data = get_series(aggregates, with_reflexivity=True,
+                         variable='adopters', cumulative=cumulative)
+    activation_time = aggregates['activation_time']
 
     if axis is None:
         figsize = (5.0, 4.5)
@@ -73,8 +89,8 @@ def plot_adopters(data, parameters,
 
     # Plots
     if show_no_reflexivity:
-        sns.tsplot(data=no_rx_data, condition='No Reflexivity', ax=axis)
-    sns.tsplot(data=rx_data, color='m', condition='Reflexivity', ax=axis)
+        plot_series(no_rx_data, axis, label='No Reflexivity')
+    plot_series(rx_data, axis, color='m', label='Reflexivity')
     if show_activation_time:
         axis.axvline(x=activation_time, linestyle='--', linewidth=1,
                      color='0.4')
@@ -97,8 +113,6 @@ def plot_adopters(data, parameters,
 
     if show_legend:
         axis.legend(loc='best', fontsize=fontsize-2)
-    else:
-        axis.legend_.remove()
     axis.tick_params(axis='both', which='major', labelsize=fontsize-2)
 
     if filename is not None:
@@ -122,7 +136,7 @@ def plot_adopters_type(data, parameters,
     """
     Plot number of type of adopters against time.
 
-    data: Contains the output of compute_run.
+    data: Contains the output of compute_run or its aggregates.
     parameters: Parameters of the run.
     axis: Matplotlib axis to add this plot to.
     par_name: Parameter name that we're varying in the simulation.
@@ -146,25 +160,20 @@ def plot_adopters_type(data, parameters,
         types = ['utility', 'marketing']
 
     # Data to plot
+    aggregates = get_aggregates(data, parameters)
     data_for_types = []
     for t in types:
         type_field = 'adopters_by_%s' % t
-        values = get_values_from_compute_run(data, with_reflexivity,
-                                             variable=type_field)
+        values = get_series(aggregates, with_reflexivity,
+                            variable=type_field, cumulative=cumulative)
         data_for_types.append(values)
 
     adopters = None
     if include_adopters:
-        adopters = get_values_from_compute_run(data, with_reflexivity,
-                                               variable='adopters')
-
-    activation_time = compute_activation_time(data, parameters)
-
-    if cumulative:
-        data_for_types = [map(np.cumsum, d) for d in data_for_types]
+        adopters = get_series(aggregates, with_reflexivity,
+                              variable='adopters', cumulative=cumulative)
 
-        if adopters is not None:
-            adopters = map(np.cumsum, adopters)
+    activation_time = aggregates['activation_time']
 
     # Create axis if it doesn't exist
     if axis is None:
@@ -176,11 +185,11 @@ def plot_adopters_type(data, parameters,
     for i in range(len(data_for_types)):
         type_name = types[i].split('_')
         type_name = ' '.join(type_name).capitalize()
-        sns.tsplot(data=data_for_types[i], condition=type_name, ax=axis,
-                   color=colors[i])
+        plot_series(data_for_types[i], axis, color=colors[i],
+                    label=type_name)
 
     if adopters is not None:
-        sns.tsplot(data=adopters, color="m", condition='Total', ax=axis)
+        plot_series(adopters, axis, color="m", label='Total')
 
     if show_activation_time:
         axis.axvline(x=activation_time, linestyle='--', linewidth=1,
@@ -204,8 +213,6 @@ def plot_adopters_type(data, parameters,
 
     if show_legend:
         axis.legend(loc='best', fontsize=fontsize-2)
-    else:
-        axis.legend_.remove()
     axis.tick_params(axis='both', which='major', labelsize=fontsize-2)
 
     if filename is not None:
@@ -218,7 +225,7 @@ def plot_global_utility(data, parameters, axis,
     """
     Plot global utility against time.
 
-    data: Contains the output of compute_run.
+    data: Contains the output of compute_run or its aggregates.
     parameters: Parameters of the run.
     axis: Matplotlib axis to add this plot to.
     par_name: Parameter name that we're varying in the simulation.
@@ -226,9 +233,10 @@ def plot_global_utility(data, parameters, axis,
     fontsize: Font size for legends and tick marks.
     """
     # Data to plot
-    Ug_data = get_values_from_compute_run(data, with_reflexivity=True,
-                                          variable='global_utility')
-    activation_time = compute_activation_time(data, parameters)
+    aggregates = get_aggregates(data, parameters)
+    Ug_data = get_series(aggregates, with_reflexivity=True,
+                         variable='global_utility')
+    activation_time = aggregates['activation_time']
 
     # Plot adjustments
     if par_name is not None and par_value is not None:
@@ -239,7 +247,7 @@ def plot_global_utility(data, parameters, axis,
     plt.setp(axis.get_xticklabels(), visible=False)
 
     # Plots
-    sns.tsplot(data=Ug_data, color=sns.xkcd_rgb["medium green"], ax=axis)
+    plot_series(Ug_data, axis, color=sns.xkcd_rgb["medium green"])
     axis.axvline(x=activation_time, linestyle='--', linewidth=1, color='0.4')
 
 
@@ -293,7 +301,8 @@ def multiplot_variable(plot_func, multiple_data, set_of_params, par_name,
 
     plot_func: Plot function to use.
     multiple_data: List of data obtained by running compute_run
-                   over each entry of set_of_params.
+                   over each entry of set_of_params (or their
+                   aggregates).
     set_of_params: Set of parameters.
     par_name: Name of the main parameter that we are varying in the simulation.
     par_values: List of values for the main parameter.
@@ -333,12 +342,16 @@ def multiplot_variable(plot_func, multiple_data, set_of_params, par_name,
     fig, axes = plt.subplots(nrows=nrows, ncols=ncols, figsize=figsize,
                              sharex=True, sharey=True)
 
+    # Compute aggregates only once for each value
+    multiple_data = [get_aggregates(d, p) for d, p in zip(multiple_data,
+                                                          set_of_params)]
+
     if cumulative:
         max_consumers = [parameters['number_of_consumers']
                          for parameters in set_of_params]
         ylim_top = max(max_consumers)
     else:
-        max_adopters = max([get_max_adopters(d) for d in multiple_data])
+        max_adopters = max([d['max_adopters'] for d in multiple_data])
         ylim_top = round(max_adopters) + 10
 
     for ax, d, v, p in zip(axes.flat, multiple_data, par_values, set_of_params):
@@ -374,7 +387,8 @@ def multiplot_adopters_and_global_utility(multiple_data, set_of_params,
     Plot adopters and global utility in the same graph.
 
     multiple_data: List of data obtained by running compute_run
-                   over each entry of set_of_params.
+                   over each entry of set_of_params (or their
+                   aggregates).
     set_of_params: Set of parameters.
     par_name: Name of the main parameter that we are varying in
               the simulation.
@@ -392,6 +406,10 @@ def multiplot_adopters_and_global_utility(multiple_data, set_of_params,
     figsize = (9, 9)
     fontsize = 11
 
+    # Compute aggregates only once for each value
+    multiple_data = [get_aggregates(d, p) for d, p in zip(multiple_data,
+                                                          set_of_params)]
+
     fig = plt.figure(figsize=figsize)
 
     # Grid of 2x2 plots
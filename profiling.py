@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+"""
+Sampling profiler for the phases of an analysis
+
+A thread samples the stack of the profiled thread at regular intervals
+and counts how many times each stack is found. Stacks are saved in the
+folded format used by flamegraph.pl and speedscope (one line per stack,
+with its frames separated by semicolons and its number of samples), and
+summarized by the functions where most samples are spent.
+
+This works in the engines of an IPyparallel cluster too: run_task
+profiles replications when its task asks for it and returns their
+stacks with the results.
+
+Usage:
+    sampler = start_sampler('simulation')
+    ...
+    stacks = stop_sampler(sampler)
+    save_folded_stacks('profile.folded', stacks)
+"""
+
+from __future__ import division
+
+import os.path as osp
+import sys
+import threading
+import time
+
+
+# Time between samples in seconds
+INTERVAL = 0.005
+
+# Phases of an analysis, in the order they are run
+PHASES = ['simulation', 'aggregation', 'plotting']
+
+
+#==============================================================================
+# Sampler
+#==============================================================================
+def frame_name(frame):
+    """Name of a frame, e.g. 'single_run (algorithm.py:260)'."""
+    code = frame.f_code
+    return '{} ({}:{})'.format(code.co_name, osp.basename(code.co_filename),
+                               code.co_firstlineno)
+
+
+def folded_stack(frame, root=None):
+    """
+    Stack of a frame in folded format, from the outermost frame to it.
+
+    root: Name to add as the outermost frame (e.g. a phase).
+    """
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    if root is not None:
+        names.append(root)
+    return ';'.join(reversed(names))
+
+
+def _sample(sampler):
+    """Sample the stack of a thread until the sampler is stopped."""
+    stacks = sampler['stacks']
+    while sampler['running']:
+        frame = sys._current_frames().get(sampler['thread_id'])
+        if frame is not None:
+            stack = folded_stack(frame, sampler['root'])
+            stacks[stack] = stacks.get(stack, 0) + 1
+        del frame
+        time.sleep(sampler['interval'])
+
+
+def start_sampler(root=None, interval=INTERVAL):
+    """
+    Start sampling the stack of the current thread.
+
+    root: Name to add as the outermost frame of all stacks, e.g. the
+          phase of the analysis being profiled.
+    interval: Time between samples in seconds.
+    """
+    sampler = dict(stacks={}, root=root, interval=interval, running=True,
+                   thread_id=threading.current_thread().ident)
+    thread = threading.Thread(target=_sample, args=(sampler,))
+    thread.daemon = True
+    sampler['thread'] = thread
+    thread.start()
+    return sampler
+
+
+def stop_sampler(sampler):
+    """
+    Stop a sampler.
+
+    Returns: A dictionary that maps each folded stack to its number of
+             samples.
+    """
+    sampler['running'] = False
+    sampler['thread'].join()
+    return sampler['stacks']
+
+
+def merge_stacks(total, stacks, root=None):
+    """
+    Add stacks (e.g. from a worker) to the total ones.
+
+    root: Name to add as the outermost frame of stacks.
+    """
+    for stack, samples in stacks.items():
+        if root is not None:
+            stack = root + ';' + stack
+        total[stack] = total.get(stack, 0) + samples
+    return total
+
+
+#==============================================================================
+# Reports
+#==============================================================================
+def save_folded_stacks(filename, stacks):
+    """Save stacks in folded format, for flamegraph.pl or speedscope."""
+    with open(filename, 'w') as f:
+        for stack in sorted(stacks):
+            f.write('{} {}\n'.format(stack, stacks[stack]))
+
+
+def rank_functions(stacks):
+    """
+    Count the samples spent in each function.
+
+    Returns: Two dictionaries that map the name of each function to its
+             number of samples: one with its self samples (when it was
+             the innermost frame) and one with its total samples
+             (including the functions it called).
+    """
+    self_samples = {}
+    total_samples = {}
+    for stack, samples in stacks.items():
+        names = stack.split(';')
+        self_samples[names[-1]] = self_samples.get(names[-1], 0) + samples
+        # Recursive functions are counted once per stack
+        for name in set(names):
+            total_samples[name] = total_samples.get(name, 0) + samples
+    return self_samples, total_samples
+
+
+def save_summary(filename, stacks, title='', top=30, interval=INTERVAL):
+    """
+    Save a summary of the samples spent in each phase and the functions
+    with the most samples.
+
+    stacks: Stacks with the phase as their outermost frame.
+    title: Title of the summary.
+    top: Number of functions to list.
+    interval: Time between samples in seconds.
+    """
+    n_samples = sum(stacks.values())
+    self_samples, total_samples = rank_functions(stacks)
+
+    phases = dict((p, 0) for p in PHASES)
+    for stack, samples in stacks.items():
+        phase = stack.split(';', 1)[0]
+        phases[phase] = phases.get(phase, 0) + samples
+
+    def percentage(samples):
+        return 100 * samples / n_samples if n_samples else 0
+
+    lines = []
+    if title:
+        lines += [title, '']
+    lines.append('Samples: {} (one every {:g} ms)'.format(n_samples,
+                                                          interval * 1000))
+    lines.append('')
+
+    lines.append('{:<20} {:>10} {:>8}'.format('Phase', 'Samples', '%'))
+    for phase in PHASES + sorted(set(phases) - set(PHASES)):
+        lines.append('{:<20} {:>10} {:>7.1f}%'.format(
+                     phase, phases[phase], percentage(phases[phase])))
+
+    for header, ranking in [('Total', total_samples), ('Self', self_samples)]:
+        names = [n for n in ranking if n not in phases]
+        names = sorted(names, key=lambda n: -ranking[n])[:top]
+        lines.append('')
+        lines.append('{:<70} {:>10} {:>8}'.format(
+                     'Function ({} samples)'.format(header.lower()),
+                     'Samples', '%'))
+        for name in names:
+            lines.append('{:<70} {:>10} {:>7.1f}%'.format(
+                         name, ranking[name], percentage(ranking[name])))
+
+    with open(filename, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
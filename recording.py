@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+"""
+Record the time and channel of adoption of each consumer during a run
+
+A recording contains two arrays with an entry per node of the graph:
+
+* tick: Number of evolution steps after which the node became an
+  adopter (0 for initial adopters and NOT_ADOPTED for nodes that never
+  adopted), as uint16.
+* channel: How the node adopted (see CHANNELS), as uint8.
+
+This is enough to reconstruct the adopters at any time of the run in
+O(N), without running the algorithm again.
+
+Usage:
+    recording = new_recording(graph)
+    evolution(graph, parameters, max_time, recording=recording)
+    adopters = get_adopters_at(recording, 15)
+"""
+
+import numpy as np
+
+
+# Tick of nodes that never adopted
+NOT_ADOPTED = np.iinfo(np.uint16).max
+
+# Adoption channels
+SEED = 0
+LOCAL = 1
+LOCAL_OR_GLOBAL = 2
+MARKETING = 3
+NO_CHANNEL = np.iinfo(np.uint8).max
+
+CHANNELS = {SEED: 'seed',
+            LOCAL: 'local',
+            LOCAL_OR_GLOBAL: 'local_or_global',
+            MARKETING: 'marketing'}
+
+
+def new_recording(graph):
+    """
+    Start the recording of a run.
+
+    The adopters already present in graph are recorded as seeds.
+
+    graph: networkx graph in which the evolution takes place. Its nodes
+           must be numbered from 0 to N - 1.
+    """
+    n_nodes = graph.number_of_nodes()
+    tick = np.full(n_nodes, NOT_ADOPTED, dtype=np.uint16)
+    channel = np.full(n_nodes, NO_CHANNEL, dtype=np.uint8)
+
+    for node_index in graph.nodes():
+        if graph.node[node_index]['adopter'] == 1:
+            tick[node_index] = 0
+            channel[node_index] = SEED
+
+    return dict(tick=tick, channel=channel, time=0)
+
+
+def record_adoption(recording, node_index, channel):
+    """
+    Record that a node adopted in the current evolution step.
+
+    recording: Recording returned by new_recording.
+    node_index: Index of the node.
+    channel: Channel of adoption (see CHANNELS).
+    """
+    recording['tick'][node_index] = recording['time'] + 1
+    recording['channel'][node_index] = channel
+
+
+def get_adopters_mask_at(recording, time):
+    """
+    Boolean array that is True for the adopters after a number of steps.
+
+    recording: Recording returned by new_recording.
+    time: Number of evolution steps.
+    """
+    return recording['tick'] <= time
+
+
+def get_adopters_at(recording, time):
+    """Indexes of the adopters after a number of evolution steps."""
+    return np.flatnonzero(get_adopters_mask_at(recording, time))
+
+
+def get_channels_at(recording, time):
+    """
+    Channel of adoption of each node after a number of evolution steps.
+
+    Nodes that haven't adopted at that time have NO_CHANNEL.
+    """
+    return np.where(get_adopters_mask_at(recording, time),
+                    recording['channel'], NO_CHANNEL)
+
+
+def set_adopters_at(graph, recording, time):
+    """
+    Set the adopter attribute of the nodes of graph to their value
+    after a number of evolution steps.
+
+    This allows to use networkx functions (e.g. to compute connected
+    components of adopters) with recorded runs.
+    """
+    mask = get_adopters_mask_at(recording, time)
+    for node_index in graph.nodes():
+        graph.node[node_index]['adopter'] = int(mask[node_index])
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+"""
+Generate the outputs of a sweep in worker processes while it runs
+
+The aggregates of each parameter value are computed by a pool of worker
+processes as soon as all its replications are ready, so they overlap
+with the simulation of the remaining values. When the sweep finishes,
+each figure is rendered by a different worker, at the same time.
+
+Figures can't be rendered before all values are finished because their
+panels share the same y-axis limits, which depend on all values.
+"""
+
+import multiprocessing
+
+from aggregates import compute_aggregates
+from storage import data_to_array
+from utilities import VARIABLES
+
+
+def _init_worker():
+    """Use a backend that doesn't need a display in worker processes."""
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def _render_output(name, aggregates, set_of_parameters, run, filename):
+    """Generate a single output of a sweep in a worker process."""
+    import matplotlib.pyplot as plt
+
+    from outputs import save_output
+
+    save_output(name, aggregates, set_of_parameters, run, filename)
+    plt.close('all')
+    return name
+
+
+def start_renderer(processes=2):
+    """
+    Start the pool of processes that generate the outputs of a sweep.
+
+    processes: Number of worker processes.
+    """
+    return multiprocessing.Pool(processes, initializer=_init_worker)
+
+
+def submit_aggregates(pool, data, parameters, variables=VARIABLES,
+                      settings=None):
+    """
+    Compute the aggregates of a parameter value in the background.
+
+    pool: Pool returned by start_renderer.
+    data: Contains the output of compute_run for the value.
+    parameters: Parameters used to compute data.
+    variables: Variables of data (see storage.run_variables).
+    settings: Settings of the confidence bands (see
+              aggregates.band_settings).
+
+    Returns: An object whose get method returns the aggregates.
+    """
+    return pool.apply_async(compute_aggregates,
+                            (data_to_array(data, variables), parameters),
+                            dict(settings or {}, variables=variables))
+
+
+def render_outputs(pool, aggregates, set_of_parameters, run, filename,
+                   output):
+    """
+    Generate all outputs of a sweep in parallel and close the pool.
+
+    pool: Pool returned by start_renderer.
+    aggregates: List with the result of submit_aggregates for each entry
+                of set_of_parameters.
+    set_of_parameters: Set of parameters.
+    run: Dictionary of run settings (see all_parameters.py).
+    filename: Base name (without extension) of the files to save.
+    output: Dictionary of outputs to generate (see all_parameters.py).
+    """
+    from outputs import OUTPUTS
+
+    aggregates = [a.get() for a in aggregates]
+
+    jobs = []
+    for name in OUTPUTS:
+        if output[name]:
+            jobs.append(pool.apply_async(_render_output,
+                                         (name, aggregates,
+                                          set_of_parameters, run,
+                                          filename)))
+
+    for job in jobs:
+        job.get()
+
+    pool.close()
+    pool.join()
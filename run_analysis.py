@@ -2,200 +2,1055 @@
 
 """
 Run a complete analysis for a give parameter
+
+Usage:
+    python run_analysis.py [sweep] [options]
+    python run_analysis.py simulate [options]
+    python run_analysis.py plot RESULTS [options]
+    python run_analysis.py batch [PATTERN] [options]
+    python run_analysis.py shard --shard K --shards N --seed S [options]
+    python run_analysis.py merge RESULTS [options]
+    python run_analysis.py catalog [--where NAME=VALUE] [options]
+    python run_analysis.py serve [options]
+    python run_analysis.py submit [options]
+
+Run `python run_analysis.py COMMAND --help` to see the options of each
+command. Settings not given in the command line are taken from
+all_parameters.py.
+
+Plotting and cluster libraries are only imported by the commands that
+need them, so simulations start quickly.
 """
 
-import atexit
-import csv
+import argparse
 import glob
 import json
 import os
 import os.path as osp
-import time
-import subprocess
+import sys
 
-from ipyparallel import Client
-from IPython.core.getipython import get_ipython
+import all_parameters as defaults
 
-from algorithm import compute_run, generate_parameters
-from plots import (multiplot_variable, plot_adopters, plot_adopters_type,
-                   multiplot_adopters_and_global_utility)
-from all_parameters import (PARAMETERS_FILE, RESULTS_DIR, RERUNS_DIR,
-                            SAVED_RESULTS_DIR, output)
-from utilities import (load_parameters_from_file,
-                       get_adopters_percentaje_upto_activation)
+
+COMMANDS = ['sweep', 'simulate', 'plot', 'batch', 'shard', 'merge',
+            'catalog', 'serve', 'submit']
 
 
 #==============================================================================
-# Load parameters from a file to re-run a previous analysis
+# Parameters
 #==============================================================================
-if PARAMETERS_FILE:
-    f = osp.join(SAVED_RESULTS_DIR, PARAMETERS_FILE)
-    if osp.isfile(f):
-        all_parameters = load_parameters_from_file(f)
-        run = all_parameters['run']
-        parameters = all_parameters['parameters']
+def parse_assignment(assignment):
+    """
+    Parse an assignment of the form name=value.
+
+    Values are read as json when possible (e.g. numbers, lists or
+    booleans) and as strings otherwise.
+    """
+    name, value = assignment.split('=', 1)
+    try:
+        value = json.loads(value)
+    except ValueError:
+        pass
+    return name, value
+
+
+def load_analysis(args):
+    """
+    Get the run settings and parameters of an analysis.
+
+    They are taken from a parameters file, if one is given, or from
+    all_parameters.py, and then updated with the command line options.
+
+    Returns: The run and parameters dictionaries, and the parameters file
+             that was loaded (or '').
+    """
+    from utilities import load_parameters_from_file
+
+    parameters_file = args.parameters_file
+    if parameters_file:
+        f = parameters_file
+        if not osp.isfile(f):
+            f = osp.join(defaults.SAVED_RESULTS_DIR, parameters_file)
+        if osp.isfile(f):
+            all_parameters = load_parameters_from_file(f)
+            run = all_parameters['run']
+            parameters = all_parameters['parameters']
+        else:
+            raise Exception('{} does not exist'.format(f))
     else:
-        raise Exception('{} does not exist'.format(f))
-else:
-    # If there's no parameters file to load, used the parameters
-    # saved in all_parameters
-    from all_parameters import parameters, run
+        # If there's no parameters file to load, used the parameters
+        # saved in all_parameters
+        run = dict(defaults.run)
+        parameters = dict(defaults.parameters)
 
+    # Run settings given in the command line
+    for name in ['number_of_times', 'max_time', 'main_parameter',
+                 'parameter_values']:
+        value = getattr(args, name, None)
+        if value is not None:
+            run[name] = value
+    run.update(get_output_settings(args))
 
-#==============================================================================
-# Mapping of parameter names to the names in our article
-#==============================================================================
-article_parameters = dict(
-    randomness = 'r',
-    number_of_neighbors = 'k',
-    social_influence = r'\beta',
-    quality = 'q',
-    number_of_consumers = 'N',
-    activation_sharpness = r'\phi',
-    critical_mass = 'M_c',
-)
+    # Model parameters given in the command line
+    for assignment in args.set:
+        name, value = parse_assignment(assignment)
+        parameters[name] = value
+
+    # Observers given in the command line
+    observers = get_observers(args)
+    if observers:
+        run['observers'] = dict(run.get('observers') or {}, **observers)
+
+    return run, parameters, parameters_file
+
+
+def get_observers(args):
+    """
+    Specification of the observers given in the command line (see
+    observers.parse_observers), checking that they can be saved with the
+    results of a sweep.
+    """
+    from observers import observed_variables
+
+    observers = dict(parse_assignment(a)
+                     for a in getattr(args, 'observe', None) or [])
+    observed_variables(observers)
+    return observers
+
+
+def get_output_settings(args):
+    """
+    Run settings of the outputs given in the command line, i.e. whether
+    to plot cumulative curves and the settings of the confidence bands
+    (see aggregates.band_settings).
+    """
+    settings = {}
+    for name in ['cumulative', 'band', 'confidence', 'n_boot']:
+        value = getattr(args, name, None)
+        if value is not None:
+            settings[name] = value
+    return settings
+
+
+def get_output(args):
+    """Outputs to generate, from the command line or all_parameters.py"""
+    if args.output:
+        return dict((name, name in args.output) for name in defaults.output)
+    else:
+        return dict(defaults.output)
+
+
+def use_agg_backend():
+    """Plot to files with a backend that doesn't need a display."""
+    import matplotlib
+    matplotlib.use('Agg')
 
 
 #==============================================================================
-# Save parameters in a "Results" directory, placed next to this file
+# Commands
 #==============================================================================
-# Create the results directory
-if not osp.isdir(RESULTS_DIR):
-    os.makedirs(RESULTS_DIR)
-
-# Create the reruns directory
-if not osp.isdir(RERUNS_DIR):
-    os.makedirs(RERUNS_DIR)
-
-# Create file name to save parameters
-# It's going to be of the form main_parameter_#.json
-if not PARAMETERS_FILE:
-    name = osp.join(RESULTS_DIR, run['main_parameter'] + '_')
+def simulate(args):
+    """Run a single set of parameters and save its mean time series."""
+    import numpy as np
+
+    from algorithm import compute_run
+    from utilities import (RX_FIELDS, VARIABLES,
+                           get_values_from_compute_run, set_random_state)
+
+    run, parameters, _ = load_analysis(args)
+    if args.seed is not None:
+        set_random_state(args.seed)
+
+    dview = None
+    if args.cluster:
+        from parallel import start_cluster
+        dview = start_cluster()
+
+    data = compute_run(number_of_times=run['number_of_times'],
+                       parameters=parameters,
+                       max_time=run['max_time'],
+                       dview=dview)
+
+    # Mean of each variable per time step
+    header = ['time']
+    columns = []
+    for rx_field in RX_FIELDS:
+        for variable in VARIABLES:
+            values = get_values_from_compute_run(data, rx_field == 'rx',
+                                                 variable)
+            header.append(rx_field + '_' + variable)
+            columns.append(np.mean(values, axis=0))
+
+    if args.output_file:
+        f = open(args.output_file, 'w')
+    else:
+        f = sys.stdout
+    f.write(','.join(header) + '\n')
+    for t in range(run['max_time']):
+        f.write(','.join([str(t)] + ['%g' % c[t] for c in columns]) + '\n')
+    if args.output_file:
+        f.close()
+
+
+def start_engines(args):
+    """
+    Start an IPyparallel cluster and reset its engines, unless the sweep
+    runs without one or in local processes.
+
+    Returns: A direct view of the cluster engines or None.
+    """
+    from parallel import reset_engines, start_cluster
+
+    if args.no_cluster or args.processes:
+        return None
+    dview = start_cluster()
+    if dview is not None:
+        reset_engines(dview)
+    return dview
+
+
+def save_sweep_parameters(args, run, parameters, parameters_file):
+    """
+    Save the parameters of a sweep in a "Results" directory, placed next
+    to this file, or load the ones of the last sweep to resume it.
+
+    Returns: The base name (without extension) of the files to save the
+             results of the sweep to, and its run and parameters.
+    """
+    from utilities import load_parameters_from_file
+
+    # Create the results directory
+    if not osp.isdir(defaults.RESULTS_DIR):
+        os.makedirs(defaults.RESULTS_DIR)
+
+    # Create the reruns directory
+    if not osp.isdir(defaults.RERUNS_DIR):
+        os.makedirs(defaults.RERUNS_DIR)
+
+    # Re-runs of a parameters file only save them when run in shards,
+    # which need a file to load them from
+    if parameters_file:
+        from outputs import rerun_filename
+        filename = rerun_filename(parameters_file, args.resume)
+        if args.shards:
+            with open(filename + '.json', 'w') as f:
+                json.dump(dict(run=run, parameters=parameters), f, indent=4)
+        return filename, run, parameters
+
+    # Create file name to save parameters
+    # It's going to be of the form main_parameter_#.json
+    name = osp.join(defaults.RESULTS_DIR, run['main_parameter'] + '_')
     number = len(glob.glob(name + '*.json'))
-    filename = name + str(number) + '.json'
 
-    # Create a dict with all the needed paramaters
-    all_parameters = dict(
-        run=run,
-        parameters=parameters
-    )
+    if args.resume and number > 0:
+        # Resume the last analysis with the parameters saved for it
+        filename = name + str(number - 1)
+        all_parameters = load_parameters_from_file(filename + '.json')
+        run = all_parameters['run']
+        parameters = all_parameters['parameters']
+    else:
+        filename = name + str(number)
 
-    # Save all parameters
-    with open(filename, 'w') as f:
-        json.dump(all_parameters, f, indent=4)
+        # Create a dict with all the needed paramaters
+        all_parameters = dict(
+            run=run,
+            parameters=parameters
+        )
 
+        # Save all parameters
+        with open(filename + '.json', 'w') as f:
+            json.dump(all_parameters, f, indent=4)
 
-#==============================================================================
-# Main variables
-#==============================================================================
-# Remove the parameter we want to study
-parameters.pop(run['main_parameter'])
-
-# Start IPyparallel cluster
-try:
-    rc = Client()
-    dview = rc[:]
-except:
+    return filename, run, parameters
+
+
+def get_seed(args):
+    """Seed of a whole sweep, from the command line or a random one."""
+    import numpy as np
+
+    if args.seed is not None:
+        return args.seed
+    return int(np.random.randint(2**31 - 1))
+
+
+def run_sweep_shards(filename, seed, shards, output):
+    """
+    Run a sweep in shards, launched as local processes, and generate its
+    outputs from their merged results.
+
+    filename: Base name of the files of the sweep, with its parameters
+              saved in a json file.
+    """
+    from catalog import register_results
+    from sharding import launch_shards
+
+    launch_shards(filename + '.json', filename, seed, shards)
+    save_merged_outputs(filename, output)
+    register_results(filename)
+
+
+def load_sweep_replications(args, filename, run, seed):
+    """
+    Load the replications saved in the checkpoint of a sweep, if it's
+    resumed, or start a new one.
+
+    Returns: The header of the checkpoint and a dictionary that maps the
+             (value, replication) index of each replication to its
+             results.
+    """
+    from checkpoint import check_header, load_checkpoint, new_header
+
+    checkpoint_file = filename + '.log'
+    if args.resume and osp.isfile(checkpoint_file):
+        header, panels = load_checkpoint(checkpoint_file)
+        check_header(header, run)
+    else:
+        header = new_header(run, seed)
+        panels = {}
+    return header, panels
+
+
+def start_sweep_renderer(args, run, set_of_parameters, output):
+    """
+    Start the processes that generate the outputs of a sweep while it's
+    simulated.
+
+    Returns: A dictionary with the pool of processes and the aggregates
+             submitted for each value, or None if there's nothing to
+             generate.
+    """
+    if not any(output.values()) or args.render_processes <= 0:
+        return None
+
+    use_agg_backend()
+    from rendering import start_renderer
+    return dict(pool=start_renderer(args.render_processes),
+                run=run,
+                set_of_parameters=set_of_parameters,
+                aggregates=[None] * len(set_of_parameters))
+
+
+def finish_sweep_value(renderer, panels, i):
+    """Compute the aggregates of a value once it's finished."""
+    if renderer is None:
+        return
+
+    from aggregates import band_settings
+    from rendering import submit_aggregates
+    from storage import run_variables
+
+    run = renderer['run']
+    data = [panels[(i, r)] for r in range(run['number_of_times'])]
+    renderer['aggregates'][i] = submit_aggregates(
+        renderer['pool'], data, renderer['set_of_parameters'][i],
+        run_variables(run), band_settings(run))
+
+
+def stream_sweep_tasks(args, run, set_of_parameters, seeds, done, dview):
+    """
+    Run the replications of a sweep that are not done yet, in local
+    workers or a cluster, sending its parameters to them only once.
+
+    seeds: Seeds of all replications (see parallel.replication_seeds).
+    done: Indexes of the replications already done.
+    dview: Direct view instance from an ipyparallel cluster (or None).
+
+    Yields: The results of the replications as they're finished.
+    """
+    from parallel import (make_tasks, release_parameters, share_parameters,
+                          start_local_workers, stop_local_workers,
+                          stream_local_tasks, stream_tasks)
+    from storage import run_variables
+
+    workers = None
+    shared = None
+    if args.processes:
+        workers = start_local_workers(set_of_parameters,
+                                      run['number_of_times'],
+                                      run['max_time'], args.processes,
+                                      run_variables(run))
+        shared = workers['shared']
+    elif dview is not None:
+        shared = share_parameters(dview, set_of_parameters)
+
+    tasks = make_tasks(set_of_parameters, run['number_of_times'],
+                       run['max_time'], seeds, done=done,
+                       observers=run.get('observers'),
+                       instrument=args.instrument, shared=shared)
+    if workers is not None:
+        results = stream_local_tasks(tasks, workers)
+    else:
+        results = stream_tasks(tasks, dview)
+
+    finished = False
     try:
-        # Get ipcluster path
-        HERE = osp.abspath(osp.dirname(__file__))
-        ipcluster_path = osp.join(HERE, 'envs', 'default', '{}', 'ipcluster')
-        if os.name == 'nt':
-            ipcluster_path = ipcluster_path.format('Scripts')
+        for result in results:
+            yield result
+        finished = True
+    finally:
+        if shared is not None:
+            release_parameters(dview, shared)
+        # Workers are terminated if the generator is closed early or a
+        # replication fails
+        if workers is not None:
+            stop_local_workers(workers, terminate=not finished)
+
+
+def simulate_sweep(args, filename, run, set_of_parameters, header, panels,
+                   dview=None, renderer=None):
+    """
+    Run the simulation of a sweep, saving each replication to its
+    checkpoint as soon as it's finished.
+
+    filename: Base name of the files of the sweep.
+    header: Header of the checkpoint (see load_sweep_replications).
+    panels: Replications already done, indexed by (value, replication).
+            The new ones are added to it.
+    dview: Direct view instance from an ipyparallel cluster.
+    renderer: Processes that generate the outputs (see
+              start_sweep_renderer).
+    """
+    from checkpoint import append_result, open_checkpoint
+    from parallel import replication_seeds
+    from storage import run_variables
+    from telemetry import finish_progress, new_progress, update_progress
+
+    # Seeds of all replications
+    seeds = replication_seeds(header['seed'], len(set_of_parameters),
+                              run['number_of_times'])
+
+    # Variables saved for each replication, with the ones of observers
+    variables = run_variables(run)
+
+    # Values already finished in the checkpoint
+    finished = [0] * len(set_of_parameters)
+    for (i, replication) in panels:
+        finished[i] += 1
+    for i in range(len(set_of_parameters)):
+        if finished[i] == run['number_of_times']:
+            finish_sweep_value(renderer, panels, i)
+
+    # Show progress and save it to a log
+    progress = new_progress([run['number_of_times']] * len(set_of_parameters),
+                            filename + '.progress', done=finished)
+
+    # Counters of all replications run by the workers
+    counters = None
+    if args.instrument:
+        from instrumentation import merge_counters, new_counters
+        counters = new_counters()
+
+    results = stream_sweep_tasks(args, run, set_of_parameters, seeds,
+                                 panels, dview)
+    checkpoint = open_checkpoint(filename + '.log', header,
+                                 resume=args.resume)
+    try:
+        for result in results:
+            append_result(checkpoint, result, variables)
+            if 'panel' in result:
+                panels[result['index']] = result['panel']
+            else:
+                # Local workers write their results to shared memory
+                panels[result['index']] = result['values']
+            if counters is not None:
+                merge_counters(counters, result['counters'])
+            update_progress(progress, result)
+            value, replication = result['index']
+            finished[value] += 1
+            if finished[value] == run['number_of_times']:
+                finish_sweep_value(renderer, panels, value)
+    finally:
+        checkpoint.close()
+        results.close()
+    finish_progress(progress)
+
+    # Save counters next to the parameters of the analysis
+    if counters is not None:
+        from instrumentation import save_counters
+        save_counters(filename + '.counters', counters)
+
+
+def save_sweep_results(filename, run, set_of_parameters, panels, seed):
+    """
+    Save all replications of a sweep in binary format, to plot them
+    again without running the simulation.
+    """
+    from storage import save_results
+
+    data = []
+    for i in range(len(set_of_parameters)):
+        data.append([panels[(i, r)] for r in range(run['number_of_times'])])
+    save_results(filename, data, set_of_parameters, run,
+                 metadata=dict(seed=seed))
+
+
+def save_sweep_outputs(filename, run, set_of_parameters, output,
+                       renderer=None):
+    """
+    Generate the plots and csv files of a sweep, with the processes
+    started for them or from its saved results.
+    """
+    if renderer is not None:
+        from rendering import render_outputs
+        render_outputs(renderer['pool'], renderer['aggregates'],
+                       set_of_parameters, run, filename, output)
+    elif any(output.values()):
+        use_agg_backend()
+        from outputs import save_outputs
+        from storage import load_results
+        results, _ = load_results(filename)
+        save_outputs(results, set_of_parameters, run, filename, output)
+
+
+def sweep(args):
+    """Run the simulation for several values of the main parameter."""
+    from algorithm import generate_parameters
+    from catalog import register_results
+
+    run, parameters, parameters_file = load_analysis(args)
+    output = get_output(args)
+
+    if args.profile:
+        profile_sweep(run, parameters, output, start_engines(args),
+                      args.profile_replications)
+        return
+
+    filename, run, parameters = save_sweep_parameters(args, run, parameters,
+                                                      parameters_file)
+    seed = get_seed(args)
+
+    if args.shards:
+        run_sweep_shards(filename, seed, args.shards, output)
+        return
+
+    # Generating different sets of parameters, without the parameter we
+    # want to study
+    parameters.pop(run['main_parameter'])
+    set_of_parameters = generate_parameters(parameters,
+                                            run['main_parameter'],
+                                            run['parameter_values'])
+
+    dview = start_engines(args)
+    header, panels = load_sweep_replications(args, filename, run, seed)
+    renderer = start_sweep_renderer(args, run, set_of_parameters, output)
+    simulate_sweep(args, filename, run, set_of_parameters, header, panels,
+                   dview, renderer)
+
+    save_sweep_results(filename, run, set_of_parameters, panels,
+                       header['seed'])
+    del panels
+
+    save_sweep_outputs(filename, run, set_of_parameters, output, renderer)
+
+    # Add the analysis to the catalog of results
+    register_results(filename)
+
+
+def plot(args):
+    """Generate the plots and csv files of a previous sweep."""
+    use_agg_backend()
+
+    from outputs import save_outputs
+    from storage import load_results
+
+    filename = osp.splitext(args.results)[0]
+    if osp.isfile(filename + '.npy'):
+        data, metadata = load_results(filename)
+        run = metadata['run']
+        set_of_parameters = metadata['set_of_parameters']
+    else:
+        # Sweeps that were interrupted only have a checkpoint
+        run, set_of_parameters, data = load_sweep_checkpoint(
+            filename, args.parameters_file)
+
+    run.update(get_output_settings(args))
+    save_outputs(data, set_of_parameters, run, filename, get_output(args))
+
+
+def load_sweep_checkpoint(filename, parameters_file=None):
+    """
+    Load the replications saved in the checkpoint of a sweep.
+
+    filename: Base name (without extension) of the results of the sweep.
+    parameters_file: Parameters file of the sweep (by default
+                     filename.json).
+
+    Returns: The run settings and set of parameters of the sweep and the
+             list of replications computed for each set of parameters.
+    """
+    from algorithm import generate_parameters
+    from checkpoint import load_checkpoint
+    from utilities import load_parameters_from_file
+
+    header, panels = load_checkpoint(filename + '.log')
+
+    # Parameters of the sweep
+    if not parameters_file:
+        parameters_file = filename + '.json'
+    all_parameters = load_parameters_from_file(parameters_file)
+    run = all_parameters['run']
+    parameters = all_parameters['parameters']
+
+    # Remove the parameter we want to study
+    parameters.pop(run['main_parameter'])
+
+    set_of_parameters = generate_parameters(parameters,
+                                            run['main_parameter'],
+                                            run['parameter_values'])
+
+    data = []
+    for i in range(len(set_of_parameters)):
+        data.append([panels[(i, r)] for r in range(run['number_of_times'])
+                     if (i, r) in panels])
+
+    return run, set_of_parameters, data
+
+
+def profile_sweep(run, parameters, output, dview=None, number_of_times=5):
+    """
+    Profile a scaled-down version of a sweep.
+
+    It runs number_of_times replications for each value of the main
+    parameter, computes their aggregates and generates their outputs,
+    sampling the stacks of each phase. Replications are profiled in the
+    processes that run them (e.g. the engines of a cluster).
+
+    The stacks are saved in RESULTS_DIR/profile_main_parameter.folded,
+    to draw them with flamegraph.pl or speedscope, and the functions with
+    the most samples in RESULTS_DIR/profile_main_parameter.txt. Outputs
+    are saved with the same base name.
+    """
+    use_agg_backend()
+
+    from aggregates import band_settings, compute_aggregates
+    from algorithm import generate_parameters
+    from outputs import save_outputs
+    from parallel import make_tasks, stream_tasks
+    from profiling import (merge_stacks, save_folded_stacks, save_summary,
+                           start_sampler, stop_sampler)
+
+    if not osp.isdir(defaults.RESULTS_DIR):
+        os.makedirs(defaults.RESULTS_DIR)
+    filename = osp.join(defaults.RESULTS_DIR,
+                        'profile_' + run['main_parameter'])
+
+    run = dict(run, number_of_times=number_of_times)
+    parameters = dict(parameters)
+    parameters.pop(run['main_parameter'])
+    set_of_parameters = generate_parameters(parameters,
+                                            run['main_parameter'],
+                                            run['parameter_values'])
+
+    # Simulation, profiled where replications are run
+    stacks = {}
+    data = [[] for p in set_of_parameters]
+    tasks = make_tasks(set_of_parameters, number_of_times, run['max_time'],
+                       profile=True)
+    for result in stream_tasks(tasks, dview):
+        data[result['index'][0]].append(result['panel'])
+        merge_stacks(stacks, result['profile'], root='simulation')
+
+    # Aggregation
+    sampler = start_sampler('aggregation')
+    aggregates = [compute_aggregates(d, p, **band_settings(run))
+                  for d, p in zip(data, set_of_parameters)]
+    merge_stacks(stacks, stop_sampler(sampler))
+
+    # Plotting
+    sampler = start_sampler('plotting')
+    save_outputs(aggregates, set_of_parameters, run, filename, output)
+    merge_stacks(stacks, stop_sampler(sampler))
+
+    save_folded_stacks(filename + '.folded', stacks)
+    save_summary(filename + '.txt', stacks,
+                 title='Profile of a sweep of {} with {} replications per '
+                       'value'.format(run['main_parameter'],
+                                      number_of_times))
+
+
+def shard(args):
+    """Run a shard of a sweep."""
+    from algorithm import generate_parameters
+    from sharding import run_shard
+
+    run, parameters, parameters_file = load_analysis(args)
+
+    # Remove the parameter we want to study
+    parameters.pop(run['main_parameter'])
+    set_of_parameters = generate_parameters(parameters,
+                                            run['main_parameter'],
+                                            run['parameter_values'])
+
+    filename = args.name
+    if not filename:
+        if parameters_file:
+            name = osp.splitext(osp.basename(parameters_file))[0]
         else:
-            ipcluster_path = ipcluster_path.format('bin')
+            name = run['main_parameter']
+        filename = osp.join(defaults.RESULTS_DIR, name)
+    if osp.dirname(filename) and not osp.isdir(osp.dirname(filename)):
+        os.makedirs(osp.dirname(filename))
 
-        proc = subprocess.Popen([ipcluster_path, "start", "-n", "8"])
-        atexit.register(proc.terminate)
-        time.sleep(20)
-        rc = Client()
-        dview = rc[:]
-    except:
-        dview = None
+    run_shard(filename, run, set_of_parameters, args.seed, args.shard,
+              args.shards, quiet=args.quiet)
 
 
-#==============================================================================
-# Simulation
-#==============================================================================
-# Generating different sets of parameters
-set_of_parameters = generate_parameters(parameters,
-                                        run['main_parameter'],
-                                        run['parameter_values'])
-
-# Reset the engines
-if dview is not None:
-    get_ipython().magic('px %reset -f')
-    get_ipython().magic('px %reload_ext autoreload')
-    get_ipython().magic('px %autoreload 2')
-
-# Run the simulation
-data = []
-for p in set_of_parameters:
-    print(len(data))
-    p_data = compute_run(number_of_times=run['number_of_times'],
-                         parameters=p,
-                         max_time=run['max_time'],
-                         dview=dview)
-    data.append(p_data)
+def merge(args):
+    """Merge the shards of a sweep and generate its outputs."""
+    from catalog import register_results
+    from sharding import merge_shards
 
-#==============================================================================
-# Plotting
-#==============================================================================
-# File to save the fig
-if PARAMETERS_FILE:
-    name = osp.splitext(PARAMETERS_FILE)[0] + '_'
-    number = len(glob.glob(osp.join(RERUNS_DIR, name) + '*[!types].png'))
-    filename = name + str(number)
-    filename = osp.join(RERUNS_DIR, filename)
-else:
-    filename = osp.splitext(filename)[0]
-
-
-# Generate plots
-if output['plot_adopters_and_global_utility']:
-    multiplot_adopters_and_global_utility(
-        multiple_data=data,
-        set_of_params=set_of_parameters,
-        par_name=article_parameters[run['main_parameter']],
-        par_values=run['parameter_values'],
-        cumulative=run['cumulative'],
-        filename=filename + '.png'
-    )
-
-# Plot adopters with and without reflexivity
-if output['plot_adopters']:
-    multiplot_variable(plot_func=plot_adopters,
-                       multiple_data=data,
-                       set_of_params=set_of_parameters,
-                       par_name=article_parameters[run['main_parameter']],
-                       par_values=run['parameter_values'],
-                       cumulative=run['cumulative'],
-                       filename=filename + '_adopters.png',
-                       ylim_bottom=None,
-                       show_activation_time=True)
-
-# Plot adopters per utility and marketing
-if output['plot_adopters_type']:
-    multiplot_variable(plot_func=plot_adopters_type,
-                       multiple_data=data,
-                       set_of_params=set_of_parameters,
-                       par_name=article_parameters[run['main_parameter']],
-                       par_values=run['parameter_values'],
-                       cumulative=run['cumulative'],
-                       filename=filename + '_types.png',
-                       ylim_bottom=None,
-                       show_activation_time=True,
-                       types=['local_or_global', 'local', 'marketing'],
-                       include_adopters=True)
+    filename = osp.splitext(args.results)[0]
+    merge_shards(filename)
+    save_merged_outputs(filename, get_output(args), get_output_settings(args))
+    register_results(filename)
+
+
+def save_merged_outputs(filename, output, settings=None):
+    """
+    Generate the outputs of a sweep from its saved results.
+
+    settings: Run settings of the outputs that replace the saved ones
+              (see get_output_settings).
+    """
+    if not any(output.values()):
+        return
+
+    use_agg_backend()
+    from outputs import save_outputs
+    from storage import load_results
+
+    data, metadata = load_results(filename)
+    run = dict(metadata['run'], **(settings or {}))
+    save_outputs(data, metadata['set_of_parameters'], run, filename, output)
+
+
+def catalog(args):
+    """Find previous analyses in the catalog of results."""
+    from catalog import find_runs, index_directory
+
+    for directory in args.index or []:
+        added = index_directory(directory)
+        print('Added {} analyses of {} to the catalog'.format(added,
+                                                              directory))
+
+    filters = dict(parse_assignment(a) for a in args.where)
+    for entry in find_runs(**filters):
+        values = [entry['run']['parameter_values'][i]
+                  for i in entry['values']]
+        print('{}: {} = {}, {} replications, seed {}, results {}'.format(
+              entry['name'], entry['main_parameter'], values,
+              entry['number_of_times'], entry['seed'],
+              entry['results_file'] or '-'))
+
+
+def serve(args):
+    """Start the local service that runs sweeps in warm workers."""
+    from service import serve as start_service, shutdown
+
+    if args.stop:
+        shutdown(args.port)
+    else:
+        start_service(args.processes, args.port, args.pool_size)
+
+
+def submit(args):
+    """Submit a sweep to the local service."""
+    from service import submit as submit_job, wait_job
+
+    run, parameters, parameters_file = load_analysis(args)
+    spec = dict(run=run, parameters=parameters, priority=args.priority,
+                seed=args.seed, name=args.name)
+    if run.get('observers'):
+        spec['observers'] = run.pop('observers')
+    handle = submit_job(spec, args.port)
+    if args.wait:
+        handle = wait_job(handle['id'], args.port)
+    print(json.dumps(handle, indent=4, sort_keys=True))
+
+
+def batch(args):
+    """Re-run several parameters files as a single batch."""
+    use_agg_backend()
+
+    from batch import run_batch
+    from parallel import reset_engines, start_cluster
+
+    if not osp.isdir(defaults.RERUNS_DIR):
+        os.makedirs(defaults.RERUNS_DIR)
+
+    dview = None
+    if not args.no_cluster and not args.processes:
+        dview = start_cluster()
+        if dview is not None:
+            reset_engines(dview)
+
+    run_batch(sorted(glob.glob(args.pattern)), dview,
+              observers=get_observers(args), seed=args.seed,
+              processes=args.processes)
 
 
 #==============================================================================
-# Save adopters percentaje up to activation to a csv file
+# Command line arguments
 #==============================================================================
-if output['save_adopters_percentage']:
-    with open(filename + '.csv', 'wb') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow([run['main_parameter'], 'Percentaje'])
-        for d, p, v in zip(data, set_of_parameters, run['parameter_values']):
-            percentaje = get_adopters_percentaje_upto_activation(d, p)
-            writer.writerow([v, percentaje])
+def add_parameters_arguments(parser):
+    """Arguments to change the settings and parameters of an analysis."""
+    parser.add_argument('--parameters-file',
+                        default=defaults.PARAMETERS_FILE,
+                        help='Parameters file to load, either a path or the '
+                             'name of a file in the Saved directory')
+    parser.add_argument('--set', action='append', default=[],
+                        metavar='NAME=VALUE',
+                        help='Set a parameter of the model, e.g. '
+                             'graph_type=erdos_renyi. It can be given '
+                             'several times')
+    parser.add_argument('--number-of-times', type=int,
+                        help='Number of replications')
+    parser.add_argument('--max-time', type=int,
+                        help='Time to stop the algorithm')
+
+
+def add_observers_arguments(parser):
+    """Arguments to add observers of additional metrics to a sweep."""
+    parser.add_argument('--observe', action='append', default=[],
+                        metavar='NAME=EVERY',
+                        help='Save a metric of observers.py (homophily, '
+                             'adopters_fraction, number_of_clusters or '
+                             'largest_cluster) with the results, sampled '
+                             'every EVERY ticks or only at the final one '
+                             '(EVERY=final). It can be given several times')
+
+
+def add_output_arguments(parser):
+    """Arguments to choose the outputs to generate."""
+    parser.add_argument('--output', action='append',
+                        choices=sorted(defaults.output.keys()),
+                        help='Output to generate. It can be given several '
+                             'times (by default, the ones set in '
+                             'all_parameters.py are generated)')
+    parser.add_argument('--cumulative', action='store_true', default=None,
+                        help='Plot cumulative curves')
+    parser.add_argument('--band', choices=['bootstrap', 'analytic'],
+                        help='Method to compute confidence bands (bootstrap '
+                             'by default)')
+    parser.add_argument('--confidence', type=float,
+                        help='Confidence level of the bands, in percent (68 '
+                             'by default)')
+    parser.add_argument('--n-boot', type=int,
+                        help='Number of bootstrap resamples of the bands '
+                             '(1000 by default)')
+
+
+def get_parser():
+    """Parser of the command line arguments."""
+    parser = argparse.ArgumentParser(
+        description='Run a complete analysis for a given parameter')
+    subparsers = parser.add_subparsers(dest='command')
+
+    # Sweep
+    sweep_parser = subparsers.add_parser(
+        'sweep', help='Run the simulation for several values of a parameter '
+                      'and generate its outputs (default command)')
+    add_parameters_arguments(sweep_parser)
+    add_observers_arguments(sweep_parser)
+    add_output_arguments(sweep_parser)
+    sweep_parser.add_argument('--main-parameter',
+                              help='Parameter to study')
+    sweep_parser.add_argument('--values', dest='parameter_values',
+                              type=float, nargs='+',
+                              help='Values of the main parameter')
+    sweep_parser.add_argument('--resume', action='store_true',
+                              help='Resume the last analysis from its '
+                                   'checkpoint, computing only the missing '
+                                   'replications')
+    sweep_parser.add_argument('--no-cluster', action='store_true',
+                              help="Run in this process instead of an "
+                                   "IPyparallel cluster")
+    sweep_parser.add_argument('--seed', type=int,
+                              help='Seed of the sweep, used to compute the '
+                                   'seed of each replication')
+    sweep_parser.add_argument('--shards', type=int,
+                              help='Run the sweep in this number of shards, '
+                                   'as local processes, and merge them '
+                                   '(it cannot be resumed)')
+    sweep_parser.add_argument('--processes', type=int,
+                              help='Run in this number of local processes, '
+                                   'which write their results to shared '
+                                   'memory, instead of an IPyparallel '
+                                   'cluster')
+    sweep_parser.add_argument('--render-processes', type=int, default=2,
+                              help='Number of processes that generate '
+                                   'the outputs while simulating (0 to '
+                                   'generate them at the end in this '
+                                   'process)')
+    sweep_parser.add_argument('--instrument', action='store_true',
+                              help='Collect the time and number of '
+                                   'operations of each phase of the '
+                                   'algorithm and save them to '
+                                   'RESULTS.counters, as json')
+    sweep_parser.add_argument('--profile', action='store_true',
+                              help='Profile a scaled-down version of the '
+                                   'sweep (simulation, aggregation and '
+                                   'plotting) and save its stacks and a '
+                                   'summary to Results/profile_*')
+    sweep_parser.add_argument('--profile-replications', type=int, default=5,
+                              help='Number of replications per value to '
+                                   'run when profiling')
+
+    # Simulate
+    simulate_parser = subparsers.add_parser(
+        'simulate', help='Run the simulation for a single set of parameters '
+                         'and print the mean of each variable per time '
+                         'step as csv')
+    add_parameters_arguments(simulate_parser)
+    simulate_parser.add_argument('--seed', type=int,
+                                 help='Seed of the random number generators')
+    simulate_parser.add_argument('--cluster', action='store_true',
+                                 help='Run in an IPyparallel cluster')
+    simulate_parser.add_argument('--output-file',
+                                 help='Save results to this csv file')
+
+    # Plot
+    plot_parser = subparsers.add_parser(
+        'plot', help='Generate the outputs of a previous sweep without '
+                     'running it again')
+    plot_parser.add_argument('results',
+                             help='Base name of the results of the sweep, '
+                                  'e.g. Results/social_influence_0')
+    plot_parser.add_argument('--parameters-file',
+                             help='Parameters file of the sweep, only used '
+                                  'if its results were not saved because '
+                                  'it was interrupted (by default '
+                                  'RESULTS.json)')
+    add_output_arguments(plot_parser)
+
+    # Batch
+    batch_parser = subparsers.add_parser(
+        'batch', help='Re-run several parameters files as a single batch')
+    batch_parser.add_argument(
+        'pattern', nargs='?',
+        default=osp.join(defaults.SAVED_RESULTS_DIR, '*.json'),
+        help='Glob pattern of the parameters files to re-run')
+    batch_parser.add_argument('--no-cluster', action='store_true',
+                              help="Run in local processes instead of an "
+                                   "IPyparallel cluster (also when it "
+                                   "can't be started)")
+    batch_parser.add_argument('--processes', type=int,
+                              help='Run in this number of local processes, '
+                                   'instead of an IPyparallel cluster (by '
+                                   'default, the number of cpus when there '
+                                   'is no cluster)')
+    batch_parser.add_argument('--seed', type=int,
+                              help='Seed of the whole batch, to reproduce '
+                                   'it with the same files')
+    add_observers_arguments(batch_parser)
+
+    # Shard
+    shard_parser = subparsers.add_parser(
+        'shard', help='Run a shard of a sweep, e.g. in one of several hosts')
+    add_parameters_arguments(shard_parser)
+    add_observers_arguments(shard_parser)
+    shard_parser.add_argument('--main-parameter',
+                              help='Parameter to study')
+    shard_parser.add_argument('--values', dest='parameter_values',
+                              type=float, nargs='+',
+                              help='Values of the main parameter')
+    shard_parser.add_argument('--shard', type=int, required=True,
+                              help='Index of the shard, from 0 to SHARDS - 1')
+    shard_parser.add_argument('--shards', type=int, required=True,
+                              help='Number of shards')
+    shard_parser.add_argument('--seed', type=int, required=True,
+                              help='Seed of the sweep, which must be the '
+                                   'same for all shards')
+    shard_parser.add_argument('--name',
+                              help='Base name of the results of the sweep '
+                                   '(by default, Results/ and the name of '
+                                   'the parameters file)')
+    shard_parser.add_argument('--quiet', action='store_true',
+                              help="Don't show progress in the terminal")
+
+    # Catalog
+    catalog_parser = subparsers.add_parser(
+        'catalog', help='Find previous analyses by their parameters')
+    catalog_parser.add_argument('--where', action='append', default=[],
+                                metavar='NAME=VALUE',
+                                help='Value of a parameter or run setting '
+                                     'of the analyses to find. It can be '
+                                     'given several times')
+    catalog_parser.add_argument('--index', nargs='+', metavar='DIRECTORY',
+                                help='Add the analyses saved in these '
+                                     'directories (e.g. Saved) to the '
+                                     'catalog first')
+
+    # Serve
+    serve_parser = subparsers.add_parser(
+        'serve', help='Start a local service that runs sweeps submitted to '
+                      'it in warm worker processes')
+    serve_parser.add_argument('--processes', type=int,
+                              help='Number of worker processes (by '
+                                   'default, the number of cpus)')
+    serve_parser.add_argument('--port', type=int, default=8642,
+                              help='Port of the service in localhost')
+    serve_parser.add_argument('--pool-size', type=int, default=32,
+                              help='Number of graphs kept by each worker '
+                                   'for each set of graph parameters, '
+                                   'shared by replications with the same '
+                                   'seed modulo this number (0 to generate '
+                                   'a graph for every replication)')
+    serve_parser.add_argument('--stop', action='store_true',
+                              help='Stop the service running in this port')
+
+    # Submit
+    submit_parser = subparsers.add_parser(
+        'submit', help='Submit a sweep to the local service and print its '
+                       'handle')
+    add_parameters_arguments(submit_parser)
+    add_observers_arguments(submit_parser)
+    submit_parser.add_argument('--main-parameter',
+                               help='Parameter to study')
+    submit_parser.add_argument('--values', dest='parameter_values',
+                               type=float, nargs='+',
+                               help='Values of the main parameter')
+    submit_parser.add_argument('--priority', type=int, default=0,
+                               help='Priority of the sweep (higher ones '
+                                    'are run first)')
+    submit_parser.add_argument('--seed', type=int,
+                               help='Seed of the sweep')
+    submit_parser.add_argument('--name',
+                               help='Base name of its results in '
+                                    'Results/Service')
+    submit_parser.add_argument('--port', type=int, default=8642,
+                               help='Port of the service in localhost')
+    submit_parser.add_argument('--wait', action='store_true',
+                               help='Wait until the sweep is finished')
+
+    # Merge
+    merge_parser = subparsers.add_parser(
+        'merge', help='Merge the shards of a sweep and generate its outputs')
+    merge_parser.add_argument('results',
+                              help='Base name of the results of the sweep, '
+                                   'e.g. Results/social_influence_0')
+    add_output_arguments(merge_parser)
+
+    return parser
+
+
+def main(argv=None):
+    """Run the command given in the command line."""
+    if argv is None:
+        argv = sys.argv[1:]
+
+    # Sweep is the default command
+    if not argv or (argv[0] not in COMMANDS and
+                    argv[0] not in ['-h', '--help']):
+        argv = ['sweep'] + argv
+
+    args = get_parser().parse_args(argv)
+    commands = dict(sweep=sweep, simulate=simulate, plot=plot, batch=batch,
+                    shard=shard, merge=merge, catalog=catalog, serve=serve,
+                    submit=submit)
+    commands[args.command](args)
+
+
+if __name__ == '__main__':
+    main()
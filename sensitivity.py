@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+
+"""
+Variance-based global sensitivity analysis (Sobol indices)
+
+Parameter points are generated with Saltelli's design from a Sobol
+quasi-random sequence, all their replications are run as a single batch
+(load balanced between the engines of a cluster, which receive the
+parameters of all points only once), and each point is reduced to its
+summary outputs as soon as its replications finish, so large designs
+don't keep trajectories in memory.
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from parallel import (make_tasks, release_parameters, share_parameters,
+                      stream_tasks)
+from surrogate import OUTPUTS, summarize_run
+
+
+# Primitive polynomials (degree s, coefficients a) and initial direction
+# numbers m of the Sobol sequence, taken from Joe and Kuo (2008),
+# new-joe-kuo-6.21201, for dimensions 2 to 21.
+SOBOL_DIRECTIONS = [
+    (1, 0, [1]),
+    (2, 1, [1, 3]),
+    (3, 1, [1, 3, 1]),
+    (3, 2, [1, 1, 1]),
+    (4, 1, [1, 1, 3, 3]),
+    (4, 4, [1, 3, 5, 13]),
+    (5, 2, [1, 1, 5, 5, 17]),
+    (5, 4, [1, 1, 5, 5, 5]),
+    (5, 7, [1, 1, 7, 11, 19]),
+    (5, 11, [1, 1, 5, 1, 1]),
+    (5, 13, [1, 1, 1, 3, 11]),
+    (5, 14, [1, 3, 5, 5, 31]),
+    (6, 1, [1, 3, 3, 9, 7, 49]),
+    (6, 13, [1, 1, 1, 15, 21, 21]),
+    (6, 16, [1, 3, 1, 13, 27, 49]),
+    (6, 19, [1, 1, 1, 15, 7, 5]),
+    (6, 22, [1, 3, 1, 15, 13, 25]),
+    (6, 25, [1, 1, 5, 5, 19, 61]),
+    (7, 1, [1, 3, 7, 11, 23, 15, 103]),
+    (7, 4, [1, 3, 7, 13, 13, 15, 69]),
+]
+
+# Number of bits of the Sobol sequence
+SOBOL_BITS = 30
+
+
+#==============================================================================
+# Designs
+#==============================================================================
+def _direction_numbers(dimension):
+    """Direction numbers (scaled to SOBOL_BITS bits) of a dimension."""
+    v = np.zeros(SOBOL_BITS, dtype=np.int64)
+    if dimension == 0:
+        for i in range(SOBOL_BITS):
+            v[i] = 1 << (SOBOL_BITS - 1 - i)
+        return v
+
+    s, a, m = SOBOL_DIRECTIONS[dimension - 1]
+    for i in range(min(s, SOBOL_BITS)):
+        v[i] = m[i] << (SOBOL_BITS - 1 - i)
+    for i in range(s, SOBOL_BITS):
+        v[i] = v[i - s] ^ (v[i - s] >> s)
+        for k in range(1, s):
+            if (a >> (s - 1 - k)) & 1:
+                v[i] ^= v[i - k]
+    return v
+
+
+def sobol_sequence(n_points, dimensions, skip=1):
+    """
+    First n_points of a Sobol sequence in the unit hypercube.
+
+    n_points: Number of points.
+    dimensions: Number of dimensions (at most 21).
+    skip: Number of initial points to skip (the first one is all zeros).
+    """
+    if dimensions > len(SOBOL_DIRECTIONS) + 1:
+        raise ValueError("Sobol sequences are only available for up to "
+                         "{} dimensions".format(len(SOBOL_DIRECTIONS) + 1))
+
+    index = np.arange(skip, skip + n_points, dtype=np.int64)
+    gray = index ^ (index >> 1)
+
+    points = np.zeros((n_points, dimensions))
+    for d in range(dimensions):
+        v = _direction_numbers(d)
+        x = np.zeros(n_points, dtype=np.int64)
+        for bit in range(SOBOL_BITS):
+            x ^= ((gray >> bit) & 1) * v[bit]
+        points[:, d] = x / 2 ** SOBOL_BITS
+    return points
+
+
+def saltelli_design(bounds, n_base):
+    """
+    Saltelli's design to estimate first-order and total Sobol indices.
+
+    bounds: List of (low, high) tuples with the range of each parameter.
+    n_base: Number of base points (a power of 2 is recommended).
+
+    Returns: An array with n_base * (d + 2) rows, where d is the number
+             of parameters. Rows are ordered as the blocks A, B and
+             AB_i (A with column i taken from B) for i = 1, ..., d.
+    """
+    d = len(bounds)
+    base = sobol_sequence(n_base, 2 * d)
+    A = base[:, :d]
+    B = base[:, d:]
+
+    blocks = [A, B]
+    for i in range(d):
+        AB = A.copy()
+        AB[:, i] = B[:, i]
+        blocks.append(AB)
+
+    low, high = np.array(bounds, dtype=float).T
+    return low + np.vstack(blocks) * (high - low)
+
+
+#==============================================================================
+# Indices
+#==============================================================================
+def _first_order_and_total(fA, fB, fAB):
+    """
+    Saltelli (2010) first-order and Jansen total estimators.
+
+    fA, fB: Arrays of shape (..., n_base).
+    fAB: Array of shape (d, ..., n_base).
+    """
+    variance = np.var(np.concatenate([fA, fB], axis=-1), axis=-1)
+    variance = np.where(variance > 0, variance, np.nan)
+    first = np.mean(fB * (fAB - fA), axis=-1) / variance
+    total = 0.5 * np.mean((fA - fAB) ** 2, axis=-1) / variance
+    return first, total
+
+
+def sobol_indices(values, n_base, d, n_bootstrap=1000, confidence=0.95,
+                  seed=None):
+    """
+    First-order and total Sobol indices with bootstrap confidence
+    intervals.
+
+    values: Output values for each row of saltelli_design.
+    n_base: Number of base points of the design.
+    d: Number of parameters.
+    n_bootstrap: Number of bootstrap resamples.
+    confidence: Confidence level of the intervals.
+    seed: Seed for the bootstrap resamples.
+
+    Returns: A dictionary with arrays for 'first' and 'total' indices
+             and (low, high) arrays for 'first_conf' and 'total_conf'.
+    """
+    values = np.asarray(values, dtype=float).reshape(d + 2, n_base)
+    fA, fB, fAB = values[0], values[1], values[2:]
+    first, total = _first_order_and_total(fA, fB, fAB)
+
+    # Resample base points
+    random_state = np.random.RandomState(seed)
+    samples = random_state.randint(0, n_base, size=(n_bootstrap, n_base))
+    first_boot, total_boot = _first_order_and_total(fA[samples],
+                                                    fB[samples],
+                                                    fAB[:, samples])
+
+    alpha = 100 * (1 - confidence) / 2
+    return dict(
+        first=first,
+        total=total,
+        first_conf=np.nanpercentile(first_boot, [alpha, 100 - alpha], axis=1),
+        total_conf=np.nanpercentile(total_boot, [alpha, 100 - alpha], axis=1)
+    )
+
+
+#==============================================================================
+# Analysis
+#==============================================================================
+def _design_parameters(parameters, names, design):
+    """Generate a dictionary of parameters for each row of design."""
+    for row in design:
+        p = parameters.copy()
+        p.update(zip(names, row))
+        yield p
+
+
+def evaluate_design(parameters, names, design, number_of_times, max_time,
+                    dview=None, chunksize=4):
+    """
+    Compute the summary outputs of each point of a design.
+
+    All replications of all points are run as a single batch, and
+    results arrive as they are completed (see parallel.stream_tasks). A
+    point is summarized (and its panels discarded) as soon as all its
+    replications are finished.
+
+    parameters: Dictionary of parameters for the algorithm.
+    names: Names of the parameters in the columns of design.
+    design: Array with a row of parameter values per point.
+    number_of_times: Number of replications for each point.
+    max_time: Time to stop the algorithm.
+    dview: Direct view instance from an ipyparallel cluster.
+    chunksize: Number of replications sent to an engine at once.
+
+    Returns: A dictionary with an array of values for each name in
+             OUTPUTS.
+    """
+    values = dict((output, np.zeros(len(design))) for output in OUTPUTS)
+    set_of_parameters = list(_design_parameters(parameters, names, design))
+    shared = share_parameters(dview, set_of_parameters)
+
+    # Replications of the points that are not finished yet
+    point_data = {}
+    try:
+        tasks = make_tasks(set_of_parameters, number_of_times, max_time,
+                           shared=shared)
+        for result in stream_tasks(tasks, dview, chunksize):
+            point = result['index'][0]
+            data = point_data.setdefault(point, [])
+            data.append(result['panel'])
+            if len(data) == number_of_times:
+                summary = summarize_run(point_data.pop(point),
+                                        set_of_parameters[point])
+                for output in OUTPUTS:
+                    values[output][point] = summary[output]
+    finally:
+        release_parameters(dview, shared)
+
+    return values
+
+
+def sensitivity_analysis(parameters, bounds, n_base, number_of_times,
+                         max_time, dview=None, n_bootstrap=1000,
+                         confidence=0.95, seed=None, chunksize=4):
+    """
+    Sobol sensitivity analysis of the summary outputs of the algorithm.
+
+    parameters: Dictionary of parameters for the algorithm.
+    bounds: Dictionary with (low, high) tuples for each parameter
+            we want to study, e.g. social_influence, quality,
+            critical_mass, activation_sharpness and marketing_effort.
+    n_base: Number of base points of the design. The number of points
+            that are evaluated is n_base * (d + 2), with d the number
+            of parameters.
+    number_of_times: Number of replications for each point.
+    max_time: Time to stop the algorithm.
+    dview: Direct view instance from an ipyparallel cluster.
+    n_bootstrap: Number of bootstrap resamples for confidence intervals.
+    confidence: Confidence level of the intervals.
+    seed: Seed for the bootstrap resamples.
+    chunksize: Number of replications sent to an engine at once.
+
+    Returns: A dictionary that maps each output in OUTPUTS to the
+             result of sobol_indices for it. The parameter names are
+             saved under the 'names' key.
+    """
+    names = sorted(bounds.keys())
+    design = saltelli_design([bounds[n] for n in names], n_base)
+
+    values = evaluate_design(parameters, names, design, number_of_times,
+                             max_time, dview, chunksize)
+
+    indices = dict(names=names)
+    for output in OUTPUTS:
+        indices[output] = sobol_indices(values[output], n_base, len(names),
+                                        n_bootstrap, confidence, seed)
+    return indices
@@ -0,0 +1,416 @@
+# -*- coding: utf-8 -*-
+
+"""
+Local service that runs sweeps in warm worker processes
+
+The service keeps a pool of worker processes with the algorithm already
+imported, so jobs start computing as soon as they are submitted, without
+paying the start up of Python, the imports or starting a cluster. Workers
+also keep a pool of initial conditions for each set of graph parameters
+(see algorithm.pooled_initial_conditions), so the values of a sweep and
+later jobs with the same graphs don't generate them again. Replications
+whose seeds have the same remainder modulo the pool size share their
+initial conditions, so results are reproducible but not the same as
+the ones of run_analysis.py with the same seed. Start the service with a
+pool size of 0 to generate the initial conditions of every replication.
+
+Jobs are described like the parameters files of the Saved directory
+(with run settings and parameters) and are run in order of priority
+(higher first) and submission. Their results are saved in the format of
+storage.py to SERVICE_DIR and added to the catalog of results. The
+service only listens to connections from this host.
+
+HTTP interface (json):
+    POST /jobs      Submit a job: {"run": ..., "parameters": ...,
+                    "priority": 0, "seed": null, "observers": null}.
+                    Returns its handle.
+    GET /jobs       Handles of all jobs.
+    GET /jobs/ID    Handle of a job, with its status and progress.
+    POST /shutdown  Stop the service. It must be sent with the token
+                    saved by the service in TOKEN_FILE (only readable by
+                    the user that started it), in the X-Service-Token
+                    header.
+
+Usage:
+    python run_analysis.py serve --processes 4
+    python run_analysis.py submit --parameters-file social_influence_372.json
+"""
+
+from __future__ import division
+
+import heapq
+import itertools
+import json
+import multiprocessing
+import os
+import os.path as osp
+import re
+import threading
+import time
+import uuid
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib2 import Request, urlopen
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.request import Request, urlopen
+
+import numpy as np
+
+from all_parameters import RESULTS_DIR
+
+
+# Directory to save the results of jobs
+SERVICE_DIR = osp.join(RESULTS_DIR, 'Service')
+
+# Address of the service
+HOST = '127.0.0.1'
+PORT = 8642
+
+# File with the token needed to stop the service listening to a port
+TOKEN_FILE = osp.join(SERVICE_DIR, 'service-{port}.token')
+
+# Names of jobs, which are used as the base name of their results in
+# SERVICE_DIR, so they can't point to other directories
+JOB_NAME = re.compile(r'[\w.-]+$')
+
+# Number of initial conditions kept for each set of graph parameters
+POOL_SIZE = 32
+
+# Job statuses
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+#==============================================================================
+# Workers
+#==============================================================================
+# Initial conditions saved by each worker
+_graph_pool = {}
+
+
+def _init_worker(pool_size):
+    """
+    Import the algorithm before receiving any job and create the pool of
+    initial conditions of the worker.
+    """
+    from algorithm import new_graph_pool
+
+    if pool_size:
+        _graph_pool['pool'] = new_graph_pool(pool_size)
+
+
+def _run_task(task):
+    """Run a task in a worker, reusing its initial conditions."""
+    from parallel import run_task
+    return run_task(task, graph_pool=_graph_pool.get('pool'))
+
+
+#==============================================================================
+# Jobs
+#==============================================================================
+def new_service(processes=None, pool_size=POOL_SIZE):
+    """
+    Create the state of the service and start its workers.
+
+    processes: Number of worker processes (by default, the number of
+               cpus).
+    pool_size: Number of initial conditions kept by each worker for
+               each set of graph parameters (0 to not reuse them).
+    """
+    pool = multiprocessing.Pool(processes, initializer=_init_worker,
+                                initargs=(pool_size,))
+    return dict(pool=pool, jobs={}, queue=[], counter=itertools.count(),
+                condition=threading.Condition(), running=True,
+                started=time.strftime('%Y%m%d-%H%M%S'),
+                token=uuid.uuid4().hex)
+
+
+def job_handle(job):
+    """Information about a job that is returned to clients."""
+    handle = dict((key, job[key]) for key in
+                  ['id', 'name', 'status', 'priority', 'seed', 'submitted',
+                   'started', 'finished', 'done', 'total', 'results',
+                   'error'])
+    return handle
+
+
+def submit_job(service, spec):
+    """
+    Add a job to the queue of the service.
+
+    spec: Dictionary with the run settings and parameters of the job
+          (as in the parameters files of the Saved directory), and
+          optionally its priority, seed, name and observers of
+          additional metrics to save with its results (see
+          observers.parse_observers). Names can only have letters,
+          digits, '_', '-' and '.', and can't contain '..'.
+
+    Returns: The handle of the job.
+    """
+    from observers import observed_variables
+
+    name = spec.get('name')
+    if name is not None and (not JOB_NAME.match(name) or '..' in name):
+        raise ValueError('Invalid job name: {!r}'.format(name))
+
+    run = dict(spec['run'])
+    if spec.get('observers'):
+        run['observers'] = dict(run.get('observers') or {},
+                                **spec['observers'])
+    observed_variables(run.get('observers'))
+    spec = dict(spec, run=run)
+
+    seed = spec.get('seed')
+    if seed is None:
+        seed = int(np.random.randint(2**31 - 1))
+
+    with service['condition']:
+        number = next(service['counter'])
+        name = name or '{}_{}_{}'.format(
+            run['main_parameter'], service['started'], number)
+        total = run['number_of_times'] * len(run['parameter_values'])
+        job = dict(id=str(number), name=name, spec=spec,
+                   status=QUEUED, priority=spec.get('priority', 0),
+                   seed=seed, submitted=time.time(), started=None,
+                   finished=None, done=0, total=total,
+                   results=osp.join(SERVICE_DIR, name), error=None)
+        service['jobs'][job['id']] = job
+        heapq.heappush(service['queue'],
+                       (-job['priority'], number, job['id']))
+        service['condition'].notify()
+
+    return job_handle(job)
+
+
+def run_job(service, job):
+    """Run all replications of a job and save its results."""
+    from algorithm import generate_parameters
+    from catalog import register_results
+    from parallel import make_tasks, replication_seeds
+    from storage import save_results
+
+    run = job['spec']['run']
+    parameters = dict(job['spec']['parameters'])
+    parameters.pop(run['main_parameter'], None)
+    set_of_parameters = generate_parameters(parameters,
+                                            run['main_parameter'],
+                                            run['parameter_values'])
+
+    seeds = replication_seeds(job['seed'], len(set_of_parameters),
+                              run['number_of_times'])
+    tasks = make_tasks(set_of_parameters, run['number_of_times'],
+                       run['max_time'], seeds,
+                       observers=run.get('observers'))
+
+    data = [[None] * run['number_of_times'] for p in set_of_parameters]
+    for result in service['pool'].imap_unordered(_run_task, tasks):
+        value, replication = result['index']
+        data[value][replication] = result['panel']
+        job['done'] += 1
+
+    if not osp.isdir(SERVICE_DIR):
+        os.makedirs(SERVICE_DIR)
+    with open(job['results'] + '.json', 'w') as f:
+        json.dump(dict(run=run, parameters=job['spec']['parameters']), f,
+                  indent=4)
+    save_results(job['results'], data, set_of_parameters, run,
+                 metadata=dict(seed=job['seed']))
+    register_results(job['results'])
+
+
+def next_job(service):
+    """
+    Take the next job of the queue, waiting until there's one.
+
+    Jobs are taken in order of priority (higher first) and, with the
+    same priority, in order of submission.
+
+    Returns: The job, marked as running, or None if the service was
+             stopped.
+    """
+    condition = service['condition']
+    with condition:
+        while service['running'] and not service['queue']:
+            condition.wait()
+        if not service['running']:
+            return None
+        priority, number, job_id = heapq.heappop(service['queue'])
+        job = service['jobs'][job_id]
+        job['status'] = RUNNING
+        job['started'] = time.time()
+    return job
+
+
+def process_jobs(service):
+    """Run the jobs of the queue, in order of priority, until stopped."""
+    while True:
+        job = next_job(service)
+        if job is None:
+            return
+
+        try:
+            run_job(service, job)
+            job['status'] = DONE
+        except Exception as error:
+            job['status'] = FAILED
+            job['error'] = repr(error)
+        job['finished'] = time.time()
+
+
+def stop_service(service):
+    """Stop processing jobs and stop the workers."""
+    with service['condition']:
+        service['running'] = False
+        service['condition'].notify_all()
+    service['pool'].terminate()
+
+
+#==============================================================================
+# HTTP server
+#==============================================================================
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_handler(service):
+    """Class that handles the HTTP requests made to the service."""
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def send_json(self, data, code=200):
+            body = json.dumps(data).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            parts = self.path.strip('/').split('/')
+            if parts == ['jobs']:
+                jobs = sorted(service['jobs'].values(),
+                              key=lambda j: int(j['id']))
+                self.send_json([job_handle(j) for j in jobs])
+            elif len(parts) == 2 and parts[0] == 'jobs':
+                job = service['jobs'].get(parts[1])
+                if job is None:
+                    self.send_json(dict(error='Unknown job'), 404)
+                else:
+                    self.send_json(job_handle(job))
+            else:
+                self.send_json(dict(error='Unknown path'), 404)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            body = self.rfile.read(length).decode('utf-8')
+            if self.path.strip('/') == 'jobs':
+                try:
+                    handle = submit_job(service, json.loads(body))
+                except (KeyError, TypeError, ValueError) as error:
+                    self.send_json(dict(error=repr(error)), 400)
+                else:
+                    self.send_json(handle)
+            elif self.path.strip('/') == 'shutdown':
+                if self.headers.get('X-Service-Token') != service['token']:
+                    self.send_json(dict(error='Invalid token'), 403)
+                    return
+                self.send_json(dict(status='stopping'))
+                threading.Thread(target=self.server.shutdown).start()
+            else:
+                self.send_json(dict(error='Unknown path'), 404)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def save_token(token, port=PORT):
+    """Save the token to stop the service, only readable by this user."""
+    filename = TOKEN_FILE.format(port=port)
+    if not osp.isdir(osp.dirname(filename)):
+        os.makedirs(osp.dirname(filename))
+    if osp.isfile(filename):
+        os.remove(filename)
+    fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(token)
+    return filename
+
+
+def serve(processes=None, port=PORT, pool_size=POOL_SIZE):
+    """
+    Start the service and process jobs until it's shut down.
+
+    processes: Number of worker processes (by default, the number of
+               cpus).
+    port: Port to listen to in localhost.
+    pool_size: Number of initial conditions kept by each worker for
+               each set of graph parameters (0 to not reuse them).
+    """
+    # Workers must be started before any other thread
+    service = new_service(processes, pool_size)
+    server = ThreadingHTTPServer((HOST, port), make_handler(service))
+    token_file = save_token(service['token'], port)
+
+    worker = threading.Thread(target=process_jobs, args=(service,))
+    worker.daemon = True
+    worker.start()
+
+    print('Serving at http://{}:{}'.format(HOST, port))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        stop_service(service)
+        os.remove(token_file)
+
+
+#==============================================================================
+# Client
+#==============================================================================
+def request(path, data=None, port=PORT, headers=None):
+    """Make a request to the service and return its json response."""
+    url = 'http://{}:{}/{}'.format(HOST, port, path)
+    headers = dict(headers or {})
+    if data is not None:
+        data = json.dumps(data).encode('utf-8')
+        headers['Content-Type'] = 'application/json'
+    req = Request(url, data, headers)
+    response = urlopen(req)
+    try:
+        return json.loads(response.read().decode('utf-8'))
+    finally:
+        response.close()
+
+
+def submit(spec, port=PORT):
+    """Submit a job to the service and return its handle."""
+    return request('jobs', spec, port)
+
+
+def get_job(job_id, port=PORT):
+    """Get the handle of a job."""
+    return request('jobs/{}'.format(job_id), port=port)
+
+
+def shutdown(port=PORT):
+    """Stop the service, with the token it saved when it started."""
+    with open(TOKEN_FILE.format(port=port), 'r') as f:
+        token = f.read().strip()
+    return request('shutdown', {}, port, {'X-Service-Token': token})
+
+
+def wait_job(job_id, port=PORT, interval=0.1):
+    """Wait until a job is finished and return its handle."""
+    while True:
+        handle = get_job(job_id, port)
+        if handle['status'] in [DONE, FAILED]:
+            return handle
+        time.sleep(interval)
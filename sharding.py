@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+"""
+Split a sweep in shards that can be run in different processes or hosts
+
+The (value x replication) tasks of a sweep are split by replication
+index: shard k of N runs replications k, k + N, k + 2N, ... of every
+value. All shards use the seed of the sweep to compute the seed of each
+replication (see parallel.replication_seeds), so merging them gives
+exactly the same results as running the whole sweep in a single host
+with that seed.
+
+Each shard saves its results in the same format as storage.py, to
+filename.shard-K-of-N.npy and filename.shard-K-of-N.meta.
+
+Usage:
+    # In each host (or process), for k in 0..N-1
+    python run_analysis.py shard --parameters-file PARAMETERS_FILE
+        --shard k --shards N --seed S --name Results/social_influence_0
+    # After copying all shard files to the same directory
+    python run_analysis.py merge Results/social_influence_0
+
+    # Or launch all shards as local processes and merge them
+    python run_analysis.py sweep --shards N
+"""
+
+import glob
+import os.path as osp
+import subprocess
+import sys
+
+from parallel import make_tasks, replication_seeds, stream_tasks
+from storage import (create_results, load_results, run_variables,
+                     save_results)
+from telemetry import finish_progress, new_progress, update_progress
+from utilities import RX_FIELDS
+
+
+# Script to launch shards with
+RUN_ANALYSIS = osp.join(osp.dirname(osp.abspath(__file__)), 'run_analysis.py')
+
+
+def shard_replications(number_of_times, shard, shards):
+    """Indexes of the replications of each value run by a shard."""
+    return list(range(shard, number_of_times, shards))
+
+
+def shard_filename(filename, shard, shards):
+    """Base name of the files of a shard."""
+    return '{}.shard-{}-of-{}'.format(filename, shard, shards)
+
+
+def run_shard(filename, run, set_of_parameters, seed, shard, shards,
+              quiet=False):
+    """
+    Run a shard of a sweep and save its results.
+
+    filename: Base name (without extension) of the results of the sweep.
+    run: Dictionary of run settings (see all_parameters.py).
+    set_of_parameters: Set of parameters.
+    seed: Seed of the whole sweep.
+    shard: Index of the shard, from 0 to shards - 1.
+    shards: Number of shards.
+    quiet: Whether to only write progress to its log, without showing it.
+
+    Returns: The base name of the files of the shard.
+    """
+    number_of_times = run['number_of_times']
+    replications = shard_replications(number_of_times, shard, shards)
+    if not replications:
+        raise Exception('Shard {} of {} has no replications to run'.format(
+                        shard, shards))
+
+    seeds = replication_seeds(seed, len(set_of_parameters), number_of_times)
+    tasks = (task for task in make_tasks(set_of_parameters, number_of_times,
+                                         run['max_time'], seeds,
+                                         observers=run.get('observers'))
+             if task['index'][1] % shards == shard)
+
+    name = shard_filename(filename, shard, shards)
+    progress = new_progress([len(replications)] * len(set_of_parameters),
+                            name + '.progress',
+                            stream=None if quiet else sys.stderr)
+    data = [[None] * len(replications) for p in set_of_parameters]
+    for result in stream_tasks(tasks):
+        value, replication = result['index']
+        data[value][replication // shards] = result['panel']
+        update_progress(progress, result)
+    finish_progress(progress)
+
+    save_results(name, data, set_of_parameters, run,
+                 metadata=dict(seed=seed, shard=shard, shards=shards,
+                               replications=replications))
+    return name
+
+
+def merge_shards(filename):
+    """
+    Merge the results of all shards of a sweep.
+
+    They are saved with the same format and name as the results of a
+    sweep run in a single host (see storage.py).
+
+    filename: Base name (without extension) of the results of the sweep.
+    """
+    metadata_files = sorted(glob.glob(filename + '.shard-*-of-*.meta'))
+    if not metadata_files:
+        raise Exception('There are no shards of {}'.format(filename))
+
+    shards = {}
+    for metadata_file in metadata_files:
+        results, metadata = load_results(osp.splitext(metadata_file)[0])
+        shards[metadata['shard']] = (results, metadata)
+
+    # Check that all shards are from the same sweep
+    first = shards[min(shards)][1]
+    for shard in sorted(shards):
+        metadata = shards[shard][1]
+        for key in ['run', 'set_of_parameters', 'seed', 'shards']:
+            if metadata[key] != first[key]:
+                raise Exception('Shard {} of {} was run with a different {}'
+                                .format(shard, filename, key))
+
+    n_shards = first['shards']
+    missing = sorted(set(range(n_shards)) - set(shards))
+    if missing:
+        raise Exception('Shards {} of {} are missing'.format(missing,
+                                                              filename))
+
+    run = first['run']
+    set_of_parameters = first['set_of_parameters']
+    shape = (len(set_of_parameters), run['number_of_times'],
+             len(RX_FIELDS), run['max_time'], len(run_variables(run)))
+    merged = create_results(filename, shape, set_of_parameters, run,
+                            metadata=dict(seed=first['seed']))
+    for shard in range(n_shards):
+        results, metadata = shards[shard]
+        merged[:, metadata['replications']] = results
+    merged.flush()
+    del merged
+
+
+def launch_shards(parameters_file, filename, seed, shards):
+    """
+    Run all shards of a sweep as local processes and merge them.
+
+    The progress of each shard is written to its own log.
+
+    parameters_file: Parameters file of the sweep.
+    filename: Base name (without extension) of the results of the sweep.
+    seed: Seed of the whole sweep.
+    shards: Number of shards.
+    """
+    processes = []
+    for shard in range(shards):
+        command = [sys.executable, RUN_ANALYSIS, 'shard',
+                   '--parameters-file', parameters_file,
+                   '--shard', str(shard), '--shards', str(shards),
+                   '--seed', str(seed), '--name', filename, '--quiet']
+        processes.append(subprocess.Popen(command))
+
+    failed = [shard for shard, process in enumerate(processes)
+              if process.wait() != 0]
+    if failed:
+        raise Exception('Shards {} of {} failed'.format(failed, filename))
+
+    merge_shards(filename)
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+"""
+Binary storage of the results of a sweep
+
+All replications of a sweep are saved to a single Numpy array of shape
+(values, replications, 2, time, variables), where the third axis
+corresponds to the runs without and with reflexivity (see RX_FIELDS)
+and the last one to the variables collected by evolution_step (see
+VARIABLES), followed by the ones added by the observers of the sweep, if
+any (see observers.py). The array is saved in a .npy file, so it can be
+loaded memory-mapped, and the run settings and parameters of the sweep
+are saved next to it in a json file with a .meta extension.
+"""
+
+import json
+
+import numpy as np
+
+from observers import observed_variables
+from utilities import RX_FIELDS, VARIABLES
+
+
+def run_variables(run):
+    """
+    Variables saved for each replication of a sweep.
+
+    run: Dictionary of run settings (see all_parameters.py).
+    """
+    return VARIABLES + observed_variables(run.get('observers'))
+
+
+def panel_to_array(panel, variables=VARIABLES):
+    """
+    Convert the Pandas panel returned by single_run to an array.
+
+    Arrays (e.g. written by local workers, see parallel.py) are returned
+    unchanged.
+
+    variables: Variables to convert. Variables of observers that were
+               never sampled are NaN.
+
+    Returns: An array of shape (2, time, variables).
+    """
+    if isinstance(panel, np.ndarray):
+        return panel
+
+    values = []
+    for rx_field in RX_FIELDS:
+        df = panel[rx_field]
+        values.append([list(df[variable]) if variable in df
+                       else [np.nan] * len(df) for variable in variables])
+    return np.array(values, dtype=np.float64).transpose(0, 2, 1)
+
+
+def data_to_array(data, variables=VARIABLES):
+    """
+    Convert the output of compute_run to an array.
+
+    data: A list of Pandas panels (or arrays of each replication) or an
+          array of results, which is returned unchanged.
+    variables: Variables to convert (see panel_to_array).
+
+    Returns: An array of shape (replications, 2, time, variables).
+    """
+    if isinstance(data, np.ndarray):
+        return data
+    return np.array([panel_to_array(panel, variables) for panel in data])
+
+
+def create_results(filename, shape, set_of_parameters, run, metadata=None):
+    """
+    Create the files to save the results of a sweep.
+
+    filename: Base name (without extension) of the files to save.
+    shape: Shape of the array of results. Its last dimension must be the
+           number of variables of the run (see run_variables).
+    set_of_parameters: Set of parameters.
+    run: Dictionary of run settings (see all_parameters.py).
+    metadata: Dictionary of additional metadata to save (e.g. the seed
+              of the sweep).
+
+    Returns: The array of results, memory-mapped to its file, to write
+             them to it.
+    """
+    results = np.lib.format.open_memmap(filename + '.npy', mode='w+',
+                                        dtype=np.float64, shape=shape)
+
+    all_metadata = dict(variables=run_variables(run),
+                        rx_fields=RX_FIELDS,
+                        run=run,
+                        set_of_parameters=set_of_parameters)
+    if metadata is not None:
+        all_metadata.update(metadata)
+    with open(filename + '.meta', 'w') as f:
+        json.dump(all_metadata, f, indent=4)
+
+    return results
+
+
+def save_results(filename, data, set_of_parameters, run, metadata=None):
+    """
+    Save the results of a sweep.
+
+    filename: Base name (without extension) of the files to save.
+    data: List of data obtained by running compute_run over each entry
+          of set_of_parameters.
+    set_of_parameters: Set of parameters.
+    run: Dictionary of run settings (see all_parameters.py).
+    metadata: Dictionary of additional metadata to save.
+    """
+    variables = run_variables(run)
+    shape = (len(data), len(data[0]), len(RX_FIELDS), run['max_time'],
+             len(variables))
+    results = create_results(filename, shape, set_of_parameters, run,
+                             metadata)
+    for i, d in enumerate(data):
+        for replication, panel in enumerate(d):
+            results[i, replication] = panel_to_array(panel, variables)
+    results.flush()
+    del results
+
+
+def load_results(filename, mmap_mode='r'):
+    """
+    Load the results of a sweep saved by save_results.
+
+    filename: Base name (without extension) of the saved files.
+    mmap_mode: Mode to memory-map the array of results (see numpy.load).
+               Use None to load it in memory.
+
+    Returns: The array of results and a dictionary with the run settings
+             and set of parameters of the sweep. The names of the
+             variables of the array are in its 'variables' key.
+    """
+    with open(filename + '.meta', 'r') as f:
+        metadata = json.load(f)
+
+    if metadata['variables'][:len(VARIABLES)] != VARIABLES:
+        raise Exception('{} was saved with different variables: '
+                        '{}'.format(filename, metadata['variables']))
+
+    results = np.load(filename + '.npy', mmap_mode=mmap_mode)
+    return results, metadata
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+
+"""
+Gaussian process emulator of summary outputs of the algorithm
+
+The emulator is fitted on the results of compute_run for several sets of
+parameters and it's used to decide which parameter values to simulate next,
+i.e. the ones where its predictions are more uncertain (active learning).
+It can start from the results of previous analyses saved in the catalog
+(see load_observations).
+"""
+
+from __future__ import division
+
+import numpy as np
+
+from aggregates import compute_aggregates
+from algorithm import compute_run
+from catalog import CATALOG_FILE, find_data
+from storage import load_results
+
+
+# Summary outputs the emulator is fitted to
+OUTPUTS = ['final_adopters', 'activation_time',
+           'adopters_percentaje_upto_activation', 'max_adopters']
+
+# Grids to look for the kernel hyperparameters
+LENGTH_SCALES = np.logspace(-1.5, 0.5, 15)
+NOISE_RATIOS = np.logspace(-6, 0, 7)
+
+
+#==============================================================================
+# Observations
+#==============================================================================
+def summarize_run(data, parameters):
+    """
+    Compute the summary outputs of a run.
+
+    data: Contains the output of compute_run.
+    parameters: Parameters used to compute data.
+
+    Returns: A dictionary with a value for each name in OUTPUTS.
+    """
+    aggregates = compute_aggregates(data, parameters)
+    return dict((output, aggregates[output]) for output in OUTPUTS)
+
+
+def new_observations(names):
+    """
+    Create an empty set of observations.
+
+    names: Names of the parameters the emulator depends on.
+    """
+    return dict(names=list(names), X=[],
+                Y=dict((output, []) for output in OUTPUTS))
+
+
+def add_observations(observations, multiple_data, set_of_params):
+    """
+    Add the results of several compute_run's to a set of observations.
+
+    observations: Observations created with new_observations.
+    multiple_data: List of data obtained by running compute_run
+                   over each entry of set_of_params.
+    set_of_params: Set of parameters.
+    """
+    for data, parameters in zip(multiple_data, set_of_params):
+        summary = summarize_run(data, parameters)
+        observations['X'].append([parameters[n] for n in observations['names']])
+        for output in OUTPUTS:
+            observations['Y'][output].append(summary[output])
+    return observations
+
+
+def add_saved_results(observations, filename):
+    """
+    Add the results of a sweep saved with storage.save_results to a set
+    of observations.
+
+    filename: Base name (without extension) of the saved files.
+    """
+    results, metadata = load_results(filename)
+    return add_observations(observations, results,
+                            metadata['set_of_parameters'])
+
+
+def load_observations(names, catalog_file=CATALOG_FILE, **filters):
+    """
+    Create a set of observations from the saved results of previous
+    analyses, found in the catalog of results.
+
+    names: Names of the parameters the emulator depends on.
+    filters: Values of the parameters that are fixed, to only use results
+             computed with them (see catalog.find_runs).
+
+    Returns: The observations of all values of the main parameter of any
+             analysis with the given parameters.
+    """
+    observations = new_observations(names)
+    data = [(values, parameters)
+            for values, parameters in find_data(catalog_file, **filters)
+            if all(n in parameters for n in names)]
+    if data:
+        multiple_data, set_of_params = zip(*data)
+        add_observations(observations, multiple_data, set_of_params)
+    return observations
+
+
+def reorder_observations(observations, names):
+    """
+    Get a set of observations with its parameters in a given order.
+
+    names: Names of the parameters, which must be the same ones of the
+           observations.
+    """
+    if sorted(observations['names']) != sorted(names):
+        raise Exception('The observations depend on {}, not on {}'.format(
+                        observations['names'], list(names)))
+
+    columns = [observations['names'].index(n) for n in names]
+    return dict(names=list(names),
+                X=[[x[i] for i in columns] for x in observations['X']],
+                Y=dict((output, list(observations['Y'][output]))
+                       for output in OUTPUTS))
+
+
+#==============================================================================
+# Gaussian process
+#==============================================================================
+def _normalize(X, bounds):
+    """Map X to the unit hypercube given by bounds."""
+    low, high = np.array(bounds, dtype=float).T
+    return (np.atleast_2d(X) - low) / (high - low)
+
+
+def _kernel(A, B, length_scale):
+    """Squared exponential kernel between the rows of A and B."""
+    distances = np.sum((A[:, None, :] - B[None, :, :]) ** 2, axis=2)
+    return np.exp(-0.5 * distances / length_scale ** 2)
+
+
+def _factorize(X, y, length_scale, noise_ratio):
+    """
+    Cholesky factor of the kernel matrix and its log marginal likelihood.
+
+    The signal variance is profiled out of the likelihood.
+    """
+    n = len(y)
+    K = _kernel(X, X, length_scale) + (noise_ratio + 1e-10) * np.eye(n)
+    try:
+        L = np.linalg.cholesky(K)
+    except np.linalg.LinAlgError:
+        return None, None, -np.inf
+    alpha = np.linalg.solve(L.T, np.linalg.solve(L, y))
+    variance = max(np.dot(y, alpha) / n, 1e-12)
+    log_likelihood = (-0.5 * n * np.log(variance) -
+                      np.sum(np.log(np.diag(L))) -
+                      0.5 * n * (1 + np.log(2 * np.pi)))
+    return L, alpha, log_likelihood
+
+
+def fit_emulator(X, y, bounds):
+    """
+    Fit a Gaussian process to the observations (X, y).
+
+    X: List of parameter values, one row per observation.
+    y: List of observed values for a given output.
+    bounds: List of (low, high) tuples with the range of each parameter.
+
+    Returns: A dictionary with the fitted emulator.
+    """
+    X = _normalize(X, bounds)
+    y = np.asarray(y, dtype=float)
+
+    # Standardize outputs
+    mean = np.mean(y)
+    std = np.std(y) if np.std(y) > 0 else 1.
+    y = (y - mean) / std
+
+    # Pick the hyperparameters with the highest marginal likelihood
+    best = None
+    for length_scale in LENGTH_SCALES:
+        for noise_ratio in NOISE_RATIOS:
+            L, alpha, log_likelihood = _factorize(X, y, length_scale,
+                                                  noise_ratio)
+            if best is None or log_likelihood > best['log_likelihood']:
+                best = dict(L=L, alpha=alpha, log_likelihood=log_likelihood,
+                            length_scale=length_scale,
+                            noise_ratio=noise_ratio)
+
+    best['variance'] = np.dot(y, best['alpha']) / len(y)
+    best.update(X=X, y=y, mean=mean, std=std, bounds=bounds)
+    return best
+
+
+def predict(emulator, X):
+    """
+    Predict an output with a fitted emulator.
+
+    emulator: Emulator returned by fit_emulator.
+    X: List of parameter values, one row per point.
+
+    Returns: Two arrays with the predicted mean and standard deviation
+             of the output at each point.
+    """
+    X = _normalize(X, emulator['bounds'])
+    k = _kernel(X, emulator['X'], emulator['length_scale'])
+    mean = np.dot(k, emulator['alpha'])
+
+    v = np.linalg.solve(emulator['L'], k.T)
+    variance = emulator['variance'] * np.clip(1 - np.sum(v ** 2, axis=0),
+                                              0, None)
+
+    return (emulator['mean'] + emulator['std'] * mean,
+            emulator['std'] * np.sqrt(variance))
+
+
+def fit_emulators(observations, bounds):
+    """Fit an emulator for each output in observations."""
+    return dict((output, fit_emulator(observations['X'],
+                                      observations['Y'][output], bounds))
+                for output in OUTPUTS)
+
+
+#==============================================================================
+# Active learning
+#==============================================================================
+def latin_hypercube(bounds, n_points, random_state):
+    """Latin hypercube sample of n_points within bounds."""
+    dims = len(bounds)
+    cells = np.array([random_state.permutation(n_points)
+                      for _ in range(dims)]).T
+    unit = (cells + random_state.random_sample((n_points, dims))) / n_points
+    low, high = np.array(bounds, dtype=float).T
+    return low + unit * (high - low)
+
+
+def propose_points(emulators, bounds, n_points=4, n_candidates=2000,
+                   random_state=None):
+    """
+    Propose parameter points to simulate next.
+
+    Candidates are ranked by the uncertainty of the emulators relative
+    to the spread of each output. After a point is chosen, its predicted
+    mean is added as a pseudo-observation so the next ones are not
+    proposed right next to it.
+
+    emulators: Emulators returned by fit_emulators.
+    bounds: List of (low, high) tuples with the range of each parameter.
+    n_points: Number of points to propose.
+    n_candidates: Number of random candidates to choose from.
+    random_state: Numpy RandomState to draw candidates.
+
+    Returns: An array with a row of parameter values per point.
+    """
+    if random_state is None:
+        random_state = np.random.RandomState()
+    candidates = latin_hypercube(bounds, n_candidates, random_state)
+
+    emulators = dict((o, e.copy()) for (o, e) in emulators.items())
+    proposed = []
+    for _ in range(n_points):
+        score = np.zeros(n_candidates)
+        for emulator in emulators.values():
+            _, std = predict(emulator, candidates)
+            score += std / emulator['std']
+        best = np.argmax(score)
+        proposed.append(candidates[best])
+
+        # Refit with the pseudo-observation and the same hyperparameters
+        for output, emulator in emulators.items():
+            mean, _ = predict(emulator, candidates[best:best + 1])
+            y = np.append(emulator['y'], (mean[0] - emulator['mean']) /
+                          emulator['std'])
+            X = np.vstack([emulator['X'],
+                           _normalize(candidates[best], bounds)])
+            L, alpha, _ = _factorize(X, y, emulator['length_scale'],
+                                     emulator['noise_ratio'])
+            emulator.update(X=X, y=y, L=L, alpha=alpha)
+
+    return np.array(proposed)
+
+
+def active_learning(parameters, bounds, number_of_times, max_time,
+                    n_initial=8, n_iterations=4, batch_size=4, seed=None,
+                    dview=None, observations=None):
+    """
+    Map a region of parameters by simulating only where the emulators
+    are uncertain.
+
+    parameters: Dictionary of parameters for the algorithm.
+    bounds: Dictionary with (low, high) tuples for each parameter
+            that we want to vary.
+    number_of_times: Number of times to repeat the evolution for each
+                     set of parameters.
+    max_time: Time to stop the algorithm.
+    n_initial: Number of points of the initial design.
+    n_iterations: Number of active learning iterations.
+    batch_size: Number of points simulated in each iteration.
+    seed: Seed for the random number generator used to propose points.
+    dview: Direct view instance from an ipyparallel cluster.
+    observations: Previous observations (e.g. from earlier sweeps, see
+                  load_observations) to start from. They must depend on
+                  the same parameters as bounds, in any order.
+
+    Returns: The observations and the emulators fitted to them.
+    """
+    names = sorted(bounds.keys())
+    bounds = [bounds[n] for n in names]
+    random_state = np.random.RandomState(seed)
+
+    if observations is None:
+        observations = new_observations(names)
+    else:
+        observations = reorder_observations(observations, names)
+
+    def simulate(points):
+        set_of_params = []
+        for point in points:
+            p = parameters.copy()
+            p.update(zip(names, point))
+            set_of_params.append(p)
+        multiple_data = [compute_run(number_of_times, p, max_time, dview)
+                         for p in set_of_params]
+        add_observations(observations, multiple_data, set_of_params)
+
+    if len(observations['X']) < 2:
+        simulate(latin_hypercube(bounds, n_initial, random_state))
+
+    for _ in range(n_iterations):
+        emulators = fit_emulators(observations, bounds)
+        simulate(propose_points(emulators, bounds, batch_size,
+                                random_state=random_state))
+
+    emulators = fit_emulators(observations, bounds)
+    return observations, emulators
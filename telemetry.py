@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+
+"""
+Live progress and throughput of sweeps
+
+Progress is updated with the results returned by the workers (see
+parallel.run_task), which also report the worker that computed them,
+how long it took and the memory used by the worker, so it works in the
+same way when replications are run in this process or in the engines of
+an IPyparallel cluster.
+
+It's shown in a single line of the terminal and written to a log file
+with a json object per line.
+
+Usage:
+    progress = new_progress([number_of_times] * n_values, 'sweep.progress')
+    for result in iterate_tasks(tasks, dview):
+        update_progress(progress, result)
+    finish_progress(progress)
+"""
+
+from __future__ import division
+
+import json
+import os
+import socket
+import sys
+import time
+
+
+# Minimum time between reports in seconds
+INTERVAL = 1.0
+
+
+#==============================================================================
+# Workers
+#==============================================================================
+def worker_id():
+    """Identifier of the current process, as host:pid."""
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+def memory_usage():
+    """
+    Memory used by the current process in MB.
+
+    This is its resident memory on Linux and its peak resident memory on
+    other Unix systems. It's None if it can't be known (e.g. on Windows).
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except (IOError, OSError, ValueError, AttributeError):
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return maxrss / 2**20
+    else:
+        return maxrss / 2**10
+
+
+#==============================================================================
+# Progress
+#==============================================================================
+def new_progress(totals, log_file=None, done=None, stream=sys.stderr,
+                 interval=INTERVAL):
+    """
+    Start tracking the progress of a sweep.
+
+    totals: Number of replications to compute for each value of the main
+            parameter.
+    log_file: File to write reports to, as json lines (None to not write
+              them).
+    done: Number of replications already computed for each value, e.g.
+          when resuming from a checkpoint.
+    stream: Stream to show reports in (None to not show them).
+    interval: Minimum time between reports in seconds.
+    """
+    if done is None:
+        done = [0] * len(totals)
+
+    log = None
+    if log_file is not None:
+        log = open(log_file, 'a')
+
+    now = time.time()
+    return dict(totals=list(totals), done=list(done),
+                initial=sum(done), start=now, last_report=now,
+                workers={}, log=log, stream=stream, interval=interval)
+
+
+def update_progress(progress, result):
+    """
+    Update progress with the result of a replication.
+
+    result: Dictionary returned by parallel.run_task.
+    """
+    value = result['index'][0]
+    progress['done'][value] += 1
+
+    if 'worker' in result:
+        worker = progress['workers'].setdefault(
+            result['worker'], dict(replications=0, busy=0, memory=None))
+        worker['replications'] += 1
+        worker['busy'] += result.get('elapsed', 0)
+        worker['memory'] = result.get('memory')
+
+    if time.time() - progress['last_report'] >= progress['interval']:
+        report_progress(progress)
+
+
+def get_snapshot(progress):
+    """
+    Current state of the progress.
+
+    Returns: A dictionary with the replications done for each value and
+             in total, the replications per second, the estimated time to
+             finish in seconds, the memory used by this process and the
+             replications, utilization (fraction of the elapsed time spent
+             computing replications) and memory of each worker.
+    """
+    now = time.time()
+    elapsed = now - progress['start']
+    done = sum(progress['done'])
+    total = sum(progress['totals'])
+
+    rate = (done - progress['initial']) / elapsed if elapsed > 0 else 0
+    eta = (total - done) / rate if rate > 0 else None
+
+    workers = {}
+    for name, worker in progress['workers'].items():
+        workers[name] = dict(
+            replications=worker['replications'],
+            utilization=min(1, worker['busy'] / elapsed) if elapsed else 0,
+            memory_mb=worker['memory'])
+
+    return dict(time=now, elapsed=elapsed, done=done, total=total,
+                done_per_value=list(progress['done']),
+                replications_per_second=rate, eta=eta,
+                memory_mb=memory_usage(), workers=workers)
+
+
+def format_time(seconds):
+    """Format a number of seconds as h:mm:ss."""
+    if seconds is None:
+        return '?'
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '{}:{:02d}:{:02d}'.format(hours, minutes, seconds)
+
+
+def format_snapshot(snapshot, totals):
+    """Line of text that describes a snapshot of the progress."""
+    values = ' '.join('{}/{}'.format(d, t) for d, t in
+                      zip(snapshot['done_per_value'], totals))
+    line = '{}/{} replications [{}] {:.2f}/s ETA {}'.format(
+           snapshot['done'], snapshot['total'], values,
+           snapshot['replications_per_second'],
+           format_time(snapshot['eta']))
+
+    workers = snapshot['workers']
+    if workers:
+        utilization = (sum(w['utilization'] for w in workers.values()) /
+                       len(workers))
+        line += ' | {} workers {:.0f}% busy'.format(len(workers),
+                                                    100 * utilization)
+    if snapshot['memory_mb'] is not None:
+        line += ' | {:.0f} MB'.format(snapshot['memory_mb'])
+    return line
+
+
+def report_progress(progress, final=False):
+    """Show the progress in the terminal and write it to the log."""
+    snapshot = get_snapshot(progress)
+    progress['last_report'] = snapshot['time']
+
+    if progress['log'] is not None:
+        progress['log'].write(json.dumps(snapshot, sort_keys=True) + '\n')
+        progress['log'].flush()
+
+    stream = progress['stream']
+    if stream is not None:
+        line = format_snapshot(snapshot, progress['totals'])
+        if hasattr(stream, 'isatty') and stream.isatty():
+            # Overwrite the previous line
+            stream.write('\r\033[K' + line)
+            if final:
+                stream.write('\n')
+        else:
+            stream.write(line + '\n')
+        stream.flush()
+
+
+def finish_progress(progress):
+    """Report the final progress and close its log."""
+    report_progress(progress, final=True)
+    if progress['log'] is not None:
+        progress['log'].close()
+        progress['log'] = None
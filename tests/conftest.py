@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+
+"""
+Configuration of the tests
+
+The modules of the algorithm are at the root of the repository, so it's
+added to the path to import them.
+"""
+
+import os.path as osp
+import sys
+
+sys.path.insert(0, osp.dirname(osp.dirname(osp.abspath(__file__))))
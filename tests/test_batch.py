@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for re-runs of saved analyses"""
+
+import json
+import os.path as osp
+
+import numpy as np
+
+import outputs
+from all_parameters import parameters as default_parameters
+from batch import configuration_key
+
+
+def test_configurations_with_the_same_effective_parameters():
+    no_delays = dict(default_parameters, use_time_delays=False)
+    other_delays = dict(no_delays, time_delays_distro=[(1, 1.)])
+    assert configuration_key(no_delays, 20) == \
+        configuration_key(other_delays, 20)
+
+    # Delays are used, so they are part of the configuration
+    assert configuration_key(dict(other_delays, use_time_delays=True), 20) != \
+        configuration_key(dict(no_delays, use_time_delays=True), 20)
+
+    # Default values of parameters
+    del no_delays['use_time_delays']
+    del other_delays['graph_type']
+    assert configuration_key(no_delays, 20) == \
+        configuration_key(other_delays, 20)
+
+    # Randomness is not used by preferential attachment graphs
+    graph = dict(default_parameters, graph_type='preferential_attachment')
+    assert configuration_key(graph, 20) == \
+        configuration_key(dict(graph, randomness=0.5), 20)
+
+    assert configuration_key(no_delays, 20) != configuration_key(no_delays, 30)
+    assert configuration_key(no_delays, 20) != \
+        configuration_key(no_delays, 20, {'homophily': 2})
+
+
+def test_rerun_filename_counts_all_result_files(tmpdir, monkeypatch):
+    monkeypatch.setattr(outputs, 'RERUNS_DIR', str(tmpdir))
+
+    def rerun_filename():
+        name = outputs.rerun_filename('Saved/critical_mass_3.json')
+        return osp.basename(name)
+
+    assert rerun_filename() == 'critical_mass_3_0'
+
+    # Re-runs without plots
+    tmpdir.join('critical_mass_3_0.npy').write('')
+    tmpdir.join('critical_mass_3_0.meta').write('')
+    assert rerun_filename() == 'critical_mass_3_1'
+
+    tmpdir.join('critical_mass_3_1_types.png').write('')
+    tmpdir.join('critical_mass_3_1.log').write('')
+    assert rerun_filename() == 'critical_mass_3_2'
+
+    # Re-runs of other files
+    tmpdir.join('critical_mass_30_4.npy').write('')
+    assert rerun_filename() == 'critical_mass_3_2'
+
+
+def test_batch_is_reproducible_with_its_seed(tmpdir, monkeypatch):
+    import batch
+    from storage import load_results
+
+    monkeypatch.setattr(outputs, 'RERUNS_DIR', str(tmpdir))
+    monkeypatch.setattr(batch, 'output',
+                        dict((name, False) for name in outputs.OUTPUTS))
+    monkeypatch.setattr(batch, 'register_results', lambda filename: None)
+
+    # Two files that share a configuration
+    parameters = dict(default_parameters, number_of_consumers=50,
+                      initial_seed=0.1, marketing_effort=0.3)
+    parameters_files = []
+    for name, values in [('first', [0.3, 0.6]), ('second', [0.6])]:
+        run = dict(main_parameter='critical_mass', parameter_values=values,
+                   number_of_times=2, max_time=4, cumulative=False)
+        parameters_file = tmpdir.join(name + '.json')
+        parameters_file.write(json.dumps(dict(run=run,
+                                              parameters=parameters)))
+        parameters_files.append(str(parameters_file))
+
+    for i in range(2):
+        batch.run_batch(parameters_files, seed=5, processes=2)
+
+    first, metadata = load_results(str(tmpdir.join('first_0')))
+    assert metadata['seed'] == 5
+    np.testing.assert_array_equal(first,
+                                  load_results(str(tmpdir.join('first_1')))[0])
+    second, _ = load_results(str(tmpdir.join('second_0')))
+    np.testing.assert_array_equal(second[0], first[1])
+
+    # Replications of the same configuration have different seeds
+    assert not np.array_equal(first[0, 0], first[0, 1])
+
+
+def test_batch_tasks_are_generated_lazily():
+    from batch import make_batch_tasks
+    from parallel import replication_seeds
+
+    configurations = dict(a=dict(number_of_times=3, max_time=4,
+                                 observers=None),
+                          b=dict(number_of_times=2, max_time=5,
+                                 observers={'homophily': 2}))
+    seeds = replication_seeds(0, 2, 3)
+    tasks = make_batch_tasks(configurations, ['a', 'b'], seeds, 'key')
+    assert next(tasks) == dict(index=('a', 0), shared_parameters=('key', 0),
+                               max_time=4, seed=int(seeds[0, 0]))
+    tasks = list(tasks)
+    assert [t['index'] for t in tasks] == [('a', 1), ('a', 2), ('b', 0),
+                                           ('b', 1)]
+    assert tasks[-1]['observers'] == {'homophily': 2}
+    assert tasks[-1]['seed'] == int(seeds[1, 1])
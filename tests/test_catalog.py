@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the catalog of analyses"""
+
+import json
+import os.path as osp
+
+import numpy as np
+import pytest
+
+from catalog import (add_run, encode_value, find_data, find_runs,
+                     index_directory, values_match)
+from storage import save_results
+from utilities import VARIABLES
+
+
+RUN = dict(main_parameter='critical_mass', parameter_values=[0.3, 0.6],
+           number_of_times=2, max_time=3)
+
+
+def parameters_of(**parameters):
+    """Set of parameters of RUN with the given parameters."""
+    return [dict(parameters, critical_mass=value)
+            for value in RUN['parameter_values']]
+
+
+@pytest.fixture
+def catalog_file(tmpdir):
+    """Catalog with an analysis of each graph type."""
+    catalog_file = str(tmpdir.join('catalog.sqlite'))
+    add_run(str(tmpdir.join('int')), RUN,
+            parameters_of(graph_type='erdos_renyi', randomness=1, level=1),
+            seed=1, catalog_file=catalog_file)
+    add_run(str(tmpdir.join('float')), RUN,
+            parameters_of(graph_type='small_world', randomness=0.1,
+                          level=1.0, use_time_delays=True),
+            seed=2, catalog_file=catalog_file)
+    return catalog_file
+
+
+def names(entries):
+    return [osp.basename(e['name']) for e in entries]
+
+
+def test_encode_value():
+    assert encode_value(1) == ('1', 1.0)
+    assert encode_value(0.5) == ('0.5', 0.5)
+    assert encode_value(np.float64(0.5)) == ('0.5', 0.5)
+    assert encode_value(True) == ('true', None)
+    assert encode_value('small_world') == ('"small_world"', None)
+
+
+def test_values_match():
+    assert values_match(1, 1.0)
+    assert values_match(0.3, 0.3)
+    assert not values_match(1, 1.5)
+    assert not values_match(True, 1)
+    assert not values_match('1', 1)
+
+
+@pytest.mark.parametrize('value', [1, 1.0])
+def test_find_runs_with_mixed_int_and_float(catalog_file, value):
+    entries = find_runs(catalog_file, randomness=value)
+    assert names(entries) == ['int']
+    assert entries[0]['values'] == [0, 1]
+
+    entries = find_runs(catalog_file, level=value)
+    assert names(entries) == ['int', 'float']
+    assert [e['values'] for e in entries] == [[0, 1], [0, 1]]
+
+
+def test_find_runs(catalog_file):
+    entries = find_runs(catalog_file, critical_mass=0.6)
+    assert names(entries) == ['int', 'float']
+    assert [e['values'] for e in entries] == [[1], [1]]
+
+    # All filters must match the same value
+    entries = find_runs(catalog_file, critical_mass=0.3,
+                        graph_type='small_world')
+    assert names(entries) == ['float']
+    assert entries[0]['values'] == [0]
+    assert entries[0]['seed'] == 2
+    assert entries[0]['variables'] == VARIABLES
+
+    assert names(find_runs(catalog_file, use_time_delays=True)) == ['float']
+    assert find_runs(catalog_file, graph_type='erdos_renyi',
+                     randomness=0.1) == []
+    assert find_runs(catalog_file, critical_mass=0.5) == []
+
+    # Run settings
+    assert len(find_runs(catalog_file, number_of_times=2)) == 2
+    assert find_runs(catalog_file, max_time=4) == []
+
+
+def test_add_run_replaces_it(catalog_file, tmpdir):
+    add_run(str(tmpdir.join('int')), RUN, parameters_of(randomness=2),
+            catalog_file=catalog_file)
+    assert find_runs(catalog_file, randomness=1) == []
+    assert names(find_runs(catalog_file, randomness=2)) == ['int']
+
+
+def test_find_data(tmpdir):
+    catalog_file = str(tmpdir.join('catalog.sqlite'))
+    filename = str(tmpdir.join('results'))
+    set_of_parameters = parameters_of(randomness=1)
+    data = np.arange(2 * 2 * 2 * 3 * len(VARIABLES), dtype=float).reshape(
+        2, 2, 2, 3, len(VARIABLES))
+    save_results(filename, data, set_of_parameters, RUN)
+    add_run(filename, RUN, set_of_parameters,
+            results_file=filename + '.npy', catalog_file=catalog_file)
+
+    found = find_data(catalog_file, randomness=1.0, critical_mass=0.6)
+    assert len(found) == 1
+    values, parameters = found[0]
+    assert np.array_equal(values, data[1])
+    assert parameters == set_of_parameters[1]
+
+
+def test_index_directory(tmpdir):
+    catalog_file = str(tmpdir.join('catalog.sqlite'))
+    saved = tmpdir.mkdir('Saved')
+
+    # An analysis with results, with observers, and one with only its
+    # parameters file
+    run = dict(RUN, observers={'homophily': 2})
+    set_of_parameters = parameters_of(randomness=1)
+    data = np.zeros((2, 2, 2, 3, len(VARIABLES) + 1))
+    save_results(str(saved.join('results')), data, set_of_parameters, run,
+                 metadata=dict(seed=5))
+    saved.join('parameters.json').write(json.dumps(
+        dict(run=RUN, parameters=dict(critical_mass=0.3, randomness=2))))
+
+    # Files that are not analyses
+    save_results(str(saved.join('results.shard-0-of-2')), data,
+                 set_of_parameters, run)
+    saved.join('other.json').write('[1, 2]')
+
+    assert index_directory(str(saved), catalog_file) == 2
+
+    entries = dict(zip(names(find_runs(catalog_file)),
+                       find_runs(catalog_file)))
+    assert sorted(entries) == ['parameters', 'results']
+    assert entries['results']['seed'] == 5
+    assert entries['results']['variables'] == VARIABLES + ['homophily']
+    assert entries['results']['results_file'].endswith('results.npy')
+    assert entries['parameters']['results_file'] is None
+    assert entries['parameters']['parameters_file'].endswith(
+        'parameters.json')
+
+    assert names(find_runs(catalog_file, randomness=2)) == ['parameters']
+    found = find_data(catalog_file, randomness=1, critical_mass=0.3)
+    assert [p for values, p in found] == [set_of_parameters[0]]
+    assert find_data(catalog_file, randomness=2) == []
+
+    # Indexing again replaces the analyses
+    assert index_directory(str(saved), catalog_file) == 2
+    assert len(find_runs(catalog_file)) == 2
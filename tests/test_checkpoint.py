@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the log of replications that allows to resume sweeps"""
+
+import glob
+import json
+import os
+import os.path as osp
+
+import numpy as np
+import pytest
+
+from all_parameters import parameters as default_parameters
+from checkpoint import (_remove_incomplete_line, append_result,
+                        check_header, load_checkpoint, new_header,
+                        open_checkpoint)
+from parallel import make_tasks, replication_seeds, run_task
+from storage import load_results, panel_to_array
+
+
+SEED = 11
+RUN = dict(main_parameter='critical_mass', parameter_values=[0.3, 0.6],
+           number_of_times=3, max_time=5)
+SET_OF_PARAMETERS = [dict(default_parameters, number_of_consumers=50,
+                          critical_mass=value)
+                     for value in RUN['parameter_values']]
+
+
+def sweep_tasks(done=()):
+    seeds = replication_seeds(SEED, len(SET_OF_PARAMETERS),
+                              RUN['number_of_times'])
+    return make_tasks(SET_OF_PARAMETERS, RUN['number_of_times'],
+                      RUN['max_time'], seeds, done=done)
+
+
+def arrays(panels):
+    return dict((index, panel_to_array(panel))
+                for index, panel in panels.items())
+
+
+@pytest.mark.parametrize('content, expected', [
+    (b'header\nfirst\nsecond', b'header\nfirst\n'),
+    (b'header\nfirst\n', b'header\nfirst\n'),
+    (b'no newline', b''),
+    (b'header\n' + b'x' * 10000, b'header\n'),
+])
+def test_remove_incomplete_line(tmpdir, content, expected):
+    filename = tmpdir.join('sweep.log')
+    filename.write_binary(content)
+    _remove_incomplete_line(str(filename))
+    assert filename.read_binary() == expected
+
+
+def test_resume_after_an_interruption(tmpdir):
+    filename = str(tmpdir.join('sweep.log'))
+    header = new_header(RUN, SEED)
+    expected = dict((result['index'], result['panel'])
+                    for result in map(run_task, sweep_tasks()))
+
+    # Interrupted while writing the fourth replication
+    f = open_checkpoint(filename, header)
+    for task in list(sweep_tasks())[:3]:
+        append_result(f, run_task(task))
+    f.write('{"index": [1, 0], "seed"')
+    f.close()
+
+    saved_header, panels = load_checkpoint(filename)
+    assert saved_header == header
+    assert sorted(panels) == [(0, 0), (0, 1), (0, 2)]
+    check_header(saved_header, RUN)
+
+    # Only the missing replications are run, with the same seeds
+    f = open_checkpoint(filename, saved_header, resume=True)
+    for task in sweep_tasks(done=panels):
+        assert task['index'][0] == 1
+        append_result(f, run_task(task))
+    f.close()
+
+    saved_header, panels = load_checkpoint(filename)
+    assert saved_header == header
+    panels, expected = arrays(panels), arrays(expected)
+    assert sorted(panels) == sorted(expected)
+    for index in expected:
+        assert np.array_equal(panels[index], expected[index])
+
+
+def test_checkpoint_of_a_different_run(tmpdir):
+    header = new_header(RUN, SEED)
+    check_header(header, RUN)
+    with pytest.raises(Exception):
+        check_header(header, dict(RUN, number_of_times=4))
+    with pytest.raises(Exception):
+        check_header(header, dict(RUN, observers={'homophily': 2}))
+
+
+def test_resume_a_sweep_of_a_parameters_file(tmpdir, monkeypatch):
+    import all_parameters
+    import catalog
+    import outputs
+    import parallel
+    import run_analysis
+
+    reruns = tmpdir.mkdir('Reruns')
+    monkeypatch.setattr(all_parameters, 'RESULTS_DIR', str(tmpdir))
+    monkeypatch.setattr(all_parameters, 'RERUNS_DIR', str(reruns))
+    monkeypatch.setattr(outputs, 'RERUNS_DIR', str(reruns))
+    monkeypatch.setattr(all_parameters, 'output',
+                        dict((name, False) for name in outputs.OUTPUTS))
+    monkeypatch.setattr(catalog, 'register_results', lambda filename: None)
+
+    parameters_file = tmpdir.join('quality_11.json')
+    parameters_file.write(json.dumps(dict(run=RUN,
+                                          parameters=SET_OF_PARAMETERS[0])))
+    argv = ['sweep', '--no-cluster', '--parameters-file',
+            str(parameters_file), '--seed', str(SEED)]
+    run_analysis.main(argv)
+    filename = str(reruns.join('quality_11_0'))
+    expected, _ = load_results(filename)
+    expected = np.array(expected)
+
+    # Interrupted while writing the third replication, before saving
+    # its results
+    with open(filename + '.log') as f:
+        lines = f.readlines()
+    with open(filename + '.log', 'w') as f:
+        f.writelines(lines[:3] + [lines[3][:20]])
+    os.remove(filename + '.npy')
+    os.remove(filename + '.meta')
+
+    run = []
+    run_task = parallel.run_task
+    monkeypatch.setattr(parallel, 'run_task',
+                        lambda task, *args, **kwargs: run.append(task) or
+                        run_task(task, *args, **kwargs))
+    run_analysis.main(argv + ['--resume'])
+
+    # The same re-run is resumed, running only the missing replications
+    assert sorted(osp.basename(f) for f in glob.glob(str(reruns.join('*')))) \
+        == ['quality_11_0.' + ext for ext in ['log', 'meta', 'npy',
+                                              'progress']]
+    assert len(run) == 2 * RUN['number_of_times'] - 2
+    results, _ = load_results(filename)
+    np.testing.assert_array_equal(results, expected)
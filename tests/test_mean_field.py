@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the mean-field approximation of the algorithm"""
+
+from __future__ import division
+
+import numpy as np
+import pytest
+
+from algorithm import single_run
+from all_parameters import parameters as default_parameters
+from mean_field import mean_field_run, mean_field_uncertainty
+from storage import panel_to_array
+
+
+GRAPH_TYPES = ['small_world', 'preferential_attachment', 'powerlaw_cluster',
+               'erdos_renyi']
+
+MAX_TIME = 15
+REPLICATIONS = 20
+
+
+@pytest.mark.parametrize('graph_type', GRAPH_TYPES)
+def test_mean_field_agrees_with_simulations(graph_type):
+    parameters = dict(default_parameters, graph_type=graph_type,
+                      number_of_consumers=500, initial_seed=0.01)
+    simulations = np.array([panel_to_array(single_run(parameters, MAX_TIME,
+                                                      seed))
+                            for seed in range(REPLICATIONS)])
+    approximation = panel_to_array(mean_field_run(parameters, MAX_TIME))
+    uncertainty = mean_field_uncertainty(parameters, MAX_TIME)
+
+    # Final adopters with and without reflexivity
+    final = simulations[:, :, :, 0].sum(axis=2)
+    mean = final.mean(axis=0)
+    error = final.std(axis=0) / np.sqrt(REPLICATIONS)
+    expected = approximation[:, :, 0].sum(axis=1)
+    assert expected[1] == pytest.approx(uncertainty['final_adopters'])
+
+    if uncertainty['reliable']:
+        assert np.all(np.abs(expected - mean) <= 0.1 * mean)
+    else:
+        # The approximation must be within the spread of the simulations,
+        # which must be in the range given by the uncertainty
+        assert np.all(np.abs(expected - mean) <= 2 * final.std(axis=0))
+        assert (uncertainty['low'] - 3 * error[1] <= mean[1] <=
+                uncertainty['high'] + 3 * error[1])
+
+
+def test_small_world_with_few_seeds_is_not_reliable():
+    parameters = dict(default_parameters, graph_type='small_world')
+    assert not mean_field_uncertainty(parameters, 20)['reliable']
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the observers of additional metrics"""
+
+from __future__ import division
+
+import os.path as osp
+
+import numpy as np
+import pytest
+
+from aggregates import compute_aggregates
+from algorithm import single_run
+from all_parameters import parameters as default_parameters
+from observers import FINAL, new_observer, observed_variables
+from storage import (load_results, panel_to_array, run_variables,
+                     save_results)
+from utilities import VARIABLES
+
+
+MAX_TIME = 10
+PARAMETERS = dict(default_parameters, number_of_consumers=50)
+
+
+def counting_observer(name, every):
+    """Observer that counts the ticks where it's sampled."""
+    calls = []
+
+    def func(state, parameters):
+        calls.append(state)
+        return len(calls)
+
+    return new_observer(name, func, every=every), calls
+
+
+@pytest.mark.parametrize('every', [0, -3, 1.5, True, 'last'])
+def test_invalid_sampling_interval(every):
+    with pytest.raises(ValueError):
+        new_observer('homophily', every=every)
+
+
+def test_unknown_metric():
+    with pytest.raises(ValueError):
+        new_observer('unknown')
+
+
+@pytest.mark.parametrize('every, ticks', [(3, [3, 6, 9]), (FINAL, [10]),
+                                          (1, list(range(1, 11)))])
+def test_observers_are_only_computed_when_sampled(every, ticks):
+    observer, calls = counting_observer('count', every)
+    panel = single_run(PARAMETERS, MAX_TIME, seed=0, observers=[observer])
+
+    # Once per sampled tick, with and without reflexivity
+    assert len(calls) == 2 * len(ticks)
+    # Nothing is computed for an observer that doesn't need any state
+    assert all(state == {} for state in calls)
+
+    for rx_field in ['no_rx', 'rx']:
+        values = np.array(panel[rx_field]['count'], dtype=float)
+        sampled = np.flatnonzero(~np.isnan(values)) + 1
+        assert sampled.tolist() == ticks
+
+
+def test_observers_are_skipped_before_their_first_sample():
+    observer, calls = counting_observer('count', MAX_TIME + 1)
+    panel = single_run(PARAMETERS, MAX_TIME, seed=0, observers=[observer])
+    assert calls == []
+
+    # Observers that were never sampled are saved as NaN
+    values = panel_to_array(panel, VARIABLES + ['count'])
+    assert np.all(np.isnan(values[:, :, -1]))
+
+
+def test_observed_variables():
+    assert observed_variables(None) == []
+    assert observed_variables({'largest_cluster': FINAL,
+                               'homophily': 2}) == ['homophily',
+                                                    'largest_cluster']
+    with pytest.raises(ValueError):
+        observed_variables({'cluster_sizes': FINAL})
+    with pytest.raises(ValueError):
+        observed_variables({'homophily': 0})
+
+
+def test_observers_are_saved_with_the_results(tmpdir):
+    run = dict(main_parameter='critical_mass', number_of_times=3,
+               max_time=MAX_TIME, observers={'homophily': 4})
+    variables = run_variables(run)
+    assert variables == VARIABLES + ['homophily']
+
+    from parallel import make_tasks, run_task
+    tasks = make_tasks([PARAMETERS], run['number_of_times'], MAX_TIME,
+                       observers=run['observers'])
+    data = [[run_task(task)['panel'] for task in tasks]]
+    filename = osp.join(str(tmpdir), 'observed')
+    save_results(filename, data, [PARAMETERS], run)
+
+    results, metadata = load_results(filename)
+    assert metadata['variables'] == variables
+    assert results.shape[-1] == len(variables)
+    homophily = results[0, :, 1, :, -1]
+    assert not np.any(np.isnan(homophily[:, [3, 7]]))
+    assert np.all(np.isnan(np.delete(homophily, [3, 7], axis=1)))
+
+    # Aggregates of the observer, only at the ticks where it was sampled
+    aggregates = compute_aggregates(results[0], PARAMETERS,
+                                    variables=variables)
+    series = aggregates['series']['rx']['homophily']
+    assert np.allclose(series['mean'][[3, 7]], homophily[:, [3, 7]].mean(0))
+    assert np.all(np.isnan(np.delete(series['mean'], [3, 7])))
+    assert 'homophily' not in aggregates['cumulative']['rx']
+
+    # The observer is ignored if its variables are not given
+    aggregates = compute_aggregates(results[0], PARAMETERS)
+    assert 'homophily' not in aggregates['series']['rx']
+
+
+def test_observers_in_local_workers():
+    from parallel import (make_tasks, replication_seeds, run_task,
+                          start_local_workers, stop_local_workers,
+                          stream_local_tasks)
+
+    observers = {'homophily': 4}
+    variables = run_variables(dict(observers=observers))
+    seeds = replication_seeds(0, 1, 2)
+    workers = start_local_workers([PARAMETERS], 2, MAX_TIME, 1, variables)
+    try:
+        tasks = make_tasks([PARAMETERS], 2, MAX_TIME, seeds,
+                           observers=observers, shared=workers['shared'])
+        results = dict((r['index'], np.array(r['values']))
+                       for r in stream_local_tasks(tasks, workers))
+    finally:
+        stop_local_workers(workers, terminate=True)
+
+    # Workers save the variables they were started with
+    for task in make_tasks([PARAMETERS], 2, MAX_TIME, seeds,
+                           observers=observers):
+        expected = panel_to_array(run_task(task)['panel'], variables)
+        np.testing.assert_array_equal(results[task['index']], expected)
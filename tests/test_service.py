@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the local service that runs sweeps"""
+
+import json
+import os.path as osp
+import threading
+
+import numpy as np
+import pytest
+
+try:
+    from urllib2 import HTTPError
+except ImportError:
+    from urllib.error import HTTPError
+
+import service
+from algorithm import new_graph_pool, single_run
+from all_parameters import parameters as default_parameters
+from storage import panel_to_array
+
+
+PARAMETERS = dict(default_parameters, number_of_consumers=50)
+RUN = dict(main_parameter='social_influence', parameter_values=[0.3, 0.6],
+           number_of_times=2, max_time=5)
+
+
+def new_queue():
+    """State of a service without workers, to test its queue."""
+    return dict(jobs={}, queue=[], counter=iter(range(1000)),
+                condition=threading.Condition(), running=True,
+                started='test', token='secret')
+
+
+def submit(queue, priority, **spec):
+    return service.submit_job(queue, dict(spec, run=RUN,
+                                          parameters=PARAMETERS,
+                                          priority=priority))
+
+
+def test_jobs_are_run_in_order_of_priority_and_submission():
+    queue = new_queue()
+    handles = [submit(queue, priority) for priority in [0, 5, 0, 5, -1]]
+    assert all(h['status'] == service.QUEUED for h in handles)
+    assert handles[0]['total'] == 4
+
+    order = [service.next_job(queue)['id'] for h in handles]
+    assert order == [handles[i]['id'] for i in [1, 3, 0, 2, 4]]
+    assert all(queue['jobs'][i]['status'] == service.RUNNING for i in order)
+
+
+def test_next_job_returns_none_when_stopped():
+    queue = new_queue()
+    submit(queue, 0)
+    queue['running'] = False
+    assert service.next_job(queue) is None
+
+
+def test_jobs_with_a_seed_keep_it():
+    queue = new_queue()
+    assert submit(queue, 0, seed=12)['seed'] == 12
+    assert submit(queue, 0)['seed'] is not None
+
+
+def test_jobs_with_observers():
+    queue = new_queue()
+    handle = submit(queue, 0, observers={'homophily': 2})
+    job = queue['jobs'][handle['id']]
+    assert job['spec']['run']['observers'] == {'homophily': 2}
+    with pytest.raises(ValueError):
+        submit(queue, 0, observers={'homophily': 0})
+
+
+def test_shutdown_needs_the_token(monkeypatch):
+    queue = new_queue()
+    server = service.ThreadingHTTPServer((service.HOST, 0),
+                                         service.make_handler(queue))
+    port = server.server_address[1]
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        assert service.request('jobs', port=port) == []
+        with pytest.raises(HTTPError) as error:
+            service.request('shutdown', {}, port)
+        assert error.value.code == 403
+        with pytest.raises(HTTPError):
+            service.request('shutdown', {}, port,
+                            {'X-Service-Token': 'wrong'})
+
+        response = service.request('shutdown', {}, port,
+                                   {'X-Service-Token': 'secret'})
+        assert response == dict(status='stopping')
+        thread.join(5)
+        assert not thread.is_alive()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_save_token(tmpdir, monkeypatch):
+    monkeypatch.setattr(service, 'TOKEN_FILE',
+                        str(tmpdir.join('service-{port}.token')))
+    filename = service.save_token('secret', 1234)
+    assert filename == str(tmpdir.join('service-1234.token'))
+    assert open(filename).read() == 'secret'
+    assert oct(tmpdir.join('service-1234.token').stat().mode & 0o777) == \
+        oct(0o600)
+
+
+def test_graph_pool_is_shared_by_seeds_and_parameters():
+    graph_pool = new_graph_pool(pool_size=4)
+
+    # Reproducible with the same seed
+    first = panel_to_array(single_run(PARAMETERS, 5, 6,
+                                      graph_pool=graph_pool))
+    second = panel_to_array(single_run(PARAMETERS, 5, 6,
+                                       graph_pool=graph_pool))
+    assert np.array_equal(first, second)
+
+    # Only pool_size graphs for any number of seeds and values of
+    # parameters that don't change the graphs
+    for seed in range(10):
+        for social_influence in [0.3, 0.6]:
+            single_run(dict(PARAMETERS, social_influence=social_influence),
+                       5, seed, graph_pool=graph_pool)
+    assert len(graph_pool['pools']) == 1
+    pool = list(graph_pool['pools'].values())[0]
+    assert sorted(pool) == [0, 1, 2, 3]
+
+    # A pool for each set of graph parameters
+    single_run(dict(PARAMETERS, randomness=0.5), 5, 0,
+               graph_pool=graph_pool)
+    assert len(graph_pool['pools']) == 2
+
+    with pytest.raises(ValueError):
+        new_graph_pool(pool_size=0)
+
+
+def test_run_job(tmpdir, monkeypatch):
+    import catalog
+
+    registered = []
+    monkeypatch.setattr(service, 'SERVICE_DIR', str(tmpdir))
+    monkeypatch.setattr(catalog, 'register_results', registered.append)
+
+    queue = new_queue()
+    queue['pool'] = service.multiprocessing.Pool(
+        1, initializer=service._init_worker, initargs=(4,))
+    try:
+        submit(queue, 0, seed=3, name='job')
+        job = service.next_job(queue)
+        job['results'] = str(tmpdir.join('job'))
+        service.run_job(queue, job)
+    finally:
+        queue['pool'].terminate()
+
+    assert job['done'] == job['total'] == 4
+    assert registered == [job['results']]
+    with open(job['results'] + '.json') as f:
+        assert json.load(f)['run'] == RUN
+
+
+@pytest.mark.parametrize('name', ['../../x', '/tmp/x', 'a/b', '..', 'a..b',
+                                  'a\\b', '', 1])
+def test_jobs_with_invalid_names(name):
+    queue = new_queue()
+    with pytest.raises((TypeError, ValueError)):
+        submit(queue, 0, name=name)
+    assert queue['jobs'] == {}
+
+
+def test_jobs_with_valid_names():
+    queue = new_queue()
+    for name in ['job', 'quality_11.v2', 'social-influence']:
+        handle = submit(queue, 0, name=name)
+        job = queue['jobs'][handle['id']]
+        assert job['results'] == osp.join(service.SERVICE_DIR, name)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for sweeps run in shards"""
+
+import os.path as osp
+
+import numpy as np
+import pytest
+
+from all_parameters import parameters as default_parameters
+from parallel import make_tasks, replication_seeds, run_task
+from sharding import merge_shards, run_shard, shard_replications
+from storage import load_results, save_results
+
+
+SEED = 7
+RUN = dict(main_parameter='critical_mass', parameter_values=[0.3, 0.6],
+           number_of_times=5, max_time=5, observers={'homophily': 2})
+SET_OF_PARAMETERS = [dict(default_parameters, number_of_consumers=50,
+                          critical_mass=value)
+                     for value in RUN['parameter_values']]
+
+
+def single_sweep(filename):
+    """Save the results of RUN computed in a single process."""
+    n_values = len(SET_OF_PARAMETERS)
+    seeds = replication_seeds(SEED, n_values, RUN['number_of_times'])
+    data = [[None] * RUN['number_of_times'] for p in SET_OF_PARAMETERS]
+    for task in make_tasks(SET_OF_PARAMETERS, RUN['number_of_times'],
+                           RUN['max_time'], seeds,
+                           observers=RUN['observers']):
+        result = run_task(task)
+        value, replication = result['index']
+        data[value][replication] = result['panel']
+    save_results(filename, data, SET_OF_PARAMETERS, RUN,
+                 metadata=dict(seed=SEED))
+
+
+def test_shard_replications():
+    assert shard_replications(5, 0, 2) == [0, 2, 4]
+    assert shard_replications(5, 1, 2) == [1, 3]
+    assert shard_replications(2, 2, 3) == []
+
+
+def test_sharded_sweep_equals_single_sweep(tmpdir):
+    single = str(tmpdir.join('single'))
+    single_sweep(single)
+
+    sharded = str(tmpdir.join('sharded'))
+    for shard in range(3):
+        run_shard(sharded, RUN, SET_OF_PARAMETERS, SEED, shard, 3,
+                  quiet=True)
+    merge_shards(sharded)
+
+    expected, expected_metadata = load_results(single)
+    results, metadata = load_results(sharded)
+    np.testing.assert_array_equal(results, expected)
+    for key in ['run', 'set_of_parameters', 'seed', 'variables']:
+        assert metadata[key] == expected_metadata[key]
+
+
+def test_merge_needs_all_shards(tmpdir):
+    filename = str(tmpdir.join('sharded'))
+    with pytest.raises(Exception):
+        merge_shards(filename)
+
+    run_shard(filename, RUN, SET_OF_PARAMETERS, SEED, 0, 2, quiet=True)
+    with pytest.raises(Exception):
+        merge_shards(filename)
+    assert not osp.isfile(filename + '.npy')
+
+    # Shards of a different sweep
+    run_shard(filename, RUN, SET_OF_PARAMETERS, SEED + 1, 1, 2, quiet=True)
+    with pytest.raises(Exception):
+        merge_shards(filename)
+
+
+def test_shards_without_replications(tmpdir):
+    with pytest.raises(Exception):
+        run_shard(str(tmpdir.join('sharded')), RUN, SET_OF_PARAMETERS, SEED,
+                  5, 6, quiet=True)
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the binary storage of the results of sweeps"""
+
+import json
+
+import numpy as np
+import pytest
+
+from algorithm import single_run
+from all_parameters import parameters as default_parameters
+from storage import (create_results, data_to_array, load_results,
+                     panel_to_array, save_results)
+from utilities import RX_FIELDS, VARIABLES
+
+
+RUN = dict(main_parameter='critical_mass', parameter_values=[0.3, 0.6],
+           number_of_times=2, max_time=5)
+SET_OF_PARAMETERS = [dict(default_parameters, number_of_consumers=50,
+                          critical_mass=value)
+                     for value in RUN['parameter_values']]
+
+
+def sweep_data():
+    return [[single_run(p, RUN['max_time'], seed)
+             for seed in range(RUN['number_of_times'])]
+            for p in SET_OF_PARAMETERS]
+
+
+def test_save_and_load_results(tmpdir):
+    filename = str(tmpdir.join('sweep'))
+    data = sweep_data()
+    save_results(filename, data, SET_OF_PARAMETERS, RUN,
+                 metadata=dict(seed=3))
+
+    results, metadata = load_results(filename)
+    assert isinstance(results, np.memmap)
+    assert results.shape == (2, RUN['number_of_times'], len(RX_FIELDS),
+                             RUN['max_time'], len(VARIABLES))
+    for i, d in enumerate(data):
+        assert np.array_equal(results[i], data_to_array(d))
+        for replication, panel in enumerate(d):
+            for j, rx_field in enumerate(RX_FIELDS):
+                for k, variable in enumerate(VARIABLES):
+                    assert np.array_equal(results[i, replication, j, :, k],
+                                          panel[rx_field][variable])
+
+    assert metadata['run'] == RUN
+    # Time delays are saved as lists instead of tuples
+    assert metadata['set_of_parameters'] == json.loads(
+        json.dumps(SET_OF_PARAMETERS))
+    assert metadata['variables'] == VARIABLES
+    assert metadata['rx_fields'] == RX_FIELDS
+    assert metadata['seed'] == 3
+
+    # Results loaded in memory
+    in_memory, _ = load_results(filename, mmap_mode=None)
+    assert not isinstance(in_memory, np.memmap)
+    assert np.array_equal(in_memory, results)
+
+
+def test_arrays_of_results_are_not_converted_again():
+    values = data_to_array(sweep_data()[0])
+    assert data_to_array(values) is values
+
+
+def test_missing_variables_are_nan():
+    panel = single_run(SET_OF_PARAMETERS[0], RUN['max_time'], 0)
+    values = panel_to_array(panel, VARIABLES + ['homophily'])
+    assert np.array_equal(values[:, :, :-1], panel_to_array(panel))
+    assert np.all(np.isnan(values[:, :, -1]))
+
+
+def test_results_with_other_variables(tmpdir):
+    filename = str(tmpdir.join('sweep'))
+    create_results(filename, (1, 1, 2, 5, 2), SET_OF_PARAMETERS[:1], RUN,
+                   metadata=dict(variables=['adopters', 'other']))
+    with pytest.raises(Exception):
+        load_results(filename)
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the emulator of summary outputs of the algorithm"""
+
+from __future__ import division
+
+import os.path as osp
+
+import pytest
+
+from algorithm import compute_run
+from all_parameters import parameters as default_parameters
+from catalog import register_results
+from storage import save_results
+from surrogate import (OUTPUTS, add_saved_results, load_observations,
+                       new_observations, reorder_observations)
+
+
+MAX_TIME = 5
+REPLICATIONS = 3
+
+
+def small_sweep(tmpdir, values):
+    """Save a small sweep of critical_mass and return its file name."""
+    set_of_parameters = [dict(default_parameters, number_of_consumers=50,
+                              critical_mass=value) for value in values]
+    data = [compute_run(REPLICATIONS, p, MAX_TIME) for p in set_of_parameters]
+    run = dict(main_parameter='critical_mass', number_of_times=REPLICATIONS,
+               max_time=MAX_TIME)
+    filename = osp.join(str(tmpdir), 'sweep')
+    save_results(filename, data, set_of_parameters, run)
+    return filename
+
+
+def test_reorder_observations():
+    observations = dict(names=['b', 'a'], X=[[1, 2], [3, 4]],
+                        Y=dict((output, [5, 6]) for output in OUTPUTS))
+    reordered = reorder_observations(observations, ['a', 'b'])
+    assert reordered['names'] == ['a', 'b']
+    assert reordered['X'] == [[2, 1], [4, 3]]
+    assert reordered['Y'] == observations['Y']
+
+
+def test_reorder_observations_with_other_parameters():
+    observations = new_observations(['a', 'b'])
+    with pytest.raises(Exception):
+        reorder_observations(observations, ['a', 'c'])
+
+
+def test_load_observations(tmpdir):
+    filename = small_sweep(tmpdir, [0.3, 0.6])
+    catalog_file = osp.join(str(tmpdir), 'catalog.sqlite')
+    register_results(filename, catalog_file)
+
+    names = ['critical_mass', 'randomness']
+    observations = load_observations(names, catalog_file,
+                                     number_of_consumers=50)
+    assert observations['names'] == names
+    assert sorted(x[0] for x in observations['X']) == [0.3, 0.6]
+    assert all(len(observations['Y'][output]) == 2 for output in OUTPUTS)
+
+    # The same observations from the saved results
+    saved = add_saved_results(new_observations(names), filename)
+    assert sorted(saved['X']) == sorted(observations['X'])
+
+    # No results with other parameters
+    assert load_observations(names, catalog_file,
+                             number_of_consumers=60)['X'] == []
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+"""Tests for the validation of engines against the reference one"""
+
+import numpy as np
+
+from validation import (ENGINES, compare_approximation, register_engine,
+                        reference_engine, validate)
+
+
+def test_engines_pass_the_validation():
+    report = validate(['cached', 'instrumented', 'mean_field'],
+                      graph_types=['preferential_attachment'],
+                      number_of_consumers=100, max_time=10,
+                      exact_replications=2, replications=30)
+    assert report['passed']
+    for configuration in report['engines']['cached'].values():
+        assert configuration['exact']
+
+
+def test_different_engine_fails_the_validation():
+    def shifted_engine(parameters, max_time, seed):
+        values = reference_engine(parameters, max_time, seed)
+        values[:, :, 0] += 1
+        return values
+
+    register_engine('shifted', shifted_engine)
+    try:
+        report = validate(['shifted'], graph_types=['erdos_renyi'],
+                          number_of_consumers=100, max_time=10,
+                          exact_replications=0, replications=30)
+    finally:
+        ENGINES.pop('shifted')
+    assert not report['passed']
+
+
+def test_compare_approximation():
+    reference = np.zeros((4, 2, 3, 6))
+    reference[:, :, :, 0] = np.array([1, 2, 3, 4])[:, None, None]
+    results = reference.mean(axis=0, keepdims=True)
+    assert compare_approximation(reference, results) == (0.0, [])
+
+    results[:, 1, :, 0] += 10
+    max_deviation, failures = compare_approximation(reference, results)
+    assert max_deviation > 3
+    assert len(failures) == 1
@@ -13,9 +13,20 @@ import random
 import networkx as nx
 import numpy as np
 
+from instrumentation import count
+
 
 LOCATION = osp.dirname(osp.abspath(__file__))
 
+# Variables collected by evolution_step, in the order they are stored
+# in arrays of results (see storage.py)
+VARIABLES = ['adopters', 'adopters_by_utility', 'adopters_by_marketing',
+             'adopters_by_local_or_global', 'adopters_by_local',
+             'global_utility']
+
+# Runs without and with reflexivity computed by single_run
+RX_FIELDS = ['no_rx', 'rx']
+
 
 def get_neighbors(graph, node, level):
     """Get neighbors of a given node up to a certain level"""
@@ -84,7 +95,7 @@ def homophily_index(graph):
     return len(cross_gender_edges) / len(graph.edges())
 
 
-def compute_global_utility(graph):
+def compute_global_utility(graph, counters=None):
     """
     Return an index that quantifies how big the size of adopter
     clusters is in the entire population of consumers. We call this
@@ -94,12 +105,18 @@ def compute_global_utility(graph):
     clusters divided by the total number of consumers
 
     So it goes from 0 to 1 and it's always increasing.
+
+    counters: Counters to add the number of clusters found to (see
+              instrumentation.py).
     """
     N = len(graph.nodes())
     adopters = get_adopters(graph)
     
     clusters = nx.subgraph(graph, adopters)
     cluster_sizes = [len(c) for c in nx.connected_components(clusters) if len(c) > 1]
+    if counters is not None:
+        count(counters, 'global_utility_computations')
+        count(counters, 'components', len(cluster_sizes))
     if cluster_sizes:
         # The weight of each cluster depends on its size
         weights = np.array(cluster_sizes) / N
@@ -119,11 +136,18 @@ def logistic(x, k, x0):
     
     See https://en.wikipedia.org/wiki/Logistic_function for
     its parameters
+
+    x can be a number or an array, e.g. with the global utility of
+    several replications.
     """
-    if x == 0:
-        return 0
+    if np.isscalar(x):
+        if x == 0:
+            return 0
+        else:
+            return 1 / ( 1 + np.exp(-k * (x - x0)) )
     else:
-        return 1 / ( 1 + np.exp(-k * (x - x0)) )
+        x = np.asarray(x, dtype=np.float64)
+        return np.where(x == 0, 0., 1 / (1 + np.exp(-k * (x - x0))))
 
 
 def step(x, k, x0):
@@ -134,7 +158,11 @@ def step(x, k, x0):
     
     k is not needed but it's added here to have the same interface as
     the logistic function above
+
+    x can be a number or an array.
     """
+    if not np.isscalar(x):
+        x = np.asarray(x)
     return 1. * (x > x0)
 
 
@@ -154,7 +182,18 @@ def set_seed(graph, parameters, reset=False):
         node['adopter'] = 1
 
 
-def compute_global_utility_activation_value(parameters):
+def set_random_state(seed):
+    """Seed the random number generators used by the algorithm"""
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+# Activation values already computed for each (activation_sharpness,
+# critical_mass, test)
+_activation_values = {}
+
+
+def compute_global_utility_activation_value(parameters, test=False):
     """
     Compute the first value of global utility that makes the
     reflexivity index greater than zero.
@@ -162,14 +201,44 @@ def compute_global_utility_activation_value(parameters):
     This is the point at which reflexivity starts to be relevant
     in the difussion process (but very slightly at the beginning
     though)
+
+    It's the first value in a grid of resolution 1e-5 for which the
+    logistic function is greater than 1e-5 and global utility is greater
+    than 0.01, which is obtained by inverting the logistic function.
+
+    test: Use the step function instead of the logistic one. In that
+          case the activation value is the critical mass.
     """
-    step = 1e-5
-    for global_utility in np.arange(0, parameters['critical_mass'], step):
-        emergence_factor = logistic(global_utility,
-                                    parameters['activation_sharpness'],
-                                    parameters['critical_mass'])
-        if emergence_factor > step and global_utility > 0.01:
-            return global_utility
+    key = (parameters['activation_sharpness'], parameters['critical_mass'],
+           test)
+    if key in _activation_values:
+        return _activation_values[key]
+
+    resolution = 1e-5
+    k = parameters['activation_sharpness']
+    x0 = parameters['critical_mass']
+
+    if test:
+        activation_value = x0
+    else:
+        # Value at which the logistic function is equal to resolution
+        threshold = x0 - np.log(1 / resolution - 1) / k
+
+        # First value of the grid above it and 0.01
+        index = int(np.floor(max(threshold, 0.01) / resolution)) + 1
+        for i in [index - 1, index, index + 1]:
+            global_utility = i * resolution
+            if (logistic(global_utility, k, x0) > resolution and
+                    global_utility > 0.01):
+                break
+
+        if global_utility < x0:
+            activation_value = global_utility
+        else:
+            activation_value = None
+
+    _activation_values[key] = activation_value
+    return activation_value
 
 
 def load_parameters_from_file(param_file):
@@ -184,7 +253,8 @@ def get_values_from_compute_run(data, with_reflexivity, variable):
     Get all values for a particular variable in data.
 
     data: A list of Pandas panels, which must be the result of
-          compute_run.
+          compute_run, or an array of shape (replications, 2, time,
+          variables) with the same data (see storage.py).
     with_reflexivity: True or False, depending if we want
                       to get the values with or without
                       reflexivity.
@@ -192,14 +262,21 @@ def get_values_from_compute_run(data, with_reflexivity, variable):
               from. Possible variables are defined in
               evolution_step.
 
-    Returns: A list of lists containing the values we want
-             to get from compute_run.
+    Returns: A list of lists (or a 2D array, if data is an array)
+             containing the values we want to get from compute_run.
     """
     if with_reflexivity:
         rx_field = 'rx'
     else:
         rx_field = 'no_rx'
 
+    if isinstance(data, np.ndarray):
+        if variable not in VARIABLES:
+            print("Variable %s is not part of the collected data" % variable)
+            return
+        return data[:, RX_FIELDS.index(rx_field), :,
+                    VARIABLES.index(variable)]
+
     try:
         values = [list(d[rx_field][variable]) for d in data]
         return values
@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+
+"""
+Check that other engines of the algorithm reproduce the reference one
+
+The reference engine is single_run, which uses networkx. Other engines
+are registered in ENGINES with a function that runs a replication with a
+seed and returns its results as an array of shape (2, time, variables)
+(see storage.py), whether they are expected to give exactly the same
+results as the reference engine with the same seed, and whether they are
+deterministic approximations that don't depend on the seed.
+
+Engines are checked with all graph types, with and without time delays:
+
+* Exact engines must return the same values at every tick, for every
+  variable, as the reference engine with the same seeds.
+* All other engines must give the same distribution of results as the
+  reference one. Large ensembles of replications with independent seeds
+  are compared with two-sample Kolmogorov-Smirnov tests at each tick for
+  each variable (adopters, adopters by type and global utility), with a
+  Bonferroni correction for the number of tests.
+* Deterministic approximations (e.g. the mean-field one) can't give
+  the same distribution, so the totals of their adopters and global
+  utility must be within a few standard deviations of the mean of the
+  reference ensemble instead.
+
+Usage:
+    python validation.py
+    python validation.py --engines cached --replications 500
+"""
+
+from __future__ import division
+
+import argparse
+from collections import OrderedDict
+from itertools import product
+import json
+import sys
+
+import numpy as np
+
+from algorithm import single_run
+from benchmarks import GRAPH_TYPES, benchmark_parameters
+from instrumentation import new_counters
+from mean_field import mean_field_run
+from parallel import replication_seeds
+from storage import panel_to_array
+from utilities import RX_FIELDS, VARIABLES
+
+
+#==============================================================================
+# Engines
+#==============================================================================
+def reference_engine(parameters, max_time, seed):
+    """Reference engine of the algorithm."""
+    return panel_to_array(single_run(parameters, max_time, seed))
+
+
+def cached_engine(parameters, max_time, seed):
+    """
+    Engine that reuses initial conditions generated with a seed.
+
+    Each seed is run twice with the same cache, so its results are the
+    ones of a run that reuses the initial conditions of the first one.
+    """
+    graph_cache = OrderedDict()
+    single_run(parameters, max_time, seed, graph_cache=graph_cache)
+    return panel_to_array(single_run(parameters, max_time, seed,
+                                     graph_cache=graph_cache))
+
+
+def instrumented_engine(parameters, max_time, seed):
+    """Engine that collects counters of each phase of the algorithm."""
+    return panel_to_array(single_run(parameters, max_time, seed,
+                                     counters=new_counters()))
+
+
+def mean_field_engine(parameters, max_time, seed):
+    """Mean-field approximation of the algorithm (see mean_field.py)."""
+    return panel_to_array(mean_field_run(parameters, max_time))
+
+
+# Engines by name, with their function, whether they must give the same
+# results as the reference engine with the same seed and whether they
+# don't depend on the seed
+ENGINES = OrderedDict([
+    ('reference', dict(func=reference_engine, exact=True,
+                       deterministic=False)),
+    ('cached', dict(func=cached_engine, exact=True, deterministic=False)),
+    ('instrumented', dict(func=instrumented_engine, exact=True,
+                          deterministic=False)),
+    ('mean_field', dict(func=mean_field_engine, exact=False,
+                        deterministic=True)),
+])
+
+# Variables whose totals are compared for deterministic approximations
+APPROXIMATE_VARIABLES = ['adopters', 'global_utility']
+
+
+def register_engine(name, func, exact=False, deterministic=False):
+    """
+    Register an engine to validate.
+
+    func: Function that receives the parameters, max_time and a seed, and
+          returns an array of shape (2, time, variables).
+    exact: Whether it must give exactly the same results as the
+           reference engine with the same seed.
+    deterministic: Whether it's an approximation that gives the same
+                   results with any seed (see compare_approximation).
+    """
+    ENGINES[name] = dict(func=func, exact=exact, deterministic=deterministic)
+
+
+def run_engine(name, parameters, max_time, seeds):
+    """
+    Run replications with an engine.
+
+    Returns: An array of shape (replications, 2, time, variables).
+    """
+    func = ENGINES[name]['func']
+    return np.array([func(parameters, max_time, int(seed))
+                     for seed in seeds], dtype=np.float64)
+
+
+#==============================================================================
+# Tests
+#==============================================================================
+def ks_statistic(x, y):
+    """Two-sample Kolmogorov-Smirnov statistic."""
+    x = np.sort(x)
+    y = np.sort(y)
+    values = np.concatenate([x, y])
+    cdf_x = np.searchsorted(x, values, side='right') / len(x)
+    cdf_y = np.searchsorted(y, values, side='right') / len(y)
+    return np.max(np.abs(cdf_x - cdf_y))
+
+
+def ks_pvalue(statistic, n, m):
+    """
+    Asymptotic p-value of the two-sample Kolmogorov-Smirnov test.
+
+    It's conservative for discrete data, like the number of adopters.
+    """
+    en = np.sqrt(n * m / (n + m))
+    lam = (en + 0.12 + 0.11 / en) * statistic
+    if lam < 1e-3:
+        return 1.0
+    k = np.arange(1, 101)
+    terms = 2 * (-1) ** (k - 1) * np.exp(-2 * k**2 * lam**2)
+    return float(min(1, max(0, np.sum(terms))))
+
+
+def compare_exactly(reference, results):
+    """
+    Compare the results of two engines with the same seeds.
+
+    Returns: A list with a description of the first difference of each
+             replication that is different.
+    """
+    differences = []
+    for replication in range(len(reference)):
+        different = np.argwhere(reference[replication] !=
+                                results[replication])
+        if len(different):
+            i, t, j = different[0]
+            differences.append(
+                'replication {}, {}, tick {}, {}: {} != {}'.format(
+                replication, RX_FIELDS[i], t, VARIABLES[j],
+                reference[replication, i, t, j],
+                results[replication, i, t, j]))
+    return differences
+
+
+def compare_ensembles(reference, results, alpha=0.01):
+    """
+    Compare the distributions of the results of two engines at each tick
+    for each variable.
+
+    alpha: Significance level for all tests together.
+
+    Returns: The minimum p-value, the number of tests and a list with a
+             description of the tests that are significant after a
+             Bonferroni correction.
+    """
+    n_tests = reference.shape[1] * reference.shape[2] * reference.shape[3]
+    threshold = alpha / n_tests
+
+    min_pvalue = 1.0
+    failures = []
+    for i, t, j in product(range(reference.shape[1]),
+                           range(reference.shape[2]),
+                           range(reference.shape[3])):
+        x = reference[:, i, t, j]
+        y = results[:, i, t, j]
+        pvalue = ks_pvalue(ks_statistic(x, y), len(x), len(y))
+        min_pvalue = min(min_pvalue, pvalue)
+        if pvalue < threshold:
+            failures.append('{}, tick {}, {}: p = {:.2g} (means {:g} and '
+                            '{:g})'.format(RX_FIELDS[i], t, VARIABLES[j],
+                                           pvalue, x.mean(), y.mean()))
+    return min_pvalue, n_tests, failures
+
+
+def compare_approximation(reference, results, max_deviations=3):
+    """
+    Compare the results of a deterministic approximation with an
+    ensemble of the reference engine.
+
+    The totals over time of the variables in APPROXIMATE_VARIABLES (e.g.
+    the final number of adopters) must be within max_deviations standard
+    deviations of their mean in the reference ensemble.
+
+    Returns: The largest deviation, in standard deviations, and a list
+             with a description of the totals that are farther.
+    """
+    reference_totals = reference.sum(axis=2)
+    totals = results.sum(axis=2).mean(axis=0)
+    mean = reference_totals.mean(axis=0)
+    std = reference_totals.std(axis=0)
+
+    max_deviation = 0.0
+    failures = []
+    for i, rx_field in enumerate(RX_FIELDS):
+        for variable in APPROXIMATE_VARIABLES:
+            j = VARIABLES.index(variable)
+            difference = abs(totals[i, j] - mean[i, j])
+            if std[i, j] > 0:
+                deviation = difference / std[i, j]
+            else:
+                deviation = 0.0 if difference == 0 else np.inf
+            max_deviation = max(max_deviation, deviation)
+            if deviation > max_deviations:
+                failures.append('{}, total {}: {:g} ({:.2g} standard '
+                                'deviations from {:g})'.format(
+                                rx_field, variable, totals[i, j], deviation,
+                                mean[i, j]))
+    return max_deviation, failures
+
+
+def validate(engines, graph_types=GRAPH_TYPES, number_of_consumers=500,
+             max_time=40, exact_replications=3, replications=200, alpha=0.01,
+             seed=0):
+    """
+    Validate engines against the reference engine.
+
+    engines: Names of the engines to validate (see ENGINES).
+    graph_types: Graph types to validate them with.
+    number_of_consumers: Number of consumers of the graphs.
+    max_time: Time to stop the algorithm.
+    exact_replications: Number of replications to compare exactly.
+    replications: Number of replications of each ensemble.
+    alpha: Significance level of the tests of each ensemble.
+    seed: Seed to generate the seeds of all replications.
+
+    Returns: A dictionary with the results of each engine and
+             configuration, and whether all engines passed.
+    """
+    report = OrderedDict()
+    passed = True
+
+    for graph_type, use_time_delays in product(graph_types, [False, True]):
+        parameters = benchmark_parameters(number_of_consumers, 4, 1,
+                                          graph_type)
+        parameters['use_time_delays'] = use_time_delays
+        configuration = '{}[delays={}]'.format(graph_type,
+                                               int(use_time_delays))
+
+        # Seeds of the exact comparisons, and of the reference and other
+        # engines in the ensembles
+        seeds = replication_seeds(seed, 3, max(exact_replications,
+                                               replications))
+        exact_seeds = seeds[0, :exact_replications]
+
+        reference_exact = run_engine('reference', parameters, max_time,
+                                     exact_seeds)
+        reference_ensemble = run_engine('reference', parameters, max_time,
+                                        seeds[1, :replications])
+
+        for name in engines:
+            result = OrderedDict()
+            if ENGINES[name]['exact']:
+                results = run_engine(name, parameters, max_time, exact_seeds)
+                differences = compare_exactly(reference_exact, results)
+                result['exact'] = not differences
+                result['differences'] = differences
+
+            if ENGINES[name]['deterministic']:
+                results = run_engine(name, parameters, max_time,
+                                     seeds[2, :1])
+                max_deviation, failures = compare_approximation(
+                    reference_ensemble, results)
+                result['max_deviation'] = max_deviation
+                summary = 'max deviation = {:.3g} sd'.format(max_deviation)
+            else:
+                results = run_engine(name, parameters, max_time,
+                                     seeds[2, :replications])
+                min_pvalue, n_tests, failures = compare_ensembles(
+                    reference_ensemble, results, alpha)
+                result['min_pvalue'] = min_pvalue
+                result['tests'] = n_tests
+                summary = 'min p = {:.3g}'.format(min_pvalue)
+            result['failures'] = failures
+            result['passed'] = (result.get('exact', True) and
+                                not failures)
+            passed = passed and result['passed']
+
+            report.setdefault(name, OrderedDict())[configuration] = result
+            print('{:<15} {:<35} {:<6} {}{}'.format(
+                  name, configuration,
+                  'ok' if result['passed'] else 'FAIL', summary,
+                  '' if ENGINES[name]['exact'] is False else
+                  ', exact' if result['exact'] else ', NOT EXACT'))
+            for failure in result.get('differences', []) + failures:
+                print('    ' + failure)
+            sys.stdout.flush()
+
+    return dict(engines=report, passed=passed)
+
+
+def main(argv=None):
+    """Validate the engines given in the command line."""
+    names = [name for name in ENGINES if name != 'reference']
+    parser = argparse.ArgumentParser(
+        description='Check that other engines of the algorithm reproduce '
+                    'the reference one')
+    parser.add_argument('--engines', nargs='+', default=names,
+                        choices=names, help='Engines to validate')
+    parser.add_argument('--graph-types', nargs='+', default=GRAPH_TYPES,
+                        choices=GRAPH_TYPES, help='Graph types')
+    parser.add_argument('--number-of-consumers', type=int, default=500,
+                        help='Number of consumers')
+    parser.add_argument('--max-time', type=int, default=40,
+                        help='Time to stop the algorithm')
+    parser.add_argument('--exact-replications', type=int, default=3,
+                        help='Number of replications to compare exactly')
+    parser.add_argument('--replications', type=int, default=200,
+                        help='Number of replications of each ensemble')
+    parser.add_argument('--alpha', type=float, default=0.01,
+                        help='Significance level of the tests of each '
+                             'ensemble')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of all replications')
+    parser.add_argument('--output', help='Save results to this json file')
+    args = parser.parse_args(argv)
+
+    report = validate(args.engines, args.graph_types,
+                      args.number_of_consumers, args.max_time,
+                      args.exact_replications, args.replications,
+                      args.alpha, args.seed)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+
+    if not report['passed']:
+        print('Some engines are not equivalent to the reference one')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())